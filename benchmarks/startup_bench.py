@@ -0,0 +1,201 @@
+"""
+启动耗时基准
+
+每个场景都在全新的解释器进程里执行，测量模块导入耗时，
+并确认导入 db.utils 不会创建数据库 engine（engine 应在第一次访问数据库时才创建）。
+另外报告:
+- `python -X importtime` 下 superc.py 启动路径中各模块的导入耗时（最慢的若干个）
+- 从启动 superc.py --local 到发出第一个 HTTP 请求的耗时（请求在发出前被拦截，不访问网络）
+
+Usage:
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --repeat 10 --top 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (场景名, 计时的语句)
+SCENARIOS: List[Tuple[str, str]] = [
+    ("import db.models", "import db.models"),
+    ("import db.utils", "import db.utils"),
+    ("import superc.profile_loader", "import superc.profile_loader"),
+    ("import superc.runner", "import superc.runner"),
+    ("db.utils.get_engine()", "import db.utils; db.utils.get_engine()"),
+]
+
+_TIMER_TEMPLATE = """
+import time
+_t = time.perf_counter()
+{statement}
+print(time.perf_counter() - _t)
+"""
+
+
+def _run_python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+
+def measure(statement: str, repeat: int) -> Optional[List[float]]:
+    """
+    在新进程中执行 statement repeat 次
+
+    Returns:
+        Optional[List[float]]: 每次耗时（秒），执行失败（例如缺少数据库配置）返回 None
+    """
+    timings = []
+    for _ in range(repeat):
+        result = _run_python(_TIMER_TEMPLATE.format(statement=statement))
+        if result.returncode != 0:
+            return None
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def engine_created_on_import() -> bool:
+    """导入 db.utils 后 engine 是否已经被创建"""
+    result = _run_python("import db.utils; print(db.utils._engine is not None)")
+    return result.stdout.strip().endswith("True")
+
+
+@dataclass
+class ImportTiming:
+    """`-X importtime` 输出中的一行"""
+
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """
+    解析 `python -X importtime` 写到 stderr 的输出
+
+    Returns:
+        List[ImportTiming]: 每个被导入模块的自身/累计耗时（微秒）和嵌套深度
+    """
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # 表头
+        raw_name = fields[2].rstrip()
+        name = raw_name.lstrip()
+        depth = (len(raw_name) - len(name) - 1) // 2
+        timings.append(ImportTiming(name, int(fields[0]), int(fields[1]), depth))
+    return timings
+
+
+def import_times(statement: str) -> Optional[List[ImportTiming]]:
+    """在新进程中以 -X importtime 执行 statement，失败返回 None"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None
+    return parse_importtime(result.stderr)
+
+
+# 模拟 `python superc.py --local`，在第一个 HTTP 请求真正发出前打印耗时并退出。
+# 拦截用 BaseException 子类，绕过主循环里的 except Exception。
+_FIRST_REQUEST_TEMPLATE = """
+import time
+_t = time.perf_counter()
+import os, runpy, sys
+import httpx
+
+class _FirstRequest(BaseException):
+    pass
+
+def _intercept(self, request, **kwargs):
+    raise _FirstRequest(request.url)
+
+httpx.Client.send = _intercept
+sys.argv = ["superc.py", "--local"]
+try:
+    runpy.run_path("superc.py", run_name="__main__")
+except _FirstRequest:
+    print(time.perf_counter() - _t, flush=True)
+    os._exit(0)
+os._exit(1)
+"""
+
+
+def time_to_first_request(repeat: int) -> Optional[List[float]]:
+    """
+    从启动 superc.py --local 到第一个 HTTP 请求的耗时（秒）
+
+    Returns:
+        Optional[List[float]]: 每次耗时，未发出请求（例如缺少 data/local_user.yaml）返回 None
+    """
+    timings = []
+    for _ in range(repeat):
+        result = _run_python(_FIRST_REQUEST_TEMPLATE)
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def _print_import_breakdown(top: int) -> None:
+    timings = import_times("import superc.runner")
+    if timings is None:
+        print("import breakdown: skipped (import superc.runner 失败)")
+        return
+    total = max((t.cumulative_us for t in timings if t.depth == 0 and t.name == "superc.runner"), default=0)
+    print(f"\nimport superc.runner: {total / 1000:.1f} ms，累计耗时最长的模块（深度 <= 2）:")
+    print(f"{'module':<48}{'cumulative ms':>15}{'self ms':>10}")
+    shallow = [t for t in timings if t.depth <= 2]
+    for t in sorted(shallow, key=lambda t: t.cumulative_us, reverse=True)[:top]:
+        print(f"{'  ' * t.depth + t.name:<48}{t.cumulative_us / 1000:>15.1f}{t.self_us / 1000:>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SuperC 启动耗时基准")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景重复次数")
+    parser.add_argument("--top", type=int, default=15, help="导入耗时明细中显示的模块数")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<34}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, statement in SCENARIOS:
+        timings = measure(statement, args.repeat)
+        if timings is None:
+            print(f"{name:<34}{'skipped (失败，可能缺少依赖或数据库配置)':>12}")
+            continue
+        ms = [t * 1000 for t in timings]
+        print(f"{name:<34}{statistics.median(ms):>12.1f}{min(ms):>10.1f}{max(ms):>10.1f}")
+
+    print(f"\nengine created on `import db.utils`: {engine_created_on_import()}")
+
+    _print_import_breakdown(args.top)
+
+    timings = time_to_first_request(args.repeat)
+    if timings is None:
+        print("\nsuperc.py --local → first HTTP request: skipped (未发出请求，检查 data/local_user.yaml)")
+    else:
+        ms = [t * 1000 for t in timings]
+        print(f"\nsuperc.py --local → first HTTP request: median {statistics.median(ms):.1f} ms "
+              f"(min {min(ms):.1f}, max {max(ms):.1f})")
+
+
+if __name__ == "__main__":
+    main()
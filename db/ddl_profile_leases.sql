@@ -0,0 +1,7 @@
+-- appointment_profiles 多 worker 租约字段，供 db/utils.py 的 claim_waiting_profile / heartbeat_lease / release_lease 使用。
+-- 认领查询沿用 waiting_queue_idx（appointment_status = 'waiting' 的部分索引，按 created_at 排序），
+-- 配合 FOR UPDATE SKIP LOCKED，多个 worker 并发认领时互不阻塞，也不会拿到同一个用户。
+
+alter table public.appointment_profiles
+  add column if not exists claimed_by text,
+  add column if not exists lease_expires_at timestamp with time zone;
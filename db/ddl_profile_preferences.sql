@@ -0,0 +1,9 @@
+-- appointment_profiles 匹配约束字段，供 superc/matching.py 为用户分配可用时间。
+-- earliest_date / latest_date: 用户可接受的预约日期范围（含两端），为空表示不限
+-- priority: 优先级，越大越先分配；同优先级按排队顺序（created_at）
+-- ORM 每次查询都会选出这些字段，启动时检查（db.utils.missing_profile_columns）；执行: python -m db.migrate --profiles
+
+alter table public.appointment_profiles
+  add column if not exists earliest_date date,
+  add column if not exists latest_date date,
+  add column if not exists priority integer not null default 0;
@@ -0,0 +1,11 @@
+-- appointment_profiles 紧急程度排序，供 db/utils.py 的 get_first_waiting_profile / claim_waiting_profile
+-- 和 db/queue_listener.py 的本地堆使用。需要先执行 db/ddl_profile_preferences.sql（priority 字段）。
+-- 排序: priority 降序（人工加权） -> permit_expires_at 升序（居留许可先到期的优先，为空排最后） -> created_at 升序
+-- ORM 每次查询都会选出 permit_expires_at，启动时检查（db.utils.missing_profile_columns）；执行: python -m db.migrate --profiles
+
+alter table public.appointment_profiles
+  add column if not exists permit_expires_at date;
+
+create index if not exists waiting_urgency_idx
+  on public.appointment_profiles (priority desc, permit_expires_at asc nulls last, created_at asc)
+  where appointment_status = 'waiting';
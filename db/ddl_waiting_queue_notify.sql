@@ -0,0 +1,49 @@
+-- appointment_profiles 变化时通过 pg_notify 推送到 appointment_profiles_changed 频道，
+-- 供 db/queue_listener.py 的 WaitingQueueSubscriber 维护本地等待队列视图。
+-- 注意: LISTEN 需要直连（5432）或 Session Pooler，Transaction Pooler 不会转发通知。
+-- UPDATE 只在影响等待队列的字段变化时通知（状态、地点、日期范围、紧急程度、认领/释放），
+-- 每轮的租约心跳只更新 lease_expires_at，不会让每个 worker 重新读取记录。
+-- WHEN 条件引用了追加字段，需要先执行 python -m db.migrate --profiles。
+
+create or replace function public.notify_appointment_profiles_changed() returns trigger
+language plpgsql as $$
+declare
+  row_id bigint;
+  row_status text;
+begin
+  if TG_OP = 'DELETE' then
+    row_id := OLD.id;
+    row_status := null;
+  else
+    row_id := NEW.id;
+    row_status := NEW.appointment_status;
+  end if;
+
+  perform pg_notify(
+    'appointment_profiles_changed',
+    json_build_object('op', TG_OP, 'id', row_id, 'status', row_status)::text
+  );
+  return null;
+end;
+$$;
+
+drop trigger if exists appointment_profiles_notify on public.appointment_profiles;
+drop trigger if exists appointment_profiles_notify_update on public.appointment_profiles;
+
+create trigger appointment_profiles_notify
+after insert or delete on public.appointment_profiles
+for each row execute function public.notify_appointment_profiles_changed();
+
+create trigger appointment_profiles_notify_update
+after update on public.appointment_profiles
+for each row
+when (
+  OLD.appointment_status is distinct from NEW.appointment_status
+  or OLD.preferred_locations is distinct from NEW.preferred_locations
+  or OLD.earliest_date is distinct from NEW.earliest_date
+  or OLD.latest_date is distinct from NEW.latest_date
+  or OLD.priority is distinct from NEW.priority
+  or OLD.permit_expires_at is distinct from NEW.permit_expires_at
+  or OLD.claimed_by is distinct from NEW.claimed_by
+)
+execute function public.notify_appointment_profiles_changed();
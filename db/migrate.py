@@ -1,25 +1,32 @@
 #!/usr/bin/env python3
 """
-数据库迁移脚本 - 专门管理 app_logs_min 表
-直接执行 DDL 语句来创建和更新 app_logs_min 表
+数据库迁移脚本 - 管理 app_logs_min 表和 appointment_profiles 的追加字段
+直接执行 DDL 语句来创建和更新 app_logs_min 表；--profiles 执行 db/ddl_profile_*.sql
 
 使用方法:
     python -m db.migrate            # 创建 app_logs_min 表
     python -m db.migrate --rollback  # 删除 app_logs_min 表
     python -m db.migrate --check     # 检查 app_logs_min 表是否存在
     python -m db.migrate --update    # 更新 app_logs_min 表结构
+    python -m db.migrate --profiles  # 执行 db/ddl_profile_*.sql，补齐 appointment_profiles 的字段
+
+--profiles 按 db.utils.PROFILE_COLUMN_MIGRATIONS 的顺序执行:
+    ddl_profile_leases.sql -> ddl_profile_preferences.sql -> ddl_profile_urgency.sql（waiting_urgency_idx 依赖 priority）
 """
 
 import argparse
+import os
 import sys
 from typing import List
 from sqlalchemy import text, inspect
 from dotenv import load_dotenv
 
-from db.utils import engine
+from db.utils import PROFILE_COLUMN_MIGRATIONS, get_engine, missing_profile_columns
 from db.ddl_app_logs_min import ALL_DDL_STATEMENTS, ROLLBACK_DDL_STATEMENTS, UPDATE_DDL_STATEMENTS
 from db.models import AppLogsMin
 
+DDL_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 def execute_ddl_statements(statements: List[str], description: str = "DDL") -> bool:
     """
@@ -33,7 +40,7 @@ def execute_ddl_statements(statements: List[str], description: str = "DDL") -> b
         bool: 执行是否成功
     """
     try:
-        with engine.begin() as connection:
+        with get_engine().begin() as connection:
             print(f"开始执行 {description}...")
             
             for i, statement in enumerate(statements, 1):
@@ -67,7 +74,7 @@ def rollback_table() -> bool:
 def check_table_exists() -> bool:
     """检查 app_logs_min 表是否存在"""
     try:
-        inspector = inspect(engine)
+        inspector = inspect(get_engine())
         tables = inspector.get_table_names()
         return 'app_logs_min' in tables
     except Exception as e:
@@ -88,6 +95,28 @@ def update_table() -> bool:
     )
 
 
+def migrate_profiles() -> bool:
+    """
+    按顺序执行 PROFILE_COLUMN_MIGRATIONS 中的 DDL 文件（均为 add column if not exists，可重复执行），
+    补齐 appointment_profiles 上 ORM 需要的字段
+    """
+    for ddl_file in PROFILE_COLUMN_MIGRATIONS:
+        with open(os.path.join(DDL_DIR, ddl_file), "r", encoding="utf-8") as f:
+            ddl = f.read()
+        if not execute_ddl_statements([ddl], f"执行 {ddl_file}"):
+            return False
+    return True
+
+
+def check_profile_columns() -> None:
+    """检查 appointment_profiles 是否缺少 DDL 文件追加的字段"""
+    missing = missing_profile_columns()
+    if not missing:
+        print("appointment_profiles 字段齐全 ✅")
+    for ddl_file, columns in missing.items():
+        print(f"appointment_profiles 缺少字段 {', '.join(columns)} ❌（db/{ddl_file}）")
+
+
 def check_table_status() -> None:
     """检查 app_logs_min 表的状态"""
     print("检查 app_logs_min 表状态:")
@@ -100,7 +129,7 @@ def check_table_status() -> None:
     if exists:
         # 获取表的列信息
         try:
-            inspector = inspect(engine)
+            inspector = inspect(get_engine())
             columns = inspector.get_columns('app_logs_min')
             print(f"\n表结构 (共 {len(columns)} 列):")
             for col in columns:
@@ -124,6 +153,7 @@ def main():
   python -m db.migrate --rollback         # 删除 app_logs_min 表
   python -m db.migrate --check            # 检查表状态
   python -m db.migrate --update           # 更新表结构
+  python -m db.migrate --profiles         # 执行 appointment_profiles 字段迁移
         """
     )
     
@@ -145,11 +175,17 @@ def main():
         help='更新 app_logs_min 表结构'
     )
     
+    parser.add_argument(
+        '--profiles',
+        action='store_true',
+        help="执行 db/ddl_profile_*.sql，补齐 appointment_profiles 的字段"
+    )
+    
     args = parser.parse_args()
     
     # 测试数据库连接
     try:
-        with engine.connect() as connection:
+        with get_engine().connect() as connection:
             print("✅ 数据库连接成功")
     except Exception as e:
         print(f"❌ 数据库连接失败: {e}")
@@ -158,8 +194,16 @@ def main():
     # 执行相应操作
     if args.check:
         check_table_status()
+        check_profile_columns()
         return
     
+    if args.profiles:
+        success = migrate_profiles()
+        if success:
+            print("\nappointment_profiles 字段迁移完成！")
+        check_profile_columns()
+        sys.exit(0 if success else 1)
+    
     if args.rollback:
         success = rollback_table()
         if success:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, Text, DateTime, Boolean, Index, String, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, BigInteger, Text, Date, DateTime, Boolean, Index, String, ForeignKey, CheckConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func, text
 
@@ -35,6 +35,13 @@ class AppointmentProfile(Base):
     geburtsdatum_year = Column(Integer)
     preferred_locations = Column(Text, default='superc')
     
+    # 匹配约束：可接受的预约日期范围（含两端，为空表示不限）和优先级（越大越先分配）
+    earliest_date = Column(Date)
+    latest_date = Column(Date)
+    priority = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    # 紧急程度：居留许可到期日越早越优先（priority 为人工加权，见 waiting_urgency_idx）
+    permit_expires_at = Column(Date)
+    
     # 预约状态和进度
     appointment_status = Column(Text, default='waiting')  # waiting, booked
     
@@ -45,6 +52,10 @@ class AppointmentProfile(Base):
     # 完成时间
     completed_at = Column(DateTime)
     
+    # 多 worker 租约：claimed_by 为持有者（主机名:pid），到期未续约的用户可被其他 worker 认领
+    claimed_by = Column(Text)
+    lease_expires_at = Column(DateTime(timezone=True))
+    
     # 时间戳
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -60,6 +71,16 @@ waiting_queue_idx = Index(
     postgresql_where=text("appointment_status = 'waiting'")
 )
 
+# 紧急程度排序的部分复合索引：priority 高的在前，其次居留许可先到期的在前（ASC 默认 NULLS LAST），最后按排队时间
+# 与 db.utils.URGENCY_ORDER / urgency_key 的顺序一致
+waiting_urgency_idx = Index(
+    'waiting_urgency_idx',
+    AppointmentProfile.priority.desc(),
+    AppointmentProfile.permit_expires_at,
+    AppointmentProfile.created_at,
+    postgresql_where=text("appointment_status = 'waiting'")
+)
+
 class AppLogsMin(Base):
     __tablename__ = 'app_logs_min'
     
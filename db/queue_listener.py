@@ -0,0 +1,318 @@
+"""
+等待队列订阅 - 基于 Postgres LISTEN/NOTIFY
+
+WaitingQueueSubscriber 在本地内存中维护 appointment_status = 'waiting' 的用户视图。
+启动时全量加载一次，之后由 appointment_profiles 上的触发器（db/ddl_waiting_queue_notify.sql）
+通过 pg_notify 推送增量变化，新注册的用户无需重启或轮询即可被 runner 取到。
+连接断开时自动重连并全量重新同步，避免漏掉断线期间的通知。
+
+注意: LISTEN 需要直连（5432）或 Session Pooler，Transaction Pooler 不会转发通知。
+
+python -m db.queue_listener --install-trigger   # 安装触发器
+python -m db.queue_listener                      # 打印收到的队列变化
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db.models import AppointmentProfile
+from db.utils import is_claimable, urgency_key
+
+
+logger = logging.getLogger("queue_listener")
+
+NOTIFY_CHANNEL = "appointment_profiles_changed"
+TRIGGER_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ddl_waiting_queue_notify.sql")
+
+
+class WaitingQueueView:
+    """
+    等待队列的本地内存视图（线程安全），按紧急程度（db.utils.urgency_key）排队
+
+    除了按 id 的字典外还维护一个堆镜像，first() 是 O(log n)，不需要每次排序整个队列。
+    删除和更新采用惰性删除：旧的堆条目在弹出时按版本号识别并丢弃，堆过大时整体重建。
+    """
+
+    def __init__(self) -> None:
+        self._profiles: Dict[int, AppointmentProfile] = {}
+        self._heap: List[Tuple[tuple, int, int]] = []
+        self._versions: Dict[int, int] = {}
+        self._next_version = 0
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._profiles)
+
+    def _push(self, profile: AppointmentProfile) -> None:
+        self._next_version += 1
+        self._versions[profile.id] = self._next_version
+        heapq.heappush(self._heap, (urgency_key(profile), self._next_version, profile.id))
+        if len(self._heap) > 2 * len(self._profiles) + 64:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._versions = {}
+        self._heap = []
+        for profile in self._profiles.values():
+            self._next_version += 1
+            self._versions[profile.id] = self._next_version
+            self._heap.append((urgency_key(profile), self._next_version, profile.id))
+        heapq.heapify(self._heap)
+
+    def replace_all(self, profiles: List[AppointmentProfile]) -> None:
+        """全量替换（启动 / 重连后重新同步）"""
+        with self._cond:
+            self._profiles = {p.id: p for p in profiles if p.appointment_status == "waiting"}
+            self._rebuild()
+            self._cond.notify_all()
+
+    def upsert(self, profile: AppointmentProfile) -> None:
+        with self._cond:
+            if profile.appointment_status == "waiting":
+                self._profiles[profile.id] = profile
+                self._push(profile)
+                self._cond.notify_all()
+            else:
+                self.remove(profile.id)
+
+    def remove(self, profile_id: int) -> None:
+        with self._cond:
+            self._profiles.pop(profile_id, None)
+            self._versions.pop(profile_id, None)
+
+    def get(self, profile_id: int) -> Optional[AppointmentProfile]:
+        with self._cond:
+            return self._profiles.get(profile_id)
+
+    def snapshot(self) -> List[AppointmentProfile]:
+        """按紧急程度返回当前所有等待用户"""
+        with self._cond:
+            profiles = list(self._profiles.values())
+        return sorted(profiles, key=urgency_key)
+
+    def first(self, worker_id: Optional[str] = None) -> Optional[AppointmentProfile]:
+        """
+        最紧急的等待用户
+
+        Args:
+            worker_id: 指定时跳过被其他 worker 持有有效租约的用户
+        """
+        with self._cond:
+            skipped = []
+            found = None
+            while self._heap:
+                _, version, profile_id = self._heap[0]
+                if self._versions.get(profile_id) != version:
+                    heapq.heappop(self._heap)  # 已删除或已更新的旧条目
+                    continue
+                profile = self._profiles[profile_id]
+                if worker_id is None or is_claimable(profile, worker_id):
+                    found = profile
+                    break
+                # 被其他 worker 持有的用户暂时移出，找到结果后放回（通常只有几个）
+                skipped.append(heapq.heappop(self._heap))
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+            return found
+
+    def wait_for_first(self, timeout: Optional[float] = None, worker_id: Optional[str] = None) -> Optional[AppointmentProfile]:
+        """队列中没有（可认领的）用户时阻塞，直到出现或超时"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.first(worker_id) is not None, timeout=timeout)
+        return self.first(worker_id)
+
+    def apply_notification(self, payload: dict, fetch: Callable[[int], Optional[AppointmentProfile]]) -> None:
+        """
+        应用一条 NOTIFY 消息
+
+        Args:
+            payload: {'op': 'INSERT'|'UPDATE'|'DELETE', 'id': int, 'status': str|None}
+            fetch: 按 id 读取完整记录（只在变为 waiting 时调用）
+        """
+        profile_id = payload.get("id")
+        if profile_id is None:
+            return
+        if payload.get("op") == "DELETE" or payload.get("status") != "waiting":
+            self.remove(profile_id)
+            return
+        profile = fetch(profile_id)
+        if profile is None:
+            self.remove(profile_id)
+        else:
+            self.upsert(profile)
+
+
+class WaitingQueueSubscriber:
+    """后台线程 LISTEN appointment_profiles_changed，保持 WaitingQueueView 最新"""
+
+    def __init__(
+        self,
+        engine=None,
+        channel: str = NOTIFY_CHANNEL,
+        poll_timeout: float = 5.0,
+        resync_interval: float = 600.0,
+    ) -> None:
+        self._engine = engine
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.resync_interval = resync_interval
+        self.view = WaitingQueueView()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        # 第一次连接尝试结束（成功或失败），start() 不必在数据库不可用时等满 wait_ready
+        self._first_attempt = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from db.utils import get_engine
+            self._engine = get_engine()
+        return self._engine
+
+    def start(self, wait_ready: float = 10.0) -> "WaitingQueueSubscriber":
+        """启动监听线程，等待首次全量同步完成（最多 wait_ready 秒）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="waiting-queue-listener", daemon=True)
+            self._thread.start()
+        self._first_attempt.wait(wait_ready)
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_timeout + 1)
+
+    @property
+    def is_running(self) -> bool:
+        """监听线程存活、连接正常并且视图已同步（连接断开后到重新同步完成前为 False）"""
+        return self._thread is not None and self._thread.is_alive() and self._ready.is_set()
+
+    def wait_for_profile(self, timeout: Optional[float] = None, worker_id: Optional[str] = None) -> Optional[AppointmentProfile]:
+        """等待队列中出现（worker_id 可认领的）用户，返回排队最久的一个（超时返回 None）"""
+        return self.view.wait_for_first(timeout, worker_id)
+
+    # ------------------------------------------------------------------
+
+    def _resync(self) -> bool:
+        """
+        全量重新同步；查询失败时保留当前视图（数据库暂时不可用不等于没有人在等待）
+        Output: bool - 是否同步成功
+        """
+        from db.utils import query_waiting_profiles
+        try:
+            profiles = query_waiting_profiles()
+        except Exception as e:
+            logger.warning(f"等待队列全量同步失败，保留当前视图: {e}")
+            return False
+        self.view.replace_all(profiles)
+        return True
+
+    def _fetch(self, profile_id: int) -> Optional[AppointmentProfile]:
+        from db.utils import query_appointment_profile
+        return query_appointment_profile(profile_id)
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            raw_connection = None
+            try:
+                raw_connection = self.engine.raw_connection()
+                dbapi_connection = raw_connection.driver_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+
+                # 先 LISTEN 再全量同步，两者之间的变化会以通知形式补上
+                if not self._resync():
+                    raise RuntimeError("全量同步失败")
+                self._ready.set()
+                self._first_attempt.set()
+                logger.info(f"等待队列监听已启动，当前等待用户: {len(self.view)}")
+                backoff = 1.0
+                last_resync = time.monotonic()
+
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([dbapi_connection], [], [], self.poll_timeout)
+                    if readable:
+                        dbapi_connection.poll()
+                        while dbapi_connection.notifies:
+                            notify = dbapi_connection.notifies.pop(0)
+                            self._handle_payload(notify.payload)
+                    if time.monotonic() - last_resync >= self.resync_interval:
+                        self._resync()
+                        last_resync = time.monotonic()
+            except Exception as e:
+                # 重连并重新同步之前视图可能漏掉通知，调用方应回退为查询数据库
+                self._ready.clear()
+                self._first_attempt.set()
+                logger.warning(f"等待队列监听连接异常，{backoff:.0f}s 后重连: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                if raw_connection is not None:
+                    try:
+                        with raw_connection.driver_connection.cursor() as cursor:
+                            cursor.execute("UNLISTEN *")
+                    except Exception:
+                        pass
+                    raw_connection.close()
+
+    def _handle_payload(self, raw_payload: str) -> None:
+        try:
+            payload = json.loads(raw_payload)
+        except ValueError:
+            logger.warning(f"无法解析队列通知: {raw_payload}")
+            return
+        try:
+            self.view.apply_notification(payload, self._fetch)
+        except Exception as e:
+            # 读取记录失败时不改动视图，下一次全量同步会补上
+            logger.warning(f"应用队列通知失败 id={payload.get('id')}: {e}")
+            return
+        logger.debug(f"队列变化: {payload.get('op')} id={payload.get('id')} status={payload.get('status')}，当前等待用户: {len(self.view)}")
+
+
+def install_notify_trigger(engine=None) -> None:
+    """在数据库中创建/更新通知触发器（执行 ddl_waiting_queue_notify.sql）"""
+    if engine is None:
+        from db.utils import get_engine
+        engine = get_engine()
+    with open(TRIGGER_SQL_PATH, "r", encoding="utf-8") as f:
+        ddl = f.read()
+    with engine.begin() as connection:
+        connection.exec_driver_sql(ddl)
+
+
+def main():
+    """CLI entry point: 安装触发器或打印队列变化"""
+    parser = argparse.ArgumentParser(description="等待队列 LISTEN/NOTIFY 工具")
+    parser.add_argument("--install-trigger", action="store_true", help="安装 appointment_profiles 通知触发器")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.install_trigger:
+        install_notify_trigger()
+        print("✅ 通知触发器已安装")
+        return
+
+    subscriber = WaitingQueueSubscriber().start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        subscriber.stop()
+
+
+if __name__ == "__main__":
+    main()
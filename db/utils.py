@@ -7,18 +7,74 @@ db 操作就像是 api。不是一个 connection。
 
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import case, create_engine, func, inspect, or_, select, update
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import text
 # from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 import os
-from typing import List, Optional
-from datetime import datetime, timezone
+import socket
+import threading
+from typing import Dict, Iterable, List, Optional
+from datetime import date, datetime, timedelta, timezone
 import re
 from db.models import AppointmentProfile, AppLogsMin
 import argparse
 
+# 等待队列的服务顺序（紧急程度）：priority 降序 -> 居留许可先到期 -> 排队最久，使用 waiting_urgency_idx
+URGENCY_ORDER = (
+    AppointmentProfile.priority.desc(),
+    AppointmentProfile.permit_expires_at.asc().nulls_last(),
+    AppointmentProfile.created_at,
+    AppointmentProfile.id,
+)
+
+
+def urgency_key(profile: AppointmentProfile) -> tuple:
+    """
+    与 URGENCY_ORDER 一致的内存排序键（越小越紧急），供本地等待队列视图的堆使用
+
+    输入类型:
+    - profile: AppointmentProfile
+
+    输出类型:
+    - tuple
+    """
+    return (
+        -(profile.priority or 0),
+        profile.permit_expires_at or date.max,
+        profile.created_at is None,
+        profile.created_at or datetime.min,
+        profile.id,
+    )
+
+# appointment_profiles 上由 db/ 下的 DDL 文件追加的字段。ORM 每次查询都会选出全部列，
+# 未执行对应 DDL 的数据库上所有 profile 查询都会失败，启动时用 missing_profile_columns 检查
+PROFILE_COLUMN_MIGRATIONS = {
+    "ddl_profile_leases.sql": ("claimed_by", "lease_expires_at"),
+    "ddl_profile_preferences.sql": ("earliest_date", "latest_date", "priority"),
+    "ddl_profile_urgency.sql": ("permit_expires_at",),
+}
+
+
+def missing_profile_columns(engine=None) -> Dict[str, List[str]]:
+    """
+    检查 appointment_profiles 是否缺少 PROFILE_COLUMN_MIGRATIONS 中的字段；无法连接数据库时抛出异常
+
+    输入类型:
+    - engine: Optional[sqlalchemy.engine.Engine] - 默认使用 get_engine()
+
+    输出类型:
+    - Dict[str, List[str]] - {DDL 文件名: 缺少的字段}，字段齐全时为空字典
+    """
+    existing = {column["name"] for column in inspect(engine or get_engine()).get_columns("appointment_profiles")}
+    missing = {}
+    for ddl_file, columns in PROFILE_COLUMN_MIGRATIONS.items():
+        absent = [column for column in columns if column not in existing]
+        if absent:
+            missing[ddl_file] = absent
+    return missing
+
 # Logging parse defaults
 DEFAULT_SCHRITT = "-"
 _LOG_LINE_PATTERN = re.compile(
@@ -52,8 +108,56 @@ def _init_database():
     
     return engine, SessionLocal
 
-# 初始化数据库连接
-engine, SessionLocal = _init_database()
+# engine / session factory 在第一次真正访问数据库时才创建，
+# 避免 import db.utils（或本地模式）就为 Postgres 建连接池、读 .env
+_engine = None
+_session_factory = None
+_init_lock = threading.Lock()
+
+
+def _ensure_database() -> None:
+    global _engine, _session_factory
+    if _session_factory is not None:
+        return
+    with _init_lock:
+        if _session_factory is None:
+            _engine, _session_factory = _init_database()
+
+
+def get_engine():
+    """
+    获取 SQLAlchemy engine（首次调用时初始化）
+    输出类型: sqlalchemy.engine.Engine
+    """
+    _ensure_database()
+    return _engine
+
+
+def configure_engine(new_engine) -> None:
+    """
+    使用指定的 engine 替换默认的 Supabase 连接（例如本地 Postgres 或测试数据库）
+    输入类型: new_engine: sqlalchemy.engine.Engine
+    """
+    global _engine, _session_factory
+    with _init_lock:
+        _engine = new_engine
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=new_engine)
+
+
+def SessionLocal():
+    """
+    创建一个新的数据库 session（首次调用时初始化 engine）
+    输出类型: sqlalchemy.orm.Session
+    """
+    _ensure_database()
+    return _session_factory()
+
+
+def __getattr__(name: str):
+    # 兼容旧代码 `from db.utils import engine`，访问时才初始化
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 """
 注意: 过去版本支持字符串日期解析(parse_appointment_date)，现已移除，统一使用 datetime 对象。
@@ -76,16 +180,16 @@ def get_all_appointment_profiles() -> List[AppointmentProfile]:
 
 def get_first_waiting_profile() -> Optional[AppointmentProfile]:
     """
-    获取等待队列中的第一个用户（排队最久的用户）
-    使用 waiting_queue_idx 索引来优化查询性能
-    只查询 appointment_status = 'waiting' 的记录，按 created_at 升序排列
+    获取等待队列中的第一个用户（最紧急的用户）
+    使用 waiting_urgency_idx 索引来优化查询性能
+    只查询 appointment_status = 'waiting' 的记录，按 URGENCY_ORDER 排列
     """
     session = SessionLocal()
     try:
-        # 利用 waiting_queue_idx 索引：只查询等待状态的记录，按创建时间升序排列
+        # 利用 waiting_urgency_idx 索引：只查询等待状态的记录，按紧急程度排列
         first_waiting_profile = session.query(AppointmentProfile)\
                                       .filter(AppointmentProfile.appointment_status == 'waiting')\
-                                      .order_by(AppointmentProfile.created_at)\
+                                      .order_by(*URGENCY_ORDER)\
                                       .first()
         return first_waiting_profile
     except Exception as e:
@@ -94,69 +198,316 @@ def get_first_waiting_profile() -> Optional[AppointmentProfile]:
     finally:
         session.close()
 
-def update_appointment_status(profile_id: int, status: str, appointment_date: Optional[datetime] = None) -> bool:
+def query_appointment_profile(profile_id: int) -> Optional[AppointmentProfile]:
     """
-    更新预约配置文件的状态和预约日期
+    按 ID 获取单个预约配置文件，查询失败时抛出异常（调用方需要区分"不存在"和"查询失败"时使用）
 
     输入类型:
     - profile_id: int - 预约配置文件ID
-    - status: str - 新的状态值（如 'booked', 'error'）
-        - appointment_date: Optional[datetime] - 预约日期时间对象（不再支持字符串）
 
     输出类型:
-    - bool - 更新是否成功
+    - Optional[AppointmentProfile] - 未找到时为 None
     """
     session = SessionLocal()
     try:
-        # 查找指定ID的记录
-        profile = session.query(AppointmentProfile).filter(AppointmentProfile.id == profile_id).first()
-        if profile:
-            # 使用 setattr 来避免类型检查问题
-            setattr(profile, 'appointment_status', status)
-            
-            # 如果提供了预约日期，直接存储（仅接受 datetime）
-            if appointment_date is not None:
-                if isinstance(appointment_date, datetime):
-                    setattr(profile, 'appointment_date', appointment_date)
-                    print(f"成功存储预约日期: {appointment_date}")
-                else:
-                    print(f"预约日期类型无效(需datetime): {type(appointment_date)}")
-
-            setattr(profile, 'completed_at', datetime.now())
-
-            session.commit()
-            
-            print(f"成功更新ID {profile_id} 的状态为 '{status}'")
-            return True
-        else:
-            print(f"未找到ID为 {profile_id} 的记录")
-            return False
+        return session.query(AppointmentProfile).filter(AppointmentProfile.id == profile_id).first()
+    finally:
+        session.close()
+
+def get_appointment_profile(profile_id: int) -> Optional[AppointmentProfile]:
+    """
+    按 ID 获取单个预约配置文件
+
+    输入类型:
+    - profile_id: int - 预约配置文件ID
+
+    输出类型:
+    - Optional[AppointmentProfile] - 未找到或查询失败时为 None
+    """
+    try:
+        return query_appointment_profile(profile_id)
+    except Exception as e:
+        print(f"查询失败: {e}")
+        return None
+
+def default_worker_id() -> str:
+    """
+    当前进程的 worker 标识，用作租约持有者
+    输出类型: str - 形如 'hostname:pid'
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _db_now(session):
+    """
+    租约使用的当前时间：Postgres 上用数据库时间 now()，避免多台机器时钟不一致；
+    其他方言（测试用 SQLite）退回本机 UTC 时间
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        return func.now()
+    return datetime.now(timezone.utc)
+
+def claim_waiting_profile(worker_id: str, lease_seconds: int = 300, exclude_ids: Iterable[int] = ()) -> Optional[AppointmentProfile]:
+    """
+    原子地认领最紧急（见 URGENCY_ORDER）、且未被其他 worker 持有有效租约的等待用户
+
+    子查询沿用 waiting_urgency_idx 的顺序，并用 FOR UPDATE SKIP LOCKED 跳过其他 worker 正在认领的行，
+    多个 worker 并发调用时各自拿到不同的用户。已持有的租约会被续期（重启后同一 worker 拿回自己的用户）。
+
+    输入类型:
+    - worker_id: str - 认领者标识（见 default_worker_id）
+    - lease_seconds: int - 租约时长，到期未续约则可被其他 worker 认领
+    - exclude_ids: Iterable[int] - 跳过的用户（例如本进程已处理完、状态更新尚未写入数据库的用户）
+
+    输出类型:
+    - Optional[AppointmentProfile] - 认领到的用户，无可认领用户或失败时为 None
+    """
+    session = SessionLocal()
+    try:
+        now = _db_now(session)
+        candidate = select(AppointmentProfile.id)\
+            .where(AppointmentProfile.appointment_status == 'waiting')\
+            .where(or_(AppointmentProfile.lease_expires_at.is_(None),
+                       AppointmentProfile.lease_expires_at < now,
+                       AppointmentProfile.claimed_by == worker_id))\
+            .where(AppointmentProfile.id.notin_(list(exclude_ids)))\
+            .order_by(*URGENCY_ORDER)\
+            .limit(1)\
+            .with_for_update(skip_locked=True)\
+            .scalar_subquery()
+        claimed_id = session.execute(
+            update(AppointmentProfile)
+            .where(AppointmentProfile.id == candidate)
+            .values(claimed_by=worker_id, lease_expires_at=now + timedelta(seconds=lease_seconds))
+            .returning(AppointmentProfile.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        session.commit()
+        if claimed_id is None:
+            return None
+        return session.query(AppointmentProfile).filter(AppointmentProfile.id == claimed_id).first()
     except Exception as e:
         session.rollback()
-        print(f"更新失败: {e}")
+        print(f"认领失败: {e}")
+        return None
+    finally:
+        session.close()
+
+def claim_profile(profile_id: int, worker_id: str, lease_seconds: int = 300) -> bool:
+    """
+    认领指定的等待用户（匹配引擎选中用户后再认领，已被其他 worker 持有有效租约时失败）
+
+    输入类型:
+    - profile_id: int - 预约配置文件ID
+    - worker_id: str - 认领者标识
+    - lease_seconds: int - 租约时长
+
+    输出类型:
+    - bool - 是否认领成功
+    """
+    session = SessionLocal()
+    try:
+        now = _db_now(session)
+        claimed_id = session.execute(
+            update(AppointmentProfile)
+            .where(AppointmentProfile.id == profile_id)
+            .where(AppointmentProfile.appointment_status == 'waiting')
+            .where(or_(AppointmentProfile.lease_expires_at.is_(None),
+                       AppointmentProfile.lease_expires_at < now,
+                       AppointmentProfile.claimed_by == worker_id))
+            .values(claimed_by=worker_id, lease_expires_at=now + timedelta(seconds=lease_seconds))
+            .returning(AppointmentProfile.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        session.commit()
+        return claimed_id is not None
+    except Exception as e:
+        session.rollback()
+        print(f"认领失败: {e}")
         return False
     finally:
         session.close()
 
-def get_all_waiting_profiles() -> List[AppointmentProfile]:
+def is_claimable(profile: AppointmentProfile, worker_id: str) -> bool:
     """
-    获取所有等待中的预约配置文件，按排队顺序排列
-    使用 waiting_queue_idx 索引来优化查询性能
+    判断 worker_id 能否认领该用户: 租约为空、已过期或属于 worker_id
+    （只根据内存中的记录判断是否值得尝试，是否认领成功以 claim_profile 的数据库结果为准）
+
+    输入类型:
+    - profile: AppointmentProfile
+    - worker_id: str - 认领者标识
+
+    输出类型:
+    - bool
+    """
+    if profile.claimed_by in (None, worker_id) or profile.lease_expires_at is None:
+        return True
+    expires_at = profile.lease_expires_at
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at <= datetime.now(timezone.utc)
+
+def heartbeat_lease(profile_id: int, worker_id: str, lease_seconds: int = 300) -> bool:
+    """
+    为仍在处理的用户续约
+
+    输入类型:
+    - profile_id: int - 预约配置文件ID
+    - worker_id: str - 租约持有者
+    - lease_seconds: int - 从现在起的新租约时长
+
+    输出类型:
+    - bool - 仍持有租约返回 True；租约已被他人接管或用户已不在等待状态返回 False
+
+    数据库错误时抛出异常：连接暂时不可用不等于租约已被接管，由调用方决定如何处理
     """
     session = SessionLocal()
     try:
-        # 利用 waiting_queue_idx 索引：只查询等待状态的记录，按创建时间升序排列
-        waiting_profiles = session.query(AppointmentProfile)\
-                                 .filter(AppointmentProfile.appointment_status == 'waiting')\
-                                 .order_by(AppointmentProfile.created_at)\
-                                 .all()
-        return waiting_profiles
+        now = _db_now(session)
+        renewed_id = session.execute(
+            update(AppointmentProfile)
+            .where(AppointmentProfile.id == profile_id)
+            .where(AppointmentProfile.claimed_by == worker_id)
+            .where(AppointmentProfile.appointment_status == 'waiting')
+            .values(lease_expires_at=now + timedelta(seconds=lease_seconds))
+            .returning(AppointmentProfile.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        session.commit()
+        return renewed_id is not None
     except Exception as e:
-        print(f"查询失败: {e}")
-        return []
+        session.rollback()
+        print(f"续约失败: {e}")
+        raise
     finally:
         session.close()
 
+def release_lease(profile_id: int, worker_id: str) -> bool:
+    """
+    释放租约，让其他 worker 可以立即认领该用户
+
+    输入类型:
+    - profile_id: int - 预约配置文件ID
+    - worker_id: str - 租约持有者（只释放自己持有的租约）
+
+    输出类型:
+    - bool - 是否释放了租约
+    """
+    session = SessionLocal()
+    try:
+        released_id = session.execute(
+            update(AppointmentProfile)
+            .where(AppointmentProfile.id == profile_id)
+            .where(AppointmentProfile.claimed_by == worker_id)
+            .values(claimed_by=None, lease_expires_at=None)
+            .returning(AppointmentProfile.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        session.commit()
+        return released_id is not None
+    except Exception as e:
+        session.rollback()
+        print(f"释放租约失败: {e}")
+        return False
+    finally:
+        session.close()
+
+def transition_appointment_status(profile_id: int, from_status: str, to_status: str,
+                                  appointment_date: Optional[datetime] = None) -> bool:
+    """
+    用一条带条件的 UPDATE ... RETURNING 完成状态转换（如 waiting→booked、waiting→error），一次往返
+
+    - 只有当前状态为 from_status 时才转换，防止重复转换（例如已 booked 的用户再被标记为 error）
+    - 当前状态已经是 to_status 时视为成功且不改动预约日期 / 完成时间，重试是幂等的
+    - 转换时同时释放租约
+
+    输入类型:
+    - profile_id: int - 预约配置文件ID
+    - from_status: str - 期望的当前状态
+    - to_status: str - 目标状态
+    - appointment_date: Optional[datetime] - 预约日期时间（仅在本次真正转换时写入）
+
+    输出类型:
+    - bool - 记录处于 to_status（本次转换或之前已转换）返回 True；未找到或处于其他状态返回 False
+
+    数据库错误时抛出异常（可以重试），与返回 False（重试也不会成功）区分开
+    """
+    is_transition = AppointmentProfile.appointment_status == from_status
+    values = {
+        "appointment_status": to_status,
+        "completed_at": func.coalesce(AppointmentProfile.completed_at, datetime.now()),
+        "claimed_by": None,
+        "lease_expires_at": None,
+    }
+    if appointment_date is not None:
+        values["appointment_date"] = case((is_transition, appointment_date), else_=AppointmentProfile.appointment_date)
+
+    session = SessionLocal()
+    try:
+        updated_id = session.execute(
+            update(AppointmentProfile)
+            .where(AppointmentProfile.id == profile_id)
+            .where(AppointmentProfile.appointment_status.in_((from_status, to_status)))
+            .values(**values)
+            .returning(AppointmentProfile.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        session.commit()
+        return updated_id is not None
+    except Exception as e:
+        session.rollback()
+        print(f"更新失败: {e}")
+        raise
+    finally:
+        session.close()
+
+def update_appointment_status(profile_id: int, status: str, appointment_date: Optional[datetime] = None) -> bool:
+    """
+    把等待中的预约配置文件更新为新状态（并写入预约日期），见 transition_appointment_status
+
+    输入类型:
+    - profile_id: int - 预约配置文件ID
+    - status: str - 新的状态值（如 'booked', 'error'）
+        - appointment_date: Optional[datetime] - 预约日期时间对象（不再支持字符串）
+
+    输出类型:
+    - bool - 更新是否成功（重复调用同样返回 True）；数据库错误时抛出异常
+    """
+    if appointment_date is not None and not isinstance(appointment_date, datetime):
+        print(f"预约日期类型无效(需datetime): {type(appointment_date)}")
+        appointment_date = None
+
+    if transition_appointment_status(profile_id, "waiting", status, appointment_date):
+        print(f"成功更新ID {profile_id} 的状态为 '{status}'" + (f"，预约日期: {appointment_date}" if appointment_date else ""))
+        return True
+    print(f"未找到ID为 {profile_id} 的等待中记录（可能已被标记为其他状态）")
+    return False
+
+def query_waiting_profiles() -> List[AppointmentProfile]:
+    """
+    获取所有等待中的预约配置文件，按紧急程度排列；查询失败时抛出异常，
+    不会把"数据库暂时不可用"当成"没有人在等待"（等待队列视图全量同步使用）
+    使用 waiting_urgency_idx 索引来优化查询性能
+    """
+    session = SessionLocal()
+    try:
+        # 利用 waiting_urgency_idx 索引：只查询等待状态的记录，按紧急程度排列
+        return session.query(AppointmentProfile)\
+                      .filter(AppointmentProfile.appointment_status == 'waiting')\
+                      .order_by(*URGENCY_ORDER)\
+                      .all()
+    finally:
+        session.close()
+
+def get_all_waiting_profiles() -> List[AppointmentProfile]:
+    """
+    获取所有等待中的预约配置文件，按紧急程度排列（查询失败时返回空列表）
+    """
+    try:
+        return query_waiting_profiles()
+    except Exception as e:
+        print(f"查询失败: {e}")
+        return []
+
 def get_waiting_queue_count() -> int:
     """
     获取等待队列的长度
@@ -323,7 +674,7 @@ def main():
 
     # 默认执行数据库连通性检查
     try:
-        with engine.connect() as connection:
+        with get_engine().connect() as connection:
             print("Connection successful!")
 
         print("\n=== 等待队列统计信息 ===")
@@ -6,8 +6,16 @@ This package contains the core functionality for the automated appointment
 checking bot for the Aachen Ausländeramt (immigration office).
 """
 
-from .appointment_checker import run_check
 from .config import LOCATIONS, LOG_FORMAT
 
 __version__ = "1.0.0"
-__all__ = ["run_check", "LOCATIONS", "LOG_FORMAT"]
\ No newline at end of file
+__all__ = ["run_check", "LOCATIONS", "LOG_FORMAT"]
+
+
+def __getattr__(name: str):
+    # run_check 会导入 httpx / bs4 / 表单模块，延迟到第一次访问时再加载，
+    # 这样 import superc.config、superc.utils.logging_utils 等轻量模块不会拖慢启动
+    if name == "run_check":
+        from .appointment_checker import run_check
+        return run_check
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
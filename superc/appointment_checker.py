@@ -18,11 +18,14 @@ from urllib.parse import urljoin
 from . import config
 from .utils.logging_utils import setup_logging
 from .utils.utils import save_page_content, validate_page_step
-from .utils.form_filler import fill_form_with_captcha_retry
+from .utils.flight_recorder import RecordedCycle, get_flight_recorder
+from .utils.rate_governor import get_rate_governor
+from .utils import deadline
 import json
 from .profile import Profile
 from .utils.appointment_selector import select_first_appointment
-from .utils.page_navigation import enter_schritt_2_page, enter_schritt_3_page, enter_schritt_4_page, enter_schritt_5_page, enter_schritt_6_page, log_verbose
+from .utils.page_navigation import log_verbose
+from .booking_flow import BookingContext, BookingFlow, Step
 
 
 SCHRITT_2_LOGGER = logging.getLogger("schritt2")
@@ -36,94 +39,70 @@ USER_AGENT = config.USER_AGENT
 BASE_URL = config.BASE_URL
 
 
-def run_check(location_config: dict, current_profile: Optional[Profile]) -> Tuple[bool, str, Optional[datetime]]:
+def create_session(event_hooks: Optional[dict] = None) -> httpx.Client:
     """
-    执行一次完整的预约检查流程 - 6个Schritt步骤
-    返回: (成功?, 消息, 预约日期时间对象)
+    创建访问预约网站的 session，配置适当的超时和连接池，请求经过跨 worker 限速和时间预算
+    Input: event_hooks: Optional[dict] - httpx event hooks
+    Output: httpx.Client
     """
-    # 创建session并配置适当的超时和重试策略
+    event_hooks = {name: list(hooks) for name, hooks in (event_hooks or {}).items()}
+    if config.ENABLE_RATE_GOVERNOR:
+        event_hooks.setdefault("request", []).insert(0, get_rate_governor().on_request)
+    # 按当前时间预算设置每个请求的超时，没有预算时（例如单独调用）使用下面的默认超时
+    event_hooks.setdefault("request", []).append(deadline.on_request)
     session = httpx.Client(
         timeout=30.0,
         follow_redirects=True,
-        limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
+        limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
+        event_hooks=event_hooks,
     )
     session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+
+def run_check(location_config: dict, current_profile: Optional[Profile], warm_state=None,
+              target_datetime: Optional[datetime] = None, on_slots=None,
+              cycle: Optional[RecordedCycle] = None) -> Tuple[bool, str, Optional[datetime]]:
+    """
+    执行一次完整的预约检查流程 - 6个Schritt步骤
+    warm_state: superc.prewarm.WarmState，放号前预热好的 session 和 Schritt 2-3 结果，
+                提供时直接从 Schritt 4 开始（session 用完后关闭）
+    target_datetime / on_slots: 见 enter_schritt_4_page，用于多个用户并行预约同一批放号
+    cycle: 调用方开始的飞行记录轮次，提供时记录到这一轮并由调用方带着结果结束；否则本函数自己开始和结束一轮
+    各步骤的执行和失败重试见 superc.booking_flow
+    返回: (成功?, 消息, 预约日期时间对象)
+    """
     location_name = location_config["name"]
-    
-    try:
-        # logging.info(f"开始检查 {location_name} 的预约...")
-        log_verbose(SCHRITT_2_LOGGER, "=== 进入Schritt 2页面 ===")
-
-        # ===========================================================
-        # 进入Schritt 2页面并完成操作
-        # ===========================================================
-        success, url = enter_schritt_2_page(session, location_config["selection_text"])
-        if not success: 
-            SCHRITT_2_LOGGER.error(f"Schritt 2页面失败: {url}")
-            return False, url, None
-
-        # ============================================================
-        # 进入Schritt 3页面并完成操作
-        # ===========================================================
-        log_verbose(SCHRITT_3_LOGGER, "=== 进入Schritt 3页面 ===")
-        success, loc = enter_schritt_3_page(session, url)
-        if not success: 
-            SCHRITT_3_LOGGER.error(f"Schritt 3 页面: {loc}")
-            return False, str(loc), None
-
-        # ============================================================
-        # 进入Schritt 4页面并完成操作
-        # ============================================================
-        log_verbose(SCHRITT_4_LOGGER, "=== 进入Schritt 4页面 ===")
-        success, message, form_data, selected_profile, appointment_datetime = enter_schritt_4_page(session, url, loc, location_config["submit_text"], location_name, current_profile)
-        
-        if not success:
-            SCHRITT_4_LOGGER.info(f"Schritt 4 page: {message}")
-            return False, message, None
-        else:
-            SCHRITT_4_LOGGER.info(f"Schritt 4  page 有预约: {message}")
-
-        has_appointment = True
-
-
-        # ============================================================
-        # 进入Schritt 5页面并完成所有操作：提交预约选择 + 填写表单
-        # form_data 里面包含了所有信息，appointment_datetime_str 只是为了显示用。
-        # ============================================================
-        log_verbose(SCHRITT_5_LOGGER, "=== 进入Schritt 5页面 ===")
-        if form_data is None or selected_profile is None:
-            return has_appointment, "内部错误：form_data或selected_profile为空", None
-            
-        success, message, soup = enter_schritt_5_page(session, form_data, location_name, selected_profile)
-
-        if message == "superC server error":
-            SCHRITT_5_LOGGER.error("Schritt 5: superC server error，停止本轮流程")
-            return has_appointment, message, None
-
-        if not success:
-            SCHRITT_5_LOGGER.error(f"Schritt 5页面失败: {message}")
-            return has_appointment, message, None
-
-
-        log_verbose(SCHRITT_6_LOGGER, "=== 进入Schritt 6页面 ===")
-        # ===========================================================
-        # 进入Schritt 6页面并完成操作：邮件确认
-        # ==========================================================
-        if soup is None:
-            return has_appointment, "内部错误：soup为空", None
-            
-        result = enter_schritt_6_page(session, soup, location_name)
-        if result[0]:
-            # 这是关键信息，始终输出
-            SCHRITT_6_LOGGER.info(f"预约成功完成: {result[1]}")
-            return has_appointment, result[1], appointment_datetime
-        else:
-            SCHRITT_6_LOGGER.error(f"Schritt 6 失败: {result[1]}")
-            return has_appointment, result[1], None
+    # 飞行记录器: 本轮所有请求/响应只保存在内存，失败时由 runner 转储
+    recorder = get_flight_recorder()
+    owns_cycle = cycle is None
+    if owns_cycle:
+        cycle = recorder.begin_cycle(location_name)
+    response_hooks = {"response": [cycle.on_response]}
+    ctx = BookingContext(location_config, current_profile, target_datetime=target_datetime)
+
+    if warm_state is not None:
+        session = warm_state.session
+        session.event_hooks["response"].append(cycle.on_response)
+        ctx.url, ctx.loc, ctx.step = warm_state.url, warm_state.loc, Step.SCHRITT_4
+        log_verbose(SCHRITT_2_LOGGER, "使用预热的 session，跳过 Schritt 2-3")
+    else:
+        session = create_session(event_hooks=response_hooks)
+    # 日志 Schritt 标签通过 ContextVar 传递，finally 中恢复
+    schritt_token = config.set_current_schritt(ctx.step.value)
+    # 某一步暂时失败时 BookingFlow 从出错的那一步重试，可能换新连接（cookies 保留）
+    flow = BookingFlow(session, lambda: create_session(event_hooks=response_hooks), on_slots=on_slots)
 
+    try:
+        # 整轮的时间预算，各 Schritt 的预算在 BookingFlow 中嵌套
+        with deadline.budget("cycle", config.CYCLE_BUDGET_SECONDS):
+            return flow.run(ctx)
     finally:
         # 确保session正确关闭
-        session.close()
+        flow.session.close()
+        config.reset_current_schritt(schritt_token)
+        if owns_cycle:
+            recorder.end_cycle(cycle)
 
 if __name__ == "__main__":
     setup_logging(force=True)
@@ -0,0 +1,279 @@
+"""
+预约流程状态机
+
+把 run_check 的 Schritt 2 → 6 建模为显式状态机。每一步的结果（url、loc、form_data、选中的时间、
+Schritt 5 的页面、session cookies）保存在 BookingContext 中，某一步暂时失败时（超时、
+"superC server error"、提交时间后没有进入 Schritt 5）直接从出错的那一步重试，
+不用关闭 session、等一个轮询间隔再从 Schritt 2 走起 —— 发现可用时间之后，重走 Schritt 2-4 的时间
+往往就是约上和错过的区别。
+
+提交选中时间的 POST 服务器最多收到一次（和 hedging 的安全规则一致）: 只有连接没有建立、请求没有发出，
+或者服务器明确返回 "superC server error" 时才重发同一个 form_data；读取超时、响应为空、5xx 时服务器
+可能已经处理了这次提交，回到 Schritt 4 按网站当前的状态重新读取可用时间，不盲目重发。
+
+状态转换:
+    Schritt 2 → Schritt 3 → Schritt 4 → Schritt 5 → Schritt 6 → 结束
+    Schritt 4 请求异常                      → 重试 Schritt 4（必要时换新连接，保留 cookies）
+    Schritt 5 请求未发出 / server error      → 重试 Schritt 5（同一个 form_data）
+    Schritt 5 超时 / 响应为空 / 5xx          → 回到 Schritt 4（超时和异常时换新连接）
+    Schritt 5 未进入 Schritt 5               → 回到 Schritt 4 重新读取可用时间
+每一步的重试次数由 config.BOOKING_STEP_RETRIES 限制，用完后返回和原来相同的结果。
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+
+from superc import config
+from superc.profile import Profile
+from superc.utils import deadline
+from superc.utils.slot_history import Sighting, get_slot_history_writer
+from superc.utils.slot_tracker import get_slot_tracker
+from superc.utils.page_navigation import (
+    enter_schritt_2_page,
+    enter_schritt_3_page,
+    enter_schritt_4_page,
+    enter_schritt_5_page,
+    enter_schritt_6_page,
+    log_verbose,
+)
+
+
+SCHRITT_2_LOGGER = logging.getLogger("schritt2")
+SCHRITT_3_LOGGER = logging.getLogger("schritt3")
+SCHRITT_4_LOGGER = logging.getLogger("schritt4")
+SCHRITT_5_LOGGER = logging.getLogger("schritt5")
+SCHRITT_6_LOGGER = logging.getLogger("schritt6")
+
+# (has_appointment, message, appointment_datetime)
+CheckResult = Tuple[bool, str, Optional[datetime]]
+
+
+class Step(str, Enum):
+    """状态机的状态，值与日志中的 Schritt 标签相同"""
+
+    SCHRITT_2 = "Schritt 2"
+    SCHRITT_3 = "Schritt 3"
+    SCHRITT_4 = "Schritt 4"
+    SCHRITT_5 = "Schritt 5"
+    SCHRITT_6 = "Schritt 6"
+
+
+@dataclass
+class BookingContext:
+    """一次预约流程的上下文，失败重试时从这里恢复"""
+
+    location_config: dict
+    profile: Optional[Profile]
+    target_datetime: Optional[datetime] = None
+    step: Step = Step.SCHRITT_2
+    url: Optional[str] = None
+    loc: Optional[str] = None
+    form_data: Optional[dict] = None
+    selected_profile: Optional[Profile] = None
+    appointment_datetime: Optional[datetime] = None
+    soup: Optional[object] = field(default=None, repr=False)
+    # 每一步成功后的 cookies 快照，换新连接时带上，网站端的会话状态不丢失
+    cookies: httpx.Cookies = field(default_factory=httpx.Cookies, repr=False)
+    attempts: Dict[Step, int] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+
+
+class StepFailed(Exception):
+    """
+    某一步暂时失败，可以从 resume_at 重试
+
+    Args:
+        result: 重试次数用完时 run_check 的返回值
+        resume_at: 从哪一步重试（默认为当前步）
+        new_connection: 重试前换新连接（保留 cookies）
+    """
+
+    def __init__(self, result: CheckResult, resume_at: Optional[Step] = None, new_connection: bool = False) -> None:
+        super().__init__(result[1])
+        self.result = result
+        self.resume_at = resume_at
+        self.new_connection = new_connection
+
+
+# Schritt 5 提交时间的请求没有发出，可以在新连接上原样重发
+_SCHRITT_5_UNSENT_PREFIX = "Schritt 5 POST请求未发出"
+# 请求已经发出但结果未知（服务器可能已经处理了这次提交），不重发，回到 Schritt 4
+_SCHRITT_5_UNKNOWN_PREFIXES = ("Schritt 5 POST请求超时", "Schritt 5 POST请求发生异常")
+_SCHRITT_5_REREAD_PREFIXES = ("Schritt 5 POST响应内容为空", "Schritt 5 POST请求失败，状态码: 5")
+
+
+def _record_poll(location: str, success: bool, message: str, latency: float) -> None:
+    """把一次 Schritt 4 轮询的结果交给后台写入 slot_history（只入队，不在 Schritt 5 之前写盘），失败不影响预约"""
+    if not config.ENABLE_SLOT_HISTORY:
+        return
+    if success or message.startswith("没有符合条件的预约时间"):
+        appointments = get_slot_tracker().last(location)
+        outcome, count = "slots", len(appointments)
+        earliest = min((a["datetime"] for a in appointments), default=None)
+    else:
+        outcome = "no_slot" if message == "当前没有可用预约时间" else "rate_limited" if "zu vieler" in message else "error"
+        count, earliest = 0, None
+    try:
+        if not get_slot_history_writer().submit(Sighting(datetime.now(), location, outcome, count, earliest, latency)):
+            SCHRITT_4_LOGGER.warning("可用时间观测记录队列已满，丢弃本次记录")
+    except Exception as e:
+        SCHRITT_4_LOGGER.error(f"写入可用时间观测记录失败: {e}")
+
+
+class BookingFlow:
+    """按 BookingContext.step 执行各个 Schritt，直到得到结果"""
+
+    def __init__(
+        self,
+        session: httpx.Client,
+        session_factory: Callable[[], httpx.Client],
+        retries: Optional[Dict[str, int]] = None,
+        on_slots=None,
+    ) -> None:
+        self.session = session
+        self._session_factory = session_factory
+        self.retries = config.BOOKING_STEP_RETRIES if retries is None else retries
+        self._on_slots = on_slots
+        self._handlers = {
+            Step.SCHRITT_2: self._schritt_2,
+            Step.SCHRITT_3: self._schritt_3,
+            Step.SCHRITT_4: self._schritt_4,
+            Step.SCHRITT_5: self._schritt_5,
+            Step.SCHRITT_6: self._schritt_6,
+        }
+
+    def run(self, ctx: BookingContext) -> CheckResult:
+        """
+        从 ctx.step 开始执行到结束
+        Input: ctx: BookingContext
+        Output: (has_appointment, message, appointment_datetime)
+        """
+        while True:
+            step = ctx.step
+            config.set_current_schritt(step.value)
+            try:
+                with deadline.budget(step.value):
+                    result = self._handlers[step](ctx)
+            except StepFailed as failure:
+                attempts = ctx.attempts[step] = ctx.attempts.get(step, 0) + 1
+                limit = self.retries.get(step.value, 0)
+                if attempts > limit:
+                    return failure.result
+                ctx.step = failure.resume_at or step
+                logging.getLogger(f"schritt{step.value[-1]}").warning(
+                    f"{step.value} 暂时失败: {failure}，立即从 {ctx.step.value} 重试 ({attempts}/{limit})"
+                )
+                if failure.new_connection:
+                    self._reconnect(ctx)
+                continue
+            ctx.cookies = httpx.Cookies(self.session.cookies)
+            if result is not None:
+                return result
+
+    def _reconnect(self, ctx: BookingContext) -> None:
+        """关闭可能已损坏的连接，用新连接继续，cookies 从上下文恢复"""
+        old, self.session = self.session, self._session_factory()
+        self.session.cookies.update(ctx.cookies)
+        try:
+            old.close()
+        except Exception:
+            pass
+
+    # ------------------------------------------------------------------
+    # Steps: 返回 None 表示进入 ctx.step 指定的下一步，返回结果表示流程结束
+    # ------------------------------------------------------------------
+
+    def _schritt_2(self, ctx: BookingContext) -> Optional[CheckResult]:
+        # 进入Schritt 2页面并完成操作
+        log_verbose(SCHRITT_2_LOGGER, "=== 进入Schritt 2页面 ===")
+        success, url = enter_schritt_2_page(self.session, ctx.location_config["selection_text"])
+        if not success:
+            SCHRITT_2_LOGGER.error(f"Schritt 2页面失败: {url}")
+            return False, url, None
+        ctx.url, ctx.step = url, Step.SCHRITT_3
+        return None
+
+    def _schritt_3(self, ctx: BookingContext) -> Optional[CheckResult]:
+        # 进入Schritt 3页面并完成操作
+        log_verbose(SCHRITT_3_LOGGER, "=== 进入Schritt 3页面 ===")
+        success, loc = enter_schritt_3_page(self.session, ctx.url)
+        if not success:
+            SCHRITT_3_LOGGER.error(f"Schritt 3 页面: {loc}")
+            return False, str(loc), None
+        ctx.loc, ctx.step = loc, Step.SCHRITT_4
+        return None
+
+    def _schritt_4(self, ctx: BookingContext) -> Optional[CheckResult]:
+        # 进入Schritt 4页面并完成操作
+        log_verbose(SCHRITT_4_LOGGER, "=== 进入Schritt 4页面 ===")
+        location_name = ctx.location_config["name"]
+        started = time.monotonic()
+        success, message, form_data, selected_profile, appointment_datetime = enter_schritt_4_page(
+            self.session, ctx.url, ctx.loc, ctx.location_config["submit_text"], location_name, ctx.profile,
+            target_datetime=ctx.target_datetime, on_slots=self._on_slots,
+        )
+        if ctx.target_datetime is None:  # 并行预约的查询不是独立的轮询，不记录
+            _record_poll(location_name, success, message, time.monotonic() - started)
+        if not success:
+            if message.startswith("Schritt 4 请求发生异常"):
+                raise StepFailed((False, message, None), new_connection=True)
+            if message.startswith("Schritt 4 请求失败，状态码: 5"):
+                raise StepFailed((False, message, None))
+            # cycle_seconds 供心跳聚合统计单轮耗时
+            SCHRITT_4_LOGGER.info(f"Schritt 4 page: {message}", extra={"cycle_seconds": time.monotonic() - ctx.started})
+            return False, message, None
+
+        SCHRITT_4_LOGGER.info(f"Schritt 4  page 有预约: {message}")
+        ctx.form_data, ctx.selected_profile, ctx.appointment_datetime = form_data, selected_profile, appointment_datetime
+        ctx.step = Step.SCHRITT_5
+        return None
+
+    def _schritt_5(self, ctx: BookingContext) -> Optional[CheckResult]:
+        # 进入Schritt 5页面并完成所有操作：提交预约选择 + 填写表单
+        # form_data 里面包含了所有信息，appointment_datetime 只是为了显示用。
+        log_verbose(SCHRITT_5_LOGGER, "=== 进入Schritt 5页面 ===")
+        if ctx.form_data is None or ctx.selected_profile is None:
+            return True, "内部错误：form_data或selected_profile为空", None
+
+        location_name = ctx.location_config["name"]
+        success, message, soup = enter_schritt_5_page(self.session, ctx.form_data, location_name, ctx.selected_profile)
+
+        if message == "superC server error":
+            # 服务器明确返回处理失败，这次提交没有生效，可以重发
+            raise StepFailed((True, message, None))
+
+        if not success:
+            if message.startswith(_SCHRITT_5_UNSENT_PREFIX):
+                raise StepFailed((True, message, None), new_connection=True)
+            if message.startswith(_SCHRITT_5_UNKNOWN_PREFIXES):
+                raise StepFailed((True, message, None), resume_at=Step.SCHRITT_4, new_connection=True)
+            if message.startswith(_SCHRITT_5_REREAD_PREFIXES):
+                raise StepFailed((True, message, None), resume_at=Step.SCHRITT_4)
+            if message.startswith("Schritt 5 失败: 提交时间后未进入Schritt 5"):
+                # 选中的时间可能已被别人约走，回到 Schritt 4 重新读取可用时间
+                raise StepFailed((True, message, None), resume_at=Step.SCHRITT_4)
+            SCHRITT_5_LOGGER.error(f"Schritt 5页面失败: {message}")
+            return True, message, None
+
+        ctx.soup, ctx.step = soup, Step.SCHRITT_6
+        return None
+
+    def _schritt_6(self, ctx: BookingContext) -> Optional[CheckResult]:
+        # 进入Schritt 6页面并完成操作：邮件确认
+        log_verbose(SCHRITT_6_LOGGER, "=== 进入Schritt 6页面 ===")
+        if ctx.soup is None:
+            return True, "内部错误：soup为空", None
+
+        success, message = enter_schritt_6_page(self.session, ctx.soup, ctx.location_config["name"])
+        if success:
+            # 这是关键信息，始终输出
+            SCHRITT_6_LOGGER.info(f"预约成功完成: {message}")
+            return True, message, ctx.appointment_datetime
+        SCHRITT_6_LOGGER.error(f"Schritt 6 失败: {message}")
+        return True, message, None
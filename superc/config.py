@@ -1,6 +1,8 @@
+import contextvars
 import logging
-import re
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Iterator, Optional
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
 BASE_URL = "https://termine.staedteregion-aachen.de/auslaenderamt/"
@@ -15,26 +17,64 @@ ENABLE_SUPABASE_LOGS = True
 VERBOSE_LOGGING = False
 # VERBOSE_LOGGING = True
 
+# 心跳聚合 - 空闲轮询产生的重复 INFO 日志折叠成周期性汇总，状态变化（发现预约、错误、限流）立即输出
+ENABLE_HEARTBEAT_AGGREGATION = True
+# 汇总输出间隔（秒）
+HEARTBEAT_SUMMARY_INTERVAL = 600
+# 命中这些文本的 INFO 日志视为心跳
+HEARTBEAT_MARKERS = ("当前没有可用预约时间",)
 
-_SCHRITT_PATTERN = re.compile(r"(Schritt\s*\d+)")
+
+# 当前所处的 Schritt，由 run_check / enter_schritt_* 设置。
+# ContextVar 对每个线程 / asyncio task 独立，日志记录时 O(1) 读取，不需要格式化消息再做正则匹配。
+_CURRENT_SCHRITT: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("superc_schritt", default=None)
 _PREVIOUS_FACTORY = logging.getLogRecordFactory()
 
 
 def _inject_schritt(*factory_args, **factory_kwargs):
     record = _PREVIOUS_FACTORY(*factory_args, **factory_kwargs)
-    try:
-        message = record.getMessage()
-    except Exception:
-        message = ""
-
-    match = _SCHRITT_PATTERN.search(message) if isinstance(message, str) else None
-    if match:
-        record.schritt = match.group(1)
-    else:
-        record.schritt = record.name or DEFAULT_SCHRITT
+    record.schritt = _CURRENT_SCHRITT.get() or record.name or DEFAULT_SCHRITT
     return record
 
 
+def get_current_schritt() -> Optional[str]:
+    """返回当前上下文的 Schritt 标签（未设置时为 None）"""
+    return _CURRENT_SCHRITT.get()
+
+
+def set_current_schritt(schritt: Optional[str]) -> contextvars.Token:
+    """
+    设置当前上下文的 Schritt 标签
+
+    Returns:
+        contextvars.Token: 传给 reset_current_schritt 以恢复之前的值
+    """
+    return _CURRENT_SCHRITT.set(schritt)
+
+
+def reset_current_schritt(token: contextvars.Token) -> None:
+    """恢复 set_current_schritt 之前的 Schritt 标签"""
+    _CURRENT_SCHRITT.reset(token)
+
+
+@contextmanager
+def schritt_scope(schritt: str) -> Iterator[None]:
+    """
+    在 with 块 / 被装饰函数执行期间把日志标记为指定 Schritt
+
+    Usage:
+        with schritt_scope("Schritt 4"): ...
+
+        @schritt_scope("Schritt 4")
+        def enter_schritt_4_page(...): ...
+    """
+    token = _CURRENT_SCHRITT.set(schritt)
+    try:
+        yield
+    finally:
+        _CURRENT_SCHRITT.reset(token)
+
+
 logging.setLogRecordFactory(_inject_schritt)
 
 # 地点特有配置
@@ -53,7 +93,122 @@ LOCATIONS = {
 
 # Appointment cutoff date (only accept appointments strictly before this date)
 # 只接受严格早于此日期的预约
+# 设为 None 表示不限；每个用户自己的日期范围见 appointment_profiles.earliest_date / latest_date（superc/matching.py）
 # APPOINTMENT_CUTOFF_DATE = datetime.strptime("17.11.2025", "%d.%m.%Y").date()
+APPOINTMENT_CUTOFF_DATE = None
+
+# 飞行记录器 - 内存中保留最近几轮 run_check 的请求/响应和页面，只在异常结果时写盘
+FLIGHT_RECORDER_CYCLES = 5
+# 所有缓存轮次的内容总大小上限（字节）
+FLIGHT_RECORDER_MAX_BYTES = 8 * 1024 * 1024
+# 单个响应/页面最多保留的字节数
+FLIGHT_RECORDER_MAX_BODY_BYTES = 512 * 1024
+FLIGHT_RECORDER_DIR = "data/flight_recorder"
+# 是否每次都把页面快照写入页面归档（默认只进飞行记录器）
+PAGE_ARCHIVE_ALWAYS = False
+# 是否每次都把验证码图片写入 data/<location>/captcha（默认只进飞行记录器）
+SAVE_CAPTCHA_IMAGES = False
+
+# 页面快照归档 - 后台线程 gzip 压缩写入，按内容哈希去重，预约线程只负责入队
+PAGE_ARCHIVE_DIR = "data/pages"
+# 每个地点目录的快照总大小上限（字节），超出后删除最旧的快照
+PAGE_ARCHIVE_MAX_BYTES = 200 * 1024 * 1024
+# 快照保留天数
+PAGE_ARCHIVE_MAX_AGE_DAYS = 30
+# 每个地点每写入多少次快照按保留天数清理一次（归档线程启动时也会清理一次）
+PAGE_ARCHIVE_RETENTION_EVERY = 100
+# 待写入队列长度，队列满时丢弃新快照而不是阻塞预约流程
+PAGE_ARCHIVE_QUEUE_SIZE = 256
+
+# 等待队列监听 - 通过 Postgres LISTEN/NOTIFY 维护本地等待队列，新注册用户无需重启即可处理
+# 需要先执行 python -m db.queue_listener --install-trigger；监听不可用时回退为轮询数据库
+ENABLE_QUEUE_LISTENER = True
+# 队列为空时等待新用户的单次超时（秒），超时后检查是否到了自动退出时间
+QUEUE_WAIT_TIMEOUT = 60
+
+# 多 worker 租约 - 每个 worker 通过 claim_waiting_profile 认领不同的用户并定期续约
+# 需要先执行 db/ddl_profile_leases.sql 添加 claimed_by / lease_expires_at 列（python -m db.migrate --profiles），启动时会检查
+ENABLE_PROFILE_LEASES = True
+# 租约时长（秒），worker 崩溃后最多这么久其用户会被其他 worker 接管
+PROFILE_LEASE_SECONDS = 300
+
+# 紧急程度抢占 - 等待队列中出现比当前用户更紧急的用户（priority / 居留许可到期日，见 db/ddl_profile_urgency.sql）时，
+# 下一轮改为处理它；依赖等待队列监听的本地视图
+ENABLE_URGENCY_PREEMPTION = True
+
+# 发件箱 - 预约结果的副作用（数据库状态、邮件）先写入本地 SQLite，由后台线程投递并重试
+# 设为 False 时在主循环中同步执行（旧行为）
+ENABLE_OUTBOX = True
+OUTBOX_PATH = "data/outbox.sqlite3"
+# 单个条目最多尝试次数，超过后标记为 dead 并记录错误日志
+OUTBOX_MAX_ATTEMPTS = 8
+# 重试间隔：base * 2^(n-1)，不超过 max（秒）
+OUTBOX_RETRY_BASE_SECONDS = 5
+OUTBOX_RETRY_MAX_SECONDS = 600
+
+# 并行预约 - Schritt 4 看到多个可用时间时，把其余时间分配给其他等待中的用户，各自在独立 session 中同时提交
+ENABLE_FANOUT = True
+# 每次最多额外为多少个用户并行预约
+FANOUT_MAX_PROFILES = 3
+# 每个并行预约用户大约需要的请求数（Schritt 2-4 + 提交时间 + 验证码 + 确认），按令牌桶余量限制并行人数
+FANOUT_REQUESTS_PER_PROFILE = 8
+# 并行预约不能动用的令牌数，留给当前用户的 Schritt 5/6
+FANOUT_RESERVED_TOKENS = 4
+
+# 时间预算 - 替代统一的 30 秒超时（见 superc/utils/deadline.py）
+# 一轮检查（Schritt 2-6）的总预算（秒）
+CYCLE_BUDGET_SECONDS = 240
+# 每个 Schritt 的预算: total 为整步用时，connect / read 为单个请求建立连接 / 等待响应的上限，
+# 都不超过外层剩余的预算。Schritt 5 包含验证码识别和最多 10 次表单提交，预算最宽
+STEP_BUDGETS = {
+    "Schritt 2": {"total": 10, "connect": 3, "read": 8},
+    "Schritt 3": {"total": 10, "connect": 3, "read": 8},
+    "Schritt 4": {"total": 20, "connect": 3, "read": 15},
+    "Schritt 5": {"total": 180, "connect": 5, "read": 30},
+    "Schritt 6": {"total": 30, "connect": 5, "read": 20},
+}
+
+# 可用时间观测记录 - 每次 Schritt 4 轮询的结果（时间、可用时间数、最早时间、用时）追加到列式文件，
+# 用于分析放号规律（python -m superc.utils.slot_history heatmap superc --since 30d）
+ENABLE_SLOT_HISTORY = True
+SLOT_HISTORY_DIR = "data/slot_history"
+# 后台写入队列长度，队列满时丢弃新记录而不是阻塞预约流程
+SLOT_HISTORY_QUEUE_SIZE = 1024
+
+# 预约流程失败重试 - 某一步暂时失败（超时、superC server error 等）时立即重试的次数（Schritt 5 的提交结果未知时回到 Schritt 4），
+# 不关闭 session 从 Schritt 2 重来（见 superc/booking_flow.py），未列出的步骤不重试
+BOOKING_STEP_RETRIES = {"Schritt 4": 1, "Schritt 5": 2}
+
+# 对冲请求 - Schritt 4 查询 / Schritt 5 提交超过历史延迟分位数仍未响应时，在另一个连接上发出相同请求，
+# 先到的响应生效（非幂等的 Schritt 5 只在原请求还没发出时对冲，见 superc/utils/hedging.py）
+ENABLE_HEDGING = False
+# 对冲延迟取该步骤最近 HEDGE_WINDOW 次延迟的分位数，样本少于 HEDGE_MIN_SAMPLES 时不对冲
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+# 对冲延迟下限（秒）
+HEDGE_MIN_DELAY_SECONDS = 1.0
+# 每个步骤对冲请求占请求总数的上限
+HEDGE_MAX_RATIO = 0.1
+
+# 放号前预热 - 在放号时刻前提前建立连接并走完 Schritt 2-3，放号时第一次 Schritt 4 查询直接用热连接
+ENABLE_PREWARM = True
+# 已知的放号时刻（HH:MM，本地时间）
+PREWARM_RELEASE_TIMES = ["07:00", "08:00"]
+# 提前多少秒开始预热（需要覆盖 Schritt 2-3 的耗时，又不能早到 session 过期）
+PREWARM_LEAD_SECONDS = 45
+# 从运行日志中学习其他放号时刻（"没有预约" -> "发现可用预约" 出现最多的分钟），设为 None 关闭
+PREWARM_LEARN_FROM_LOG = "superc.log"
+
+# 请求限速 - 所有发往预约网站的请求先从令牌桶取令牌，同一出口身份（环境变量 SUPERC_EGRESS_ID）的 worker 共享一个桶
+ENABLE_RATE_GOVERNOR = True
+RATE_GOVERNOR_DIR = "data/rate_governor"
+# 每个出口身份的限额: per_minute 补充速度，burst 查询可用的突发容量，booking_burst 为 Schritt 5/6 预留的令牌
+RATE_LIMITS = {
+    "default": {"per_minute": 30, "burst": 10, "booking_burst": 10},
+}
+# 网站提示 "zu vieler Terminanfragen" 后同一出口暂停请求的秒数
+RATE_LIMIT_PENALTY_SECONDS = 120
 
 # CAPTCHA 文件路径配置
 CAPTCHA_BASE_DIR = "data"
@@ -0,0 +1,320 @@
+"""
+Persistent SMTP mailer with a background send queue.
+
+SMTP configuration is read from the environment once. A single authenticated
+connection is kept open and reused across messages, and is re-established
+transparently when the server drops it. Messages are handed to a background
+thread; whatever is queued when it wakes up is sent as one batch over the
+same connection, so a burst of notifications does not pay for a TCP/TLS
+handshake and login per mail. The connection is closed after an idle period.
+
+Input types:
+- message: email.message.Message - Fully composed message (see notify_email._build_base_message)
+
+Output types:
+- submit() returns concurrent.futures.Future[bool]; send() returns bool
+"""
+
+import logging
+import os
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from email.message import Message
+from typing import Callable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+
+logger = logging.getLogger("notify_email")
+
+# Errors after which the connection is considered dead and the message is retried on a new one
+# (smtplib.SMTPException is an OSError; server rejections are handled before these)
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, OSError)
+
+
+@dataclass(frozen=True)
+class SmtpConfig:
+    """SMTP connection settings resolved from environment variables."""
+
+    server: str
+    port: int
+    user: str
+    password: str
+    sender: str
+    encryption_mode: str  # 'SSL' | 'STARTTLS' | 'NONE'
+    timeout: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> Optional["SmtpConfig"]:
+        """Build config from SMTP_* variables.
+
+        Output types:
+        - Optional[SmtpConfig] - None when SMTP_SERVER / SMTP_USER / SMTP_PASSWORD are missing
+        """
+        load_dotenv()
+        server = os.getenv('SMTP_SERVER')
+        user = os.getenv('SMTP_USER')
+        password = os.getenv('SMTP_PASSWORD')
+        if not server or not user or not password:
+            return None
+        port = int(os.getenv('SMTP_PORT', '465'))
+        return cls(
+            server=server,
+            port=port,
+            user=user,
+            password=password,
+            sender=os.getenv('SMTP_SENDER') or user,
+            encryption_mode=resolve_encryption_mode(os.getenv('SMTP_ENCRYPTION', ''), port),
+            timeout=float(os.getenv('SMTP_TIMEOUT', '10')),
+        )
+
+
+def resolve_encryption_mode(encryption: str, port: int) -> str:
+    """Map SMTP_ENCRYPTION to 'SSL', 'STARTTLS' or 'NONE'.
+
+    Input types:
+    - encryption: str - Raw SMTP_ENCRYPTION value ('SSL', 'TLS', 'STARTTLS', 'NONE', ... or empty)
+    - port: int - SMTP port, used to guess when encryption is not set
+
+    Output types:
+    - str - Normalised encryption mode
+    """
+    encryption = (encryption or '').strip().upper()
+    if not encryption:
+        # 465 is implicit TLS; default to STARTTLS for common ports like 587/25
+        return 'SSL' if port == 465 else 'STARTTLS'
+    if encryption in ('TLS', 'STARTTLS'):
+        return 'STARTTLS'
+    if encryption in ('SSL', 'SMTPS'):
+        return 'SSL'
+    if encryption in ('NONE', 'PLAINTEXT'):
+        return 'NONE'
+    logger.warning(f"未知的 SMTP_ENCRYPTION 值: {encryption}，将回退为 STARTTLS")
+    return 'STARTTLS'
+
+
+def open_smtp_connection(config: SmtpConfig) -> smtplib.SMTP:
+    """Open and authenticate an SMTP connection according to config.
+
+    Input types:
+    - config: SmtpConfig
+
+    Output types:
+    - smtplib.SMTP - Logged-in connection
+    """
+    context = ssl.create_default_context()
+    if config.encryption_mode == 'SSL':
+        server = smtplib.SMTP_SSL(config.server, config.port, timeout=config.timeout, context=context)
+    else:
+        server = smtplib.SMTP(config.server, config.port, timeout=config.timeout)
+        # Be explicit with EHLO for better compatibility
+        server.ehlo()
+        if config.encryption_mode == 'STARTTLS':
+            server.starttls(context=context)
+            server.ehlo()
+    try:
+        server.login(config.user, config.password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+_STOP = object()
+
+
+class SmtpMailer:
+    """Reuses one authenticated SMTP connection and sends queued messages in batches."""
+
+    def __init__(
+        self,
+        config: SmtpConfig,
+        connection_factory: Callable[[SmtpConfig], smtplib.SMTP] = open_smtp_connection,
+        batch_size: int = 20,
+        idle_timeout: float = 60.0,
+        noop_after: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.config = config
+        self._connection_factory = connection_factory
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self._clock = clock
+        self._queue: "queue.Queue" = queue.Queue()
+        self._connection: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def submit(self, message: Message) -> "Future[bool]":
+        """Queue a message for the background sender.
+
+        Output types:
+        - Future[bool] - Resolves to True when the server accepted the message
+        """
+        future: "Future[bool]" = Future()
+        self._ensure_started()
+        self._queue.put((message, future))
+        return future
+
+    def send(self, message: Message, timeout: Optional[float] = None) -> bool:
+        """Queue a message and wait for the result.
+
+        Input types:
+        - timeout: Optional[float] - Seconds to wait; None waits until the sender has handled it
+          (every socket operation is already bounded by SmtpConfig.timeout)
+
+        Output types:
+        - bool - True if sent successfully, False on failure or timeout
+        """
+        try:
+            return self.submit(message).result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"等待邮件发送结果超时或失败: {e}")
+            return False
+
+    def close(self) -> None:
+        """Stop the background sender and close the connection."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=self.config.timeout + 1)
+        self._disconnect()
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="smtp-mailer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # No traffic for a while: release the connection instead of letting the server time it out
+                self._disconnect()
+                continue
+            if item is _STOP:
+                return
+
+            batch: List[Tuple[Message, Future]] = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is _STOP:
+                    stop = True
+                    break
+                batch.append(extra)
+
+            self._send_batch(batch)
+            if stop:
+                return
+
+    def _send_batch(self, batch: List[Tuple[Message, Future]]) -> None:
+        if len(batch) > 1:
+            logger.info(f"批量发送 {len(batch)} 封邮件（复用同一 SMTP 连接）")
+        for message, future in batch:
+            if future.set_running_or_notify_cancel():
+                future.set_result(self._send_one(message))
+
+    def _send_one(self, message: Message) -> bool:
+        recipient = message.get('To', '')
+        for attempt in (1, 2):
+            try:
+                connection = self._get_connection()
+                connection.send_message(message)
+                self._last_used = self._clock()
+                logger.info(f"邮件发送成功: {recipient}")
+                return True
+            except smtplib.SMTPAuthenticationError as e:
+                logger.error(f"SMTP 认证失败: {e}")
+                self._disconnect()
+                return False
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                # Rejected by the server (bad recipient, content, ...): the connection is still usable
+                logger.error(f"服务器拒绝邮件 {recipient}: {e}")
+                return False
+            except _CONNECTION_ERRORS as e:
+                # The server closed an idle/pooled connection: reconnect once and retry this message
+                self._disconnect()
+                if attempt == 2:
+                    logger.error(f"发送邮件时发生错误: {e}")
+                    return False
+                logger.info(f"SMTP 连接已断开，重新连接后重试: {e}")
+            except Exception as e:
+                logger.error(f"发送邮件时发生错误: {e}", exc_info=True)
+                return False
+        return False
+
+    def _get_connection(self) -> smtplib.SMTP:
+        if self._connection is not None and self._clock() - self._last_used > self.noop_after:
+            # Cheap liveness check before reusing a connection that has been idle for a while
+            try:
+                status, _ = self._connection.noop()
+                if status != 250:
+                    self._disconnect()
+            except Exception:
+                self._disconnect()
+        if self._connection is None:
+            logger.info(f"建立 SMTP 连接 (加密: {self.config.encryption_mode}, 服务器: {self.config.server}:{self.config.port})")
+            self._connection = self._connection_factory(self.config)
+            self._last_used = self._clock()
+        return self._connection
+
+    def _disconnect(self) -> None:
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+_mailer: Optional[SmtpMailer] = None
+_mailer_lock = threading.Lock()
+_config_missing = False
+
+
+def get_mailer() -> Optional[SmtpMailer]:
+    """
+    Process-wide mailer, configured from the environment on first use.
+    Input: None
+    Output: Optional[SmtpMailer] - None when SMTP configuration is incomplete
+    """
+    global _mailer, _config_missing
+    if _mailer is not None or _config_missing:
+        return _mailer
+    with _mailer_lock:
+        if _mailer is None and not _config_missing:
+            config = SmtpConfig.from_env()
+            if config is None:
+                _config_missing = True
+                logger.warning("SMTP 配置不完整，跳过邮件发送")
+                logger.warning("请在 .env 文件中配置 SMTP_SERVER, SMTP_USER, SMTP_PASSWORD")
+                return None
+            logger.info(f"SMTP 配置: {config.server}:{config.port} 用户 {config.user} 发件人 {config.sender} (加密: {config.encryption_mode})")
+            _mailer = SmtpMailer(config)
+    return _mailer
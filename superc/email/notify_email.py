@@ -18,21 +18,107 @@ Output types:
 python3 -m superc.email.notify_email
 """
 
-import smtplib
-import ssl
 import logging
 import os
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
-from dotenv import load_dotenv
+from email.mime.nonmultipart import MIMENonMultipart
+from typing import Callable, Dict, List, Tuple, TypeVar
 
-# Load environment variables
-load_dotenv()
+from superc.email.mailer import get_mailer
 
 # Configure logger
 logger = logging.getLogger("notify_email")
 
+# Directory holding the HTML templates and inline images
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Inline images referenced by the booking template as cid:<content-id>
+INLINE_IMAGES = [
+    ("wechat.png", 'wechat_qr'),
+    ("pp.png", 'paypal_qr'),
+    ("confirm.jpg", 'confirm_img'),
+    ("code.jpg", 'code_img'),
+]
+
+T = TypeVar("T")
+
+# path -> ((mtime_ns, size), loaded value); entries are reloaded when the file changes on disk
+_asset_cache: Dict[str, Tuple[Tuple[int, int], object]] = {}
+_asset_cache_lock = threading.Lock()
+
+
+def _load_cached(path: str, loader: Callable[[str], T]) -> T:
+    """Load a file through loader once and reuse the result until its mtime/size changes.
+    
+    Input types:
+    - path: str - File path
+    - loader: Callable[[str], T] - Builds the cached value from the path
+    
+    Output types:
+    - T - Cached value (raises OSError if the file does not exist)
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _asset_cache_lock:
+        cached = _asset_cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    value = loader(path)
+    with _asset_cache_lock:
+        _asset_cache[path] = (version, value)
+    return value
+
+
+def _read_text(path: str) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _read_template(filename: str) -> str:
+    """Return the cached content of an HTML template in ASSET_DIR."""
+    return _load_cached(os.path.join(ASSET_DIR, filename), _read_text)
+
+
+def _encode_image(path: str) -> Tuple[str, str]:
+    """Read and base64-encode an image once.
+    
+    Output types:
+    - Tuple[str, str] - (image subtype, base64 payload)
+    """
+    filename = os.path.basename(path)
+    with open(path, 'rb') as f:
+        img_data = f.read()
+    # Force jpeg subtype for .jpg files
+    subtype = 'jpeg' if filename.lower().endswith(('.jpg', '.jpeg')) else None
+    image_part = MIMEImage(img_data, _subtype=subtype) if subtype else MIMEImage(img_data)
+    return image_part.get_content_subtype(), image_part.get_payload()
+
+
+def _inline_image_parts() -> List[MIMENonMultipart]:
+    """Inline image parts for the booking email, built from cached pre-encoded payloads.
+    
+    Output types:
+    - List[MIMENonMultipart] - Fresh parts per message sharing the cached base64 payload strings
+    """
+    parts = []
+    for filename, cid in INLINE_IMAGES:
+        path = os.path.join(ASSET_DIR, filename)
+        try:
+            subtype, payload = _load_cached(path, _encode_image)
+        except FileNotFoundError:
+            logger.debug(f"Inline image not found (optional): {path}")
+            continue
+        image_part = MIMENonMultipart('image', subtype)
+        image_part.set_payload(payload)
+        image_part['Content-Transfer-Encoding'] = 'base64'
+        image_part.add_header('Content-ID', f'<{cid}>')
+        image_part.add_header('Content-Disposition', 'inline', filename=filename)
+        parts.append(image_part)
+    return parts
+
 
 def _build_base_message(subject: str, user_email: str, smtp_sender: str, html_body: str, attach_donation_images: bool = True) -> MIMEMultipart:
     """Internal helper to construct MIME email message.
@@ -62,25 +148,7 @@ def _build_base_message(subject: str, user_email: str, smtp_sender: str, html_bo
 
     # Attach donation / reference images if available
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        image_specs = [
-            ("wechat.png", 'wechat_qr'),
-            ("pp.png", 'paypal_qr'),
-            ("confirm.jpg", 'confirm_img'),
-            ("code.jpg", 'code_img'),
-        ]
-        for filename, cid in image_specs:
-            path = os.path.join(current_dir, filename)
-            if not os.path.exists(path):
-                logger.debug(f"Inline image not found (optional): {path}")
-                continue
-            with open(path, 'rb') as f:
-                img_data = f.read()
-            # Force jpeg subtype for .jpg files
-            subtype = 'jpeg' if filename.lower().endswith(('.jpg', '.jpeg')) else None
-            image_part = MIMEImage(img_data, _subtype=subtype) if subtype else MIMEImage(img_data)
-            image_part.add_header('Content-ID', f'<{cid}>')
-            image_part.add_header('Content-Disposition', 'inline', filename=filename)
+        for image_part in _inline_image_parts():
             message.attach(image_part)
     except Exception as e:
         logger.warning(f"添加图片时发生错误(可忽略): {e}")
@@ -106,11 +174,7 @@ def get_email_content(appointment_info: dict) -> tuple[str, str]:
     
     # Read HTML template from file
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(current_dir, 'email_template.html')
-        
-        with open(template_path, 'r', encoding='utf-8') as f:
-            html_template = f.read()
+        html_template = _read_template('email_template.html')
         
         # Format the template with appointment information
         html_body = html_template.format(
@@ -157,7 +221,7 @@ def save_email_html(appointment_info: dict, output_dir: str = "data/email_output
         subject, html_body = get_email_content(appointment_info)
         
         # For HTML preview, replace cid: references with actual file paths
-        current_dir = os.path.dirname(os.path.abspath(__file__))
+        current_dir = ASSET_DIR
         wechat_path = os.path.join(current_dir, 'wechat.png')
         paypal_path = os.path.join(current_dir, 'pp.png')
         confirm_path = os.path.join(current_dir, 'confirm.jpg')
@@ -193,6 +257,8 @@ def send_notify_email(user_email: str, appointment_info: dict) -> bool:
     """
     Send notification email to user after successful appointment booking.
     
+    The message is sent through the shared SmtpMailer (persistent connection, background queue).
+    
     Input types:
     - user_email: str - The email address of the user to notify
     - appointment_info: dict - Dictionary containing appointment details
@@ -205,35 +271,8 @@ def send_notify_email(user_email: str, appointment_info: dict) -> bool:
     - bool - True if email sent successfully, False otherwise
     """
     try:
-        # Get SMTP configuration from environment variables
-        smtp_server_env = os.getenv('SMTP_SERVER')
-        smtp_user_env = os.getenv('SMTP_USER')
-        smtp_password_env = os.getenv('SMTP_PASSWORD')
-        smtp_sender_env = os.getenv('SMTP_SENDER')
-        smtp_port = int(os.getenv('SMTP_PORT', '465'))
-        # Validate presence before use to satisfy type checker
-        if not smtp_server_env or not smtp_user_env or not smtp_password_env:
-            logger.warning("SMTP 配置不完整，跳过邮件发送")
-            return False
-        smtp_server: str = smtp_server_env
-        smtp_user: str = smtp_user_env
-        smtp_password: str = smtp_password_env
-        smtp_sender: str = smtp_sender_env or smtp_user
-        print("SMTP_SERVER:", smtp_server)
-        print("SMTP_PORT:", smtp_port)
-        print("SMTP_USER:", smtp_user)
-        # print("SMTP_PASSWORD:", smtp_password)
-        print("SMTP_SENDER:", smtp_sender)
-
-        # Encryption: 'SSL' (implicit TLS/SMTPS) or 'STARTTLS' (explicit TLS). 'TLS' will be treated as STARTTLS.
-        encryption = os.getenv('SMTP_ENCRYPTION', '').strip().upper()
-        # Timeout in seconds for network operations
-        timeout = float(os.getenv('SMTP_TIMEOUT', '10'))
-        
-        # Validate required configuration
-        if not all([smtp_server, smtp_user, smtp_password]):
-            logger.warning("SMTP 配置不完整，跳过邮件发送")
-            logger.warning("请在 .env 文件中配置 SMTP_SERVER, SMTP_USER, SMTP_PASSWORD")
+        mailer = get_mailer()
+        if mailer is None:
             return False
         
         # Validate email address
@@ -245,56 +284,11 @@ def send_notify_email(user_email: str, appointment_info: dict) -> bool:
         subject, html_body = get_email_content(appointment_info)
         
         # Create message (with donation images)
-        message = _build_base_message(subject, user_email, smtp_sender, html_body, attach_donation_images=True)
+        message = _build_base_message(subject, user_email, mailer.config.sender, html_body, attach_donation_images=True)
         
-        # Determine encryption method
-        # Heuristics if not explicitly set
-        if not encryption:
-            if smtp_port == 465:
-                encryption_mode = 'SSL'
-            else:
-                # Default to STARTTLS for common ports like 587/25 when unspecified
-                encryption_mode = 'STARTTLS'
-        elif encryption in ('TLS', 'STARTTLS'):
-            encryption_mode = 'STARTTLS'
-        elif encryption in ('SSL', 'SMTPS'):
-            encryption_mode = 'SSL'
-        elif encryption in ('NONE', 'PLAINTEXT'):
-            encryption_mode = 'NONE'
-        else:
-            logger.warning(f"未知的 SMTP_ENCRYPTION 值: {encryption}，将回退为 STARTTLS")
-            encryption_mode = 'STARTTLS'
-
-        logger.info(f"正在向 {user_email} 发送预约确认邮件... (加密: {encryption_mode}, 服务器: {smtp_server}:{smtp_port})")
-
-        # Create secure default SSL context
-        context = ssl.create_default_context()
-
-        # Send email with the chosen encryption method
-        if encryption_mode == 'SSL':
-            with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=timeout, context=context) as server:
-                server.login(smtp_user, smtp_password)
-                server.send_message(message)
-        elif encryption_mode == 'STARTTLS':
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=timeout) as server:
-                # Be explicit with EHLO for better compatibility
-                server.ehlo()
-                server.starttls(context=context)
-                server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(message)
-        else:  # NONE (not recommended, but offered for special/dev scenarios)
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=timeout) as server:
-                server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(message)
+        logger.info(f"正在向 {user_email} 发送预约确认邮件...")
+        return mailer.send(message)
         
-        logger.info(f"邮件发送成功: {user_email}")
-        return True
-        
-    except smtplib.SMTPAuthenticationError as e:
-        logger.error(f"SMTP 认证失败: {e}")
-        return False
     except Exception as e:
         logger.error(f"发送邮件时发生错误: {e}", exc_info=True)
         return False
@@ -312,10 +306,7 @@ def get_update_email_notice_content(name: str) -> tuple[str, str]:
     display_name = name or '用户'
     subject = "📬 邮箱需要更新 - 请尽快处理"
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(current_dir, 'email_update_required.html')
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template = f.read()
+        template = _read_template('email_update_required.html')
         html_body = template.format(name=display_name)
     except Exception as e:
         logger.error(f"读取邮箱更新提醒模板失败: {e}")
@@ -347,22 +338,8 @@ def send_update_email_notice(user_email: str, name: str) -> bool:
     - bool - True if sent successfully else False
     """
     try:
-        smtp_server_env = os.getenv('SMTP_SERVER')
-        smtp_user_env = os.getenv('SMTP_USER')
-        smtp_password_env = os.getenv('SMTP_PASSWORD')
-        smtp_sender_env = os.getenv('SMTP_SENDER')
-        smtp_port = int(os.getenv('SMTP_PORT', '465'))
-        if not smtp_server_env or not smtp_user_env or not smtp_password_env:
-            logger.warning("SMTP 配置不完整，跳过邮箱更新提醒邮件发送")
-            return False
-        smtp_server: str = smtp_server_env
-        smtp_user: str = smtp_user_env
-        smtp_password: str = smtp_password_env
-        smtp_sender: str = smtp_sender_env or smtp_user
-        encryption = os.getenv('SMTP_ENCRYPTION', '').strip().upper()
-        timeout = float(os.getenv('SMTP_TIMEOUT', '10'))
-
-        if not all([smtp_server, smtp_user, smtp_password]):
+        mailer = get_mailer()
+        if mailer is None:
             logger.warning("SMTP 配置不完整，跳过邮箱更新提醒邮件发送")
             return False
         if not user_email or '@' not in user_email:
@@ -371,43 +348,10 @@ def send_update_email_notice(user_email: str, name: str) -> bool:
 
         subject, html_body = get_update_email_notice_content(name)
         # Do not attach donation images for this transactional notice
-        message = _build_base_message(subject, user_email, smtp_sender, html_body, attach_donation_images=False)
-
-        if not encryption:
-            encryption_mode = 'SSL' if smtp_port == 465 else 'STARTTLS'
-        elif encryption in ('TLS', 'STARTTLS'):
-            encryption_mode = 'STARTTLS'
-        elif encryption in ('SSL', 'SMTPS'):
-            encryption_mode = 'SSL'
-        elif encryption in ('NONE', 'PLAINTEXT'):
-            encryption_mode = 'NONE'
-        else:
-            logger.warning(f"未知的 SMTP_ENCRYPTION 值: {encryption}，将回退为 STARTTLS")
-            encryption_mode = 'STARTTLS'
-
-        logger.info(f"正在向 {user_email} 发送邮箱更新提醒邮件... (加密: {encryption_mode})")
-        context = ssl.create_default_context()
-        if encryption_mode == 'SSL':
-            with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=timeout, context=context) as server:
-                server.login(smtp_user, smtp_password)
-                server.send_message(message)
-        elif encryption_mode == 'STARTTLS':
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=timeout) as server:
-                server.ehlo()
-                server.starttls(context=context)
-                server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(message)
-        else:
-            with smtplib.SMTP(smtp_server, smtp_port, timeout=timeout) as server:
-                server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(message)
-        logger.info(f"邮箱更新提醒邮件发送成功: {user_email}")
-        return True
-    except smtplib.SMTPAuthenticationError as e:  # pragma: no cover - specific branch
-        logger.error(f"SMTP 认证失败(更新提醒): {e}")
-        return False
+        message = _build_base_message(subject, user_email, mailer.config.sender, html_body, attach_donation_images=False)
+
+        logger.info(f"正在向 {user_email} 发送邮箱更新提醒邮件...")
+        return mailer.send(message)
     except Exception as e:  # Broad catch to ensure function returns False on any failure
         logger.error(f"发送邮箱更新提醒邮件时出现异常: {e}", exc_info=True)
         return False
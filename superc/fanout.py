@@ -0,0 +1,125 @@
+"""
+同一批放号并行预约多个用户
+
+当前用户的 run_check 在 Schritt 4 看到可用时间后，通过 on_slots 回调把当前用户没有选的时间
+交给匹配引擎（superc/matching.py）分配给其他等待中的用户，认领成功的用户在独立的 session 中
+重新走 Schritt 2-4，只预约分配给它的时间（run_check 的 target_datetime），与当前用户的 Schritt 5/6 同时进行。
+
+用法:
+    fanout = FanOutBooker(location_config, candidates=waiting_candidates, claim=claim_additional_profile)
+    run_check(location_config, profile, on_slots=fanout.on_slots)
+    for db_profile, profile, result in fanout.results():
+        ...
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from superc.matching import SlotMatcher
+from superc.profile import Profile
+
+
+logger = logging.getLogger("main")
+
+# (has_appointment, message, appointment_datetime)，与 run_check 的返回值相同
+CheckResult = Tuple[bool, str, Optional[datetime]]
+
+
+class FanOutBooker:
+    """接收 Schritt 4 的全部可用时间，在后台线程中为其他用户并行预约"""
+
+    def __init__(
+        self,
+        location_config: dict,
+        candidates: Callable[[], List[Tuple[object, Profile]]],
+        claim: Callable[[object], bool],
+        max_profiles: int = 3,
+        book: Optional[Callable[[dict, Profile, datetime], CheckResult]] = None,
+        budget: Optional[Callable[[], int]] = None,
+    ) -> None:
+        self.location_config = location_config
+        self.max_profiles = max_profiles
+        # 当前请求令牌还够几个用户走完整个预约流程（见 runner._fanout_budget），为 None 时不限制
+        self._budget = budget
+        self._candidates = candidates
+        self._claim = claim
+        self._book = book or _book_slot
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatch: Optional[Future] = None
+        self._bookings: List[Tuple[object, Profile, Future]] = []
+        self._lock = threading.Lock()
+
+    def on_slots(self, slots: List[Dict], taken: Optional[datetime]) -> None:
+        """enter_schritt_4_page 的回调: 只提交任务，认领用户和预约都在后台线程进行，不耽误当前用户的 Schritt 5"""
+        if self.max_profiles <= 0 or not slots or self._dispatch is not None:
+            return
+        if taken is not None and all(slot["datetime"] == taken for slot in slots):
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_profiles + 1, thread_name_prefix="fanout")
+        self._dispatch = self._executor.submit(self._dispatch_bookings, list(slots), taken)
+
+    def _dispatch_bookings(self, slots: List[Dict], taken: Optional[datetime]) -> None:
+        location = self.location_config["name"]
+        matcher = SlotMatcher.from_appointments(slots, location)
+        if taken is not None:
+            matcher.reserve(location, taken)
+        if not matcher.free_count:
+            return
+        limit = self.max_profiles if self._budget is None else min(self.max_profiles, self._budget())
+        if limit <= 0:
+            logger.info(f"请求令牌不足，{matcher.free_count} 个其余可用时间不做并行预约")
+            return
+        assignments = matcher.assign(self._candidates(), limit=limit)
+        if not assignments:
+            logger.info(f"{matcher.free_count} 个其余可用时间没有符合条件的等待用户")
+            return
+        logger.info(f"发现 {len(slots)} 个可用时间，同时为 {len(assignments)} 个其他用户预约")
+        with self._lock:
+            for assignment in assignments:
+                profile, slot_dt = assignment.profile, assignment.slot.datetime
+                # 匹配基于本地视图，真正的归属以数据库认领为准（可能已被其他 worker 认领）
+                if not self._claim(assignment.key):
+                    logger.info(f"{profile.full_name} 已被其他 worker 认领，跳过")
+                    continue
+                logger.info(f"并行预约: {profile.full_name} -> {slot_dt.strftime('%d.%m.%Y %H:%M')}")
+                future = self._executor.submit(self._book, self.location_config, profile, slot_dt)
+                self._bookings.append((assignment.key, profile, future))
+
+    def results(self, timeout: Optional[float] = None) -> List[Tuple[object, Profile, CheckResult]]:
+        """
+        等待所有并行预约完成
+        Input: timeout: Optional[float]
+        Output: [(db_record, Profile, run_check 结果)]，异常或超时的记为失败
+        """
+        if self._dispatch is None:
+            return []
+        try:
+            self._dispatch.result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"并行预约分配失败: {e}")
+        with self._lock:
+            bookings = list(self._bookings)
+        wait([future for _, _, future in bookings], timeout=timeout)
+
+        results = []
+        for db_profile, profile, future in bookings:
+            try:
+                result = future.result(timeout=0)
+            except Exception as e:
+                logger.error(f"{profile.full_name} 并行预约失败: {e}")
+                result = (False, f"并行预约失败: {e}", None)
+            results.append((db_profile, profile, result))
+        self._executor.shutdown(wait=False)
+        return results
+
+
+def _book_slot(location_config: dict, profile: Profile, slot_dt: datetime) -> CheckResult:
+    from superc.appointment_checker import run_check
+    from superc.utils.rate_governor import booking_requests
+
+    # 并行预约的 Schritt 2-4 也是为了提交这个时间，按预约请求限速，不被普通查询的下限卡住
+    with booking_requests():
+        return run_check(location_config, profile, target_datetime=slot_dt)
@@ -0,0 +1,167 @@
+"""
+预约时间与用户的匹配
+
+输入是 parse_all_appointments 解析出的可用时间（附带地点）和等待中的用户，每个用户有
+偏好地点（Profile.preferred_locations）、可接受的日期范围（earliest_date / latest_date）
+和优先级（Profile.priority）。全局的 config.APPOINTMENT_CUTOFF_DATE 对所有用户生效。
+
+匹配规则: 按优先级从高到低、同优先级按排队顺序，每个用户拿到符合条件的最早一个空闲时间。
+
+可用时间按地点建立有序时间索引，查找用 bisect 定位到用户的最早日期，再用"下一个空闲位置"
+并查集跳过已分配的时间，单个用户的查找是 O(log n)。几百个用户的一次匹配在毫秒以内完成，
+不会拖慢 Schritt 5 的提交。
+
+用法:
+    engine = SlotMatcher.from_appointments(parse_all_appointments(html), "superc")
+    slot = engine.take_best(profile)
+"""
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from superc import config
+from superc.profile import Profile
+
+
+@dataclass(eq=False)
+class Slot:
+    """一个可用预约时间"""
+
+    datetime: datetime
+    location: str
+    form_data: Optional[dict] = None
+
+
+@dataclass
+class Assignment:
+    """匹配结果: key 是调用方传入的用户标识（例如数据库记录）"""
+
+    key: object
+    profile: Profile
+    slot: Slot
+
+
+class _LocationIndex:
+    """单个地点的有序时间索引，_next_free 是"下一个未分配位置"的并查集"""
+
+    __slots__ = ("times", "slots", "_next_free")
+
+    def __init__(self, slots: List[Slot]) -> None:
+        slots.sort(key=lambda slot: slot.datetime)
+        self.slots = slots
+        self.times = [slot.datetime for slot in slots]
+        self._next_free = list(range(len(slots) + 1))
+
+    def find_free(self, index: int) -> int:
+        root = index
+        while self._next_free[root] != root:
+            root = self._next_free[root]
+        while self._next_free[index] != root:  # 路径压缩
+            self._next_free[index], index = root, self._next_free[index]
+        return root
+
+    def first_free(self, start: Optional[datetime], end: Optional[datetime]) -> Optional[int]:
+        """[start, end) 内最早的空闲位置"""
+        index = self.find_free(bisect_left(self.times, start) if start else 0)
+        if index >= len(self.times) or (end is not None and self.times[index] >= end):
+            return None
+        return index
+
+    def take(self, index: int) -> Slot:
+        self._next_free[index] = index + 1
+        return self.slots[index]
+
+
+def _window(profile: Profile, cutoff: Optional[date]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """用户可接受的时间范围 [start, end)，latest_date 当天包含在内，全局截止日期当天不包含"""
+    start = datetime.combine(profile.earliest_date, time.min) if profile.earliest_date else None
+    ends = []
+    if profile.latest_date:
+        ends.append(datetime.combine(profile.latest_date + timedelta(days=1), time.min))
+    if cutoff:
+        ends.append(datetime.combine(cutoff, time.min))
+    return start, min(ends) if ends else None
+
+
+class SlotMatcher:
+    """按地点索引的可用时间集合，take_best / assign 会把分配出去的时间标记为已占用"""
+
+    def __init__(self, slots: Iterable[Slot], cutoff: Optional[date] = None) -> None:
+        by_location: Dict[str, List[Slot]] = {}
+        seen = set()
+        for slot in slots:
+            if (slot.location, slot.datetime) in seen:
+                continue
+            seen.add((slot.location, slot.datetime))
+            by_location.setdefault(slot.location, []).append(slot)
+        self._index = {location: _LocationIndex(items) for location, items in by_location.items()}
+        self._free = len(seen)
+        self.cutoff = cutoff if cutoff is not None else getattr(config, "APPOINTMENT_CUTOFF_DATE", None)
+
+    @classmethod
+    def from_appointments(cls, appointments: Sequence[Dict], location: str, cutoff: Optional[date] = None) -> "SlotMatcher":
+        """
+        Input: appointments: parse_all_appointments 的结果, location: str - 页面所属地点
+        Output: SlotMatcher
+        """
+        return cls((Slot(a["datetime"], location, a.get("form_data")) for a in appointments), cutoff=cutoff)
+
+    def reserve(self, location: str, slot_datetime: datetime) -> bool:
+        """把已被占用的时间（例如当前用户已选的）标记为不可分配"""
+        index = self._index.get(location)
+        if index is None:
+            return False
+        position = bisect_left(index.times, slot_datetime)
+        if position < len(index.times) and index.times[position] == slot_datetime and index.find_free(position) == position:
+            index.take(position)
+            self._free -= 1
+            return True
+        return False
+
+    @property
+    def free_count(self) -> int:
+        """尚未分配的时间数"""
+        return self._free
+
+    def take_best(self, profile: Profile) -> Optional[Slot]:
+        """
+        为单个用户分配符合条件的最早空闲时间
+        Input: profile: Profile
+        Output: Optional[Slot] - 没有符合条件的时间时为 None
+        """
+        if not self._free:
+            return None
+        start, end = _window(profile, self.cutoff)
+        best: Optional[Tuple[datetime, _LocationIndex, int]] = None
+        for location in profile.locations:
+            index = self._index.get(location)
+            if index is None:
+                continue
+            position = index.first_free(start, end)
+            if position is not None and (best is None or index.times[position] < best[0]):
+                best = (index.times[position], index, position)
+        if best is None:
+            return None
+        self._free -= 1
+        return best[1].take(best[2])
+
+    def assign(self, candidates: Sequence[Tuple[object, Profile]], limit: Optional[int] = None) -> List[Assignment]:
+        """
+        按优先级（高在前）和排队顺序为多个用户分配时间，每个时间最多分给一个用户
+        Input:
+            candidates: [(key, Profile)]，按排队顺序排列
+            limit: 最多分配几个
+        Output: List[Assignment]，按分配顺序
+        """
+        order = sorted(range(len(candidates)), key=lambda i: (-candidates[i][1].priority, i))
+        assignments: List[Assignment] = []
+        for i in order:
+            if not self._free or (limit is not None and len(assignments) >= limit):
+                break
+            key, profile = candidates[i]
+            slot = self.take_best(profile)
+            if slot is not None:
+                assignments.append(Assignment(key, profile, slot))
+        return assignments
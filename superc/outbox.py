@@ -0,0 +1,384 @@
+"""
+预约结果发件箱（transactional outbox）
+
+runner 拿到预约结果后只把要做的副作用（更新数据库状态、发邮件）写入本地 SQLite，
+立即切换到下一个用户；后台线程负责投递，失败按指数退避重试，重启后继续投递未完成的条目。
+
+投递语义:
+- 每个条目有幂等键，重复 enqueue 同一个键只记录一次
+- 数据库状态更新由 transition_appointment_status 保证幂等，重试不会产生重复效果
+- 邮件为至少一次：投递成功后立即标记完成，只有进程恰好在发送和标记之间退出时才可能重发
+- 处理函数返回 False / 抛出异常时按退避重试；抛出 PermanentFailure 时直接标记为 dead（例如用户已不在等待状态）
+- 数据库状态写入前由投递线程为对应用户续约（lease_keeper），重试期间其他 worker 不会接管并重复预约
+
+用法:
+    get_outbox().enqueue_booking_success(profile, db_id, appointment_dt)
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from superc import config
+
+
+logger = logging.getLogger("main")
+
+PENDING = "pending"
+DONE = "done"
+DEAD = "dead"
+
+# 数据库状态更新优先于邮件，尽快让其他 worker 看到用户已完成
+_PRIORITY = {"mark_booked": 0, "mark_error": 0, "booking_email": 1, "update_notice_email": 1}
+
+_SCHEMA = """
+create table if not exists outbox (
+    id integer primary key autoincrement,
+    idempotency_key text not null unique,
+    kind text not null,
+    payload text not null,
+    priority integer not null default 1,
+    status text not null default 'pending',
+    attempts integer not null default 0,
+    next_attempt_at real not null,
+    last_error text,
+    created_at real not null,
+    done_at real
+);
+create index if not exists outbox_due_idx on outbox (status, priority, next_attempt_at);
+"""
+
+
+@dataclass
+class OutboxItem:
+    """发件箱中的一个待投递条目"""
+
+    id: int
+    idempotency_key: str
+    kind: str
+    payload: dict
+    attempts: int
+
+
+Handler = Callable[[dict], bool]
+# 数据库状态尚未写入的条目类型，payload 中的 db_id 在投递完成前需要保持租约
+_STATUS_KINDS = ("mark_booked", "mark_error")
+
+
+class PermanentFailure(Exception):
+    """处理函数确定重试也不会成功时抛出，条目直接标记为 dead"""
+
+
+class Outbox:
+    """基于 SQLite 的持久化发件箱，enqueue() 只做一次本地写入，投递在后台线程中完成"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        handlers: Optional[Dict[str, Handler]] = None,
+        max_attempts: Optional[int] = None,
+        retry_base_seconds: Optional[float] = None,
+        retry_max_seconds: Optional[float] = None,
+        lease_keeper: Optional[Callable[[int], bool]] = None,
+        lease_interval: float = 100.0,
+    ) -> None:
+        self.path = path or config.OUTBOX_PATH
+        self.handlers: Dict[str, Handler] = dict(handlers or {})
+        self.max_attempts = config.OUTBOX_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.retry_base_seconds = config.OUTBOX_RETRY_BASE_SECONDS if retry_base_seconds is None else retry_base_seconds
+        self.retry_max_seconds = config.OUTBOX_RETRY_MAX_SECONDS if retry_max_seconds is None else retry_max_seconds
+        # 为状态尚未写入的用户续约（按 db_id 调用），每 lease_interval 秒一次
+        self.lease_keeper = lease_keeper
+        self.lease_interval = lease_interval
+        self._last_lease_renewal = float("-inf")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def enqueue(self, kind: str, payload: dict, idempotency_key: str) -> bool:
+        """
+        记录一个待投递的副作用（本地写入后立即返回）
+
+        Returns:
+            bool: 新记录返回 True；相同幂等键已存在返回 False
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "insert or ignore into outbox (idempotency_key, kind, payload, priority, next_attempt_at, created_at) "
+                "values (?, ?, ?, ?, ?, ?)",
+                (idempotency_key, kind, json.dumps(payload, ensure_ascii=False), _PRIORITY.get(kind, 1), now, now),
+            )
+        self._wakeup.set()
+        return cursor.rowcount == 1
+
+    def enqueue_booking_success(self, email: str, full_name: str, db_id: Optional[int],
+                                appointment_dt: Optional[datetime], location: str = "SuperC") -> None:
+        """预约成功：标记 booked + 发送确认邮件"""
+        dt = appointment_dt.isoformat() if appointment_dt else None
+        key = f"booked:{db_id if db_id is not None else email}:{dt}"
+        payload = {"email": email, "full_name": full_name, "db_id": db_id, "appointment_dt": dt, "location": location}
+        self.enqueue("mark_booked", payload, f"{key}:mark")
+        self.enqueue("booking_email", payload, f"{key}:email")
+
+    def enqueue_account_blocked(self, email: str, full_name: str, db_id: Optional[int]) -> None:
+        """账号被限制：标记 error + 发送邮箱更新提醒"""
+        # 数据库用户只会被标记一次 error；本地模式同一邮箱每天最多提醒一次
+        key = f"error:{db_id}" if db_id is not None else f"error:{email}:{datetime.now().date().isoformat()}"
+        payload = {"email": email, "full_name": full_name, "db_id": db_id}
+        self.enqueue("mark_error", payload, f"{key}:mark")
+        self.enqueue("update_notice_email", payload, f"{key}:email")
+
+    # ------------------------------------------------------------------
+    # Delivery
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+                self._thread.start()
+
+    def start(self) -> "Outbox":
+        """启动投递线程（投递上次进程退出时未完成的条目）"""
+        self._ensure_started()
+        self._wakeup.set()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                if time.monotonic() - self._last_lease_renewal >= self.lease_interval:
+                    self.renew_leases()
+                delivered = self.deliver_due()
+            except Exception as e:
+                logger.error(f"发件箱投递异常: {e}")
+                delivered = 0
+            if delivered:
+                continue
+            wait = self._seconds_until_next_due()
+            if self.lease_keeper is not None:
+                wait = min(wait, max(self._last_lease_renewal + self.lease_interval - time.monotonic(), 0.05))
+            self._wakeup.wait(wait)
+
+    def pending_profile_ids(self) -> List[int]:
+        """数据库状态尚未写入的用户 ID（写入前不能被再次选中或被其他 worker 接管）"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"select payload from outbox where status = ? and kind in ({', '.join('?' * len(_STATUS_KINDS))})",
+                (PENDING, *_STATUS_KINDS),
+            ).fetchall()
+        ids = {json.loads(row[0]).get("db_id") for row in rows}
+        return sorted(profile_id for profile_id in ids if profile_id is not None)
+
+    def renew_leases(self) -> int:
+        """
+        为状态尚未写入的用户续约（投递线程按 lease_interval 调用，测试中可直接调用）。
+        退避重试可能远长于租约时长，不续约的话其他 worker 会在写入前接管用户并重复预约。
+
+        Returns:
+            int: 续约的用户数
+        """
+        self._last_lease_renewal = time.monotonic()
+        if self.lease_keeper is None:
+            return 0
+        profile_ids = self.pending_profile_ids()
+        for profile_id in profile_ids:
+            try:
+                if not self.lease_keeper(profile_id):
+                    logger.warning(f"用户 {profile_id} 的状态尚未写入，续约失败")
+            except Exception as e:
+                logger.warning(f"用户 {profile_id} 的状态尚未写入，续约异常: {e}")
+        return len(profile_ids)
+
+    def _seconds_until_next_due(self) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "select min(next_attempt_at) from outbox where status = ?", (PENDING,)
+            ).fetchone()
+        if row[0] is None:
+            return 60.0
+        return min(max(row[0] - time.time(), 0.05), 60.0)
+
+    def due_items(self, limit: int = 20) -> List[OutboxItem]:
+        """到期待投递的条目，数据库更新优先"""
+        with self._lock:
+            rows = self._conn.execute(
+                "select id, idempotency_key, kind, payload, attempts from outbox "
+                "where status = ? and next_attempt_at <= ? order by priority, id limit ?",
+                (PENDING, time.time(), limit),
+            ).fetchall()
+        return [OutboxItem(row[0], row[1], row[2], json.loads(row[3]), row[4]) for row in rows]
+
+    def deliver_due(self) -> int:
+        """
+        投递所有到期条目（后台线程调用，测试中可直接调用）
+
+        Returns:
+            int: 本次处理的条目数
+        """
+        items = self.due_items()
+        for item in items:
+            self._deliver(item)
+        return len(items)
+
+    def _deliver(self, item: OutboxItem) -> None:
+        handler = self.handlers.get(item.kind)
+        error = None
+        permanent = False
+        try:
+            ok = handler is not None and handler(item.payload)
+            if handler is None:
+                error = f"未注册的条目类型: {item.kind}"
+        except PermanentFailure as e:
+            ok, permanent = False, True
+            error = str(e)
+        except Exception as e:
+            ok = False
+            error = str(e)
+
+        attempts = item.attempts + 1
+        give_up = permanent or attempts >= self.max_attempts
+        with self._lock:
+            if ok:
+                self._conn.execute(
+                    "update outbox set status = ?, attempts = ?, done_at = ?, last_error = null where id = ?",
+                    (DONE, attempts, time.time(), item.id),
+                )
+            elif give_up:
+                self._conn.execute(
+                    "update outbox set status = ?, attempts = ?, last_error = ? where id = ?",
+                    (DEAD, attempts, error, item.id),
+                )
+            else:
+                delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+                self._conn.execute(
+                    "update outbox set attempts = ?, next_attempt_at = ?, last_error = ? where id = ?",
+                    (attempts, time.time() + delay, error, item.id),
+                )
+
+        if not ok and permanent:
+            logger.error(f"发件箱条目 {item.idempotency_key} 无法投递，已放弃: {error}")
+        elif not ok and give_up:
+            logger.error(f"发件箱条目 {item.idempotency_key} 重试 {attempts} 次后仍失败，已放弃: {error}")
+        elif not ok:
+            logger.warning(f"发件箱条目 {item.idempotency_key} 投递失败（第 {attempts} 次），稍后重试")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待当前已到期的条目全部投递（重试等待中的条目不算）
+
+        Returns:
+            bool: 超时前全部投递返回 True
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._wakeup.set()
+        while self.due_items(limit=1):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的条目数量"""
+        with self._lock:
+            rows = self._conn.execute("select status, count(*) from outbox group by status").fetchall()
+        return {status: count for status, count in rows}
+
+
+# ---------------------------------------------------------------------------
+# Handlers
+# ---------------------------------------------------------------------------
+
+def _parse_dt(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _status_update(updated: Optional[bool], payload: dict) -> bool:
+    """
+    状态更新的结果转换为投递结果：None（数据库暂时出错）重试；
+    False（记录已不在等待状态，例如已被人工处理）重试也不会成功，直接放弃
+    """
+    if updated is False:
+        raise PermanentFailure(f"用户 {payload.get('db_id')} 已不在等待状态")
+    return bool(updated)
+
+
+def default_handlers() -> Dict[str, Handler]:
+    """把发件箱条目类型映射到 result_handler 中的副作用函数"""
+    from superc import result_handler
+
+    return {
+        "mark_booked": lambda p: _status_update(
+            result_handler.mark_as_booked(p["db_id"], p["full_name"], _parse_dt(p["appointment_dt"])), p
+        ),
+        "booking_email": lambda p: result_handler.notify_booking_success(
+            p["email"], p["full_name"], _parse_dt(p["appointment_dt"]), location=p.get("location", "SuperC")
+        ),
+        "mark_error": lambda p: _status_update(result_handler.mark_as_error(p["db_id"], p["full_name"]), p),
+        "update_notice_email": lambda p: result_handler.notify_email_update_needed(p["email"], p["full_name"]),
+    }
+
+
+def _keep_lease(profile_id: int) -> bool:
+    """
+    为状态尚未写入的用户续约；重启后（worker_id 变了）在旧租约过期时重新认领
+    输入类型: profile_id: int
+    输出类型: bool - 是否持有租约
+    """
+    from db.utils import claim_profile, default_worker_id
+
+    return claim_profile(profile_id, default_worker_id(), config.PROFILE_LEASE_SECONDS)
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """
+    获取进程内共享的发件箱（首次调用时启动投递线程，继续投递上次未完成的条目）
+    Input: None
+    Output: Outbox instance
+    """
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox(
+                    handlers=default_handlers(),
+                    lease_keeper=_keep_lease if config.ENABLE_PROFILE_LEASES else None,
+                    lease_interval=config.PROFILE_LEASE_SECONDS / 3,
+                ).start()
+                # 正常退出前尽量把已到期的条目投递完，剩下的下次启动继续
+                atexit.register(_outbox.flush, 30.0)
+    return _outbox
@@ -0,0 +1,220 @@
+"""
+放号前预热
+
+预约通常在固定时刻集中放出（配置的 PREWARM_RELEASE_TIMES，或从历史日志中学到的时刻）。
+在放号前 PREWARM_LEAD_SECONDS 秒提前完成本该在下一轮开头做的准备工作:
+- 建立到预约网站的 TCP/TLS 连接（DNS 解析 + 握手）并走完 Schritt 2-3
+- 导入 openai SDK 并建立到 LLM 接口的连接，验证码识别不用再等握手
+
+然后睡到放号时刻，把预热好的 session 和 Schritt 3 结果交给 run_check，第一次 Schritt 4 查询直接从热连接开始。
+
+用法:
+    warm_state = get_prewarmer(location_config).sleep_until_next_poll(POLL_INTERVAL)
+    run_check(location_config, profile, warm_state=warm_state)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence
+
+import httpx
+
+from superc import config
+
+
+logger = logging.getLogger("main")
+
+
+@dataclass
+class WarmState:
+    """预热结果: 已走完 Schritt 2-3 的 session，run_check 从 Schritt 4 继续"""
+
+    session: httpx.Client
+    url: str
+    loc: str
+    release_at: datetime
+
+
+def parse_release_times(values: Sequence[str]) -> List[int]:
+    """
+    把 "HH:MM" 列表转换为当天的分钟数，忽略格式错误的值
+    Input: values: Sequence[str]
+    Output: List[int] - 排序去重后的 minute-of-day
+    """
+    minutes = set()
+    for value in values:
+        try:
+            parsed = datetime.strptime(value.strip(), "%H:%M")
+        except (ValueError, AttributeError):
+            logger.warning(f"忽略无效的放号时间: {value!r}")
+            continue
+        minutes.add(parsed.hour * 60 + parsed.minute)
+    return sorted(minutes)
+
+
+def next_release_instant(now: datetime, release_minutes: Sequence[int]) -> Optional[datetime]:
+    """
+    返回 now 之后最近的放号时刻（今天没有则取明天最早的）
+    Input: now: datetime, release_minutes: Sequence[int] - minute-of-day
+    Output: Optional[datetime] - 没有配置任何放号时间时为 None
+    """
+    if not release_minutes:
+        return None
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = [midnight + timedelta(days=day, minutes=minute) for day in (0, 1) for minute in release_minutes]
+    return min(candidate for candidate in candidates if candidate > now)
+
+
+def learned_release_times(log_path: str, top_n: int = 3, min_count: int = 3) -> List[int]:
+    """
+    从运行日志中学习放号时刻: 统计每次从"没有预约"变为"发现可用预约"的分钟，取出现最多的几个
+    Input:
+        log_path: str - superc.log 一类的纯文本日志
+        top_n: int - 最多返回几个时刻
+        min_count: int - 至少出现几次才认为是固定放号时刻
+    Output: List[int] - minute-of-day，日志不存在时为空
+    """
+    from superc.utils.log_archive import iter_entries
+
+    if not log_path or not os.path.exists(log_path):
+        return []
+    counter: Counter = Counter()
+    previous_event = None
+    previous_day = None
+    with open(log_path, encoding="utf-8", errors="replace") as handle:
+        for entry in iter_entries(handle):
+            if entry.event not in ("no_slot", "slot_found"):
+                continue
+            day = entry.timestamp.date()
+            # 连续多轮都能看到预约时只算第一次出现
+            if entry.event == "slot_found" and (previous_event == "no_slot" or previous_day != day):
+                counter[entry.timestamp.hour * 60 + entry.timestamp.minute] += 1
+            previous_event, previous_day = entry.event, day
+    return sorted(minute for minute, count in counter.most_common(top_n) if count >= min_count)
+
+
+class Prewarmer:
+    """在放号前预热连接和 Schritt 2-3，代替 runner 中的固定 sleep"""
+
+    def __init__(
+        self,
+        location_config: dict,
+        release_times: Sequence[str] = (),
+        lead_seconds: float = 45.0,
+        learn_from_log: Optional[str] = None,
+        now: Callable[[], datetime] = datetime.now,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.location_config = location_config
+        self.lead_seconds = lead_seconds
+        self._configured = parse_release_times(release_times)
+        self._learn_from_log = learn_from_log
+        self._release_minutes: Optional[List[int]] = None
+        self._now = now
+        self._sleep = sleep
+
+    @property
+    def release_minutes(self) -> List[int]:
+        """配置的放号时刻加上从日志学到的时刻（首次使用时才读日志，不拖慢启动）"""
+        if self._release_minutes is None:
+            learned: List[int] = []
+            try:
+                learned = learned_release_times(self._learn_from_log) if self._learn_from_log else []
+            except Exception as e:
+                logger.warning(f"从日志学习放号时间失败: {e}")
+            self._release_minutes = sorted(set(self._configured) | set(learned))
+            if learned:
+                logger.info(f"从日志学到的放号时间: {', '.join(f'{m // 60:02d}:{m % 60:02d}' for m in learned)}")
+        return self._release_minutes
+
+    def sleep_until_next_poll(self, poll_interval: float) -> Optional[WarmState]:
+        """
+        代替 time.sleep(poll_interval): 如果下一个放号时刻的预热点落在这段等待之内，
+        就在预热点醒来预热，再睡到放号时刻返回预热结果；否则照常睡 poll_interval
+        Input: poll_interval: float - 本来要等待的秒数
+        Output: Optional[WarmState] - 预热成功时返回，交给下一次 run_check
+        """
+        now = self._now()
+        release_at = next_release_instant(now, self.release_minutes)
+        if release_at is None:
+            self._sleep(poll_interval)
+            return None
+
+        until_warm = (release_at - now).total_seconds() - self.lead_seconds
+        if until_warm > poll_interval:
+            self._sleep(poll_interval)
+            return None
+
+        if until_warm > 0:
+            self._sleep(until_warm)
+        logger.info(f"即将放号 ({release_at.strftime('%H:%M')})，预热连接和 Schritt 2-3")
+        state = self.warm(release_at)
+        remaining = (release_at - self._now()).total_seconds()
+        if remaining > 0:
+            self._sleep(remaining)
+        return state
+
+    def warm(self, release_at: datetime) -> Optional[WarmState]:
+        """
+        建立连接并走完 Schritt 2-3，失败时返回 None（下一轮照常从 Schritt 2 开始）
+        Input: release_at: datetime
+        Output: Optional[WarmState]
+        """
+        from superc.appointment_checker import create_session
+        from superc.utils import deadline
+        from superc.utils.gpt_call import prewarm_connection
+        from superc.utils.page_navigation import enter_schritt_2_page, enter_schritt_3_page
+
+        started = time.monotonic()
+        # LLM 连接在后台线程建立，和 Schritt 2-3 的请求并行
+        llm_thread = threading.Thread(target=prewarm_connection, name="llm-prewarm", daemon=True)
+        llm_thread.start()
+
+        session = create_session()
+        try:
+            with deadline.budget("Schritt 2"):
+                success, url = enter_schritt_2_page(session, self.location_config["selection_text"])
+            if success:
+                with deadline.budget("Schritt 3"):
+                    success, loc = enter_schritt_3_page(session, url)
+            if not success:
+                logger.warning("预热失败，下一轮从 Schritt 2 开始")
+                session.close()
+                return None
+        except Exception as e:
+            logger.warning(f"预热失败: {e}")
+            session.close()
+            return None
+        finally:
+            llm_thread.join(timeout=10)
+
+        logger.info(f"预热完成，用时 {time.monotonic() - started:.2f}s")
+        return WarmState(session=session, url=url, loc=loc, release_at=release_at)
+
+
+_prewarmer: Optional[Prewarmer] = None
+_prewarmer_lock = threading.Lock()
+
+
+def get_prewarmer(location_config: dict) -> Prewarmer:
+    """
+    获取进程内共享的预热器（按 config 中的 PREWARM_* 配置创建）
+    Input: location_config: dict - 首次创建时使用的地点配置
+    Output: Prewarmer instance
+    """
+    global _prewarmer
+    if _prewarmer is None:
+        with _prewarmer_lock:
+            if _prewarmer is None:
+                _prewarmer = Prewarmer(
+                    location_config,
+                    release_times=config.PREWARM_RELEASE_TIMES,
+                    lead_seconds=config.PREWARM_LEAD_SECONDS,
+                    learn_from_log=config.PREWARM_LEARN_FROM_LOG,
+                )
+    return _prewarmer
@@ -11,9 +11,11 @@ Key Functions:
 - Data validation and formatting utilities
 """
 from dataclasses import dataclass
-from typing import Optional
-from datetime import datetime
-from db.models import AppointmentProfile
+from typing import TYPE_CHECKING, FrozenSet, Optional
+from datetime import date, datetime
+
+if TYPE_CHECKING:  # 仅用于类型标注，避免导入 Profile 时加载 SQLAlchemy
+    from db.models import AppointmentProfile
 
 @dataclass
 class Profile:
@@ -27,9 +29,14 @@ class Profile:
     geburtsdatum_month: int
     geburtsdatum_year: int
     preferred_locations: str = 'superc'
+    # 可接受的预约日期范围（含两端），None 表示不限
+    earliest_date: Optional[date] = None
+    latest_date: Optional[date] = None
+    # 优先级，越大越先分配可用时间
+    priority: int = 0
     
     @classmethod
-    def from_db_record(cls, appointment_profile: AppointmentProfile) -> 'Profile':
+    def from_db_record(cls, appointment_profile: 'AppointmentProfile') -> 'Profile':
         """Convert database AppointmentProfile record to Profile instance for program use"""
         return cls(
             vorname=appointment_profile.vorname or "",
@@ -39,7 +46,10 @@ class Profile:
             geburtsdatum_day=appointment_profile.geburtsdatum_day or 1,
             geburtsdatum_month=appointment_profile.geburtsdatum_month or 1,
             geburtsdatum_year=appointment_profile.geburtsdatum_year or 1990,
-            preferred_locations=appointment_profile.preferred_locations or 'superc'
+            preferred_locations=appointment_profile.preferred_locations or 'superc',
+            earliest_date=_as_date(appointment_profile.earliest_date),
+            latest_date=_as_date(appointment_profile.latest_date),
+            priority=appointment_profile.priority or 0,
         )
     
     def to_form_data(self) -> dict:
@@ -59,6 +69,11 @@ class Profile:
         """Get full name for display purposes"""
         return f"{self.vorname} {self.nachname}".strip()
     
+    @property
+    def locations(self) -> FrozenSet[str]:
+        """偏好地点集合（preferred_locations 以逗号分隔，例如 'superc,infostelle'）"""
+        return frozenset(name.strip().lower() for name in (self.preferred_locations or 'superc').split(',') if name.strip())
+    
     @property
     def birth_date(self) -> datetime:
         """Get birth date as datetime object"""
@@ -76,4 +91,15 @@ class Profile:
         print(f"电话: {self.phone}")
         print(f"生日: {self.geburtsdatum_day}/{self.geburtsdatum_month}/{self.geburtsdatum_year}")
         print(f"偏好地点: {self.preferred_locations}")
-        print("-" * 30)
\ No newline at end of file
+        if self.earliest_date or self.latest_date:
+            print(f"日期范围: {self.earliest_date or '-'} ~ {self.latest_date or '-'}")
+        if self.priority:
+            print(f"优先级: {self.priority}")
+        print("-" * 30)
+
+
+def _as_date(value) -> Optional[date]:
+    """数据库中的 date / datetime 统一为 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    return value
@@ -2,17 +2,44 @@
 用户 Profile 加载模块
 
 提供统一接口从不同数据源（本地 YAML / Supabase DB）加载用户。
-对外暴露 get_first_profile() 和 get_next_profile()，调用方无需关心数据源细节。
+对外暴露 get_first_profile()、get_next_profile() 和 wait_for_next_profile()，调用方无需关心数据源细节。
+数据库模式下优先使用 db.queue_listener 维护的本地等待队列视图（LISTEN/NOTIFY 推送），
+监听不可用时回退为直接查询数据库。启用租约时通过 claim_waiting_profile 原子认领用户，
+多个 worker 进程（可跨机器）同时运行时各自处理不同的用户。
 """
 
+import atexit
 import logging
 import os
-from typing import List, Optional, Tuple
+import time
+from typing import List, Optional, Set, Tuple
 
+from superc import config
 from superc.profile import Profile
 
 logger = logging.getLogger("main")
 
+# 等待队列订阅器（首次使用时启动）；启动失败后记为 False，不再重试
+_subscriber = None
+# 当前正在处理的数据库用户 ID，切换到下一个用户时从本地视图中移除
+_current_profile_id: Optional[int] = None
+# 本进程已处理完的用户：状态更新由发件箱异步写入数据库，写入前不能再次选中它们
+_finished_ids: Set[int] = set()
+# 上次续约时间（time.monotonic），续约按 PROFILE_LEASE_SECONDS / 3 节流
+_last_heartbeat = 0.0
+_worker_id: Optional[str] = None
+
+
+def _get_worker_id() -> str:
+    global _worker_id
+    if _worker_id is None:
+        from db.utils import default_worker_id
+
+        _worker_id = default_worker_id()
+        # 正常退出时释放租约，其他 worker 不必等租约过期
+        atexit.register(_release_current_lease)
+    return _worker_id
+
 
 # ---------------------------------------------------------------------------
 # Local YAML loader
@@ -46,6 +73,9 @@ def _load_from_yaml() -> List[Profile]:
             geburtsdatum_month=user.get("geburtsdatum_month", 1),
             geburtsdatum_year=user.get("geburtsdatum_year", 1990),
             preferred_locations=user.get("preferred_locations", "superc"),
+            earliest_date=user.get("earliest_date"),
+            latest_date=user.get("latest_date"),
+            priority=user.get("priority", 0),
         )
         profiles.append(profile)
 
@@ -57,16 +87,96 @@ def _load_from_yaml() -> List[Profile]:
 # DB loader
 # ---------------------------------------------------------------------------
 
+def _get_subscriber():
+    """获取已就绪的等待队列订阅器，未启用、监听不可用或连接断开后尚未重新同步时返回 None"""
+    global _subscriber
+    if not config.ENABLE_QUEUE_LISTENER or _subscriber is False:
+        return None
+    if _subscriber is None:
+        from db.queue_listener import WaitingQueueSubscriber
+
+        subscriber = WaitingQueueSubscriber().start()
+        if subscriber.is_running:
+            logger.info("已启用等待队列监听 (LISTEN/NOTIFY)")
+            _subscriber = subscriber
+        else:
+            logger.warning("等待队列监听不可用，回退为查询数据库")
+            subscriber.stop()
+            _subscriber = False
+            return None
+    if not _subscriber.is_running:
+        # 监听连接断开，后台线程正在重连；期间视图可能过期，直接查询数据库
+        return None
+    return _subscriber
+
+
+def _to_profile_pair(db_profile) -> Tuple[Optional[object], Optional[Profile]]:
+    """把数据库记录转换为 (db_record, Profile)，并记下当前处理的用户 ID"""
+    global _current_profile_id, _last_heartbeat
+    if db_profile is None:
+        return None, None
+    _current_profile_id = db_profile.id
+    _last_heartbeat = time.monotonic()
+    return db_profile, Profile.from_db_record(db_profile)
+
+
+def _release_current_lease() -> None:
+    """释放当前用户的租约（未启用租约、没有当前用户或当前用户已处理完时不做任何事）"""
+    if not config.ENABLE_PROFILE_LEASES or _current_profile_id is None or _worker_id is None:
+        return
+    if _current_profile_id in _finished_ids:
+        # 已处理完的用户由状态转换释放租约，提前释放会让其他 worker 在状态写入前重复处理
+        return
+    from db.utils import release_lease
+
+    release_lease(_current_profile_id, _worker_id)
+
+
+def check_profile_schema(local_mode: bool = False) -> bool:
+    """
+    启动时检查数据库是否已执行 appointment_profiles 的字段迁移（见 db.utils.PROFILE_COLUMN_MIGRATIONS）。
+    缺少字段时所有 profile 查询都会失败，程序会一直以为等待队列为空，因此直接报错。
+
+    Returns:
+        bool: 字段齐全（或本地模式 / 暂时无法连接数据库）返回 True，缺少字段返回 False
+    """
+    if local_mode:
+        return True
+    from db.utils import missing_profile_columns
+
+    try:
+        missing = missing_profile_columns()
+    except Exception as e:
+        logger.warning(f"检查 appointment_profiles 表结构失败: {e}")
+        return True
+    for ddl_file, columns in missing.items():
+        logger.error(f"appointment_profiles 缺少字段 {', '.join(columns)}，请先执行 db/{ddl_file}"
+                     f"（python -m db.migrate --profiles）")
+    return not missing
+
+
 def _load_first_from_db():
     """从数据库获取第一个等待中的用户，返回 (db_record, Profile) 或 (None, None)"""
-    from db.utils import get_first_waiting_profile
+    from db.utils import claim_waiting_profile, get_first_waiting_profile
 
     try:
+        if config.ENABLE_PROFILE_LEASES:
+            return _to_profile_pair(claim_waiting_profile(
+                _get_worker_id(), config.PROFILE_LEASE_SECONDS, exclude_ids=_finished_ids
+            ))
+
+        subscriber = _get_subscriber()
+        if subscriber is not None:
+            return _to_profile_pair(subscriber.view.first())
+
+        if _finished_ids:
+            from db.utils import get_all_waiting_profiles
+
+            pending = [p for p in get_all_waiting_profiles() if p.id not in _finished_ids]
+            return _to_profile_pair(pending[0] if pending else None)
+
         db_profile = get_first_waiting_profile()
-        if db_profile:
-            profile = Profile.from_db_record(db_profile)
-            return db_profile, profile
-        return None, None
+        return _to_profile_pair(db_profile)
     except Exception as e:
         logger.error(f"获取数据库profile失败: {e}")
         return None, None
@@ -95,6 +205,12 @@ def get_first_profile(local_mode: bool = False) -> Tuple[Optional[object], Optio
             logger.info("本地用户配置为空")
             return None, None
 
+    if config.ENABLE_OUTBOX:
+        from superc.outbox import get_outbox
+
+        # 上次退出前状态尚未写入数据库的用户（发件箱会继续投递并为它们续约），写入前不能再次选中
+        _finished_ids.update(get_outbox().pending_profile_ids())
+
     db_profile, profile = _load_first_from_db()
     if profile:
         logger.info(f"当前处理用户: {profile.full_name} (ID: {db_profile.id})")
@@ -113,6 +229,13 @@ def get_next_profile(local_mode: bool = False) -> Tuple[Optional[object], Option
         logger.info("[本地模式] 没有更多用户")
         return None, None
 
+    # 刚处理完的用户状态可能还在发件箱中等待写入，不等 NOTIFY 到达就先从本地视图中移除
+    if _current_profile_id is not None:
+        _finished_ids.add(_current_profile_id)
+    subscriber = _get_subscriber()
+    if subscriber is not None and _current_profile_id is not None:
+        subscriber.view.remove(_current_profile_id)
+
     db_profile, profile = _load_first_from_db()
     if profile:
         logger.info(f"找到下一个用户: {profile.full_name} (ID: {db_profile.id})")
@@ -120,3 +243,166 @@ def get_next_profile(local_mode: bool = False) -> Tuple[Optional[object], Option
     else:
         logger.info("没有更多等待的用户")
     return db_profile, profile
+
+
+def can_wait_for_profiles(local_mode: bool = False) -> bool:
+    """队列为空时是否应该等待新用户（本地模式只有固定用户，不等待）"""
+    return not local_mode
+
+
+def wait_for_next_profile(timeout: float, local_mode: bool = False) -> Tuple[Optional[object], Optional[Profile]]:
+    """
+    阻塞等待新的等待中用户，最多 timeout 秒。
+
+    启用队列监听时由 NOTIFY 唤醒，新用户注册后立即返回；否则在超时后查询一次数据库。
+
+    Returns:
+        (db_record, Profile) — 有新用户
+        (None, None) — 超时仍无用户，或本地模式
+    """
+    if not can_wait_for_profiles(local_mode):
+        return None, None
+
+    subscriber = _get_subscriber()
+    if subscriber is not None:
+        worker_id = _get_worker_id() if config.ENABLE_PROFILE_LEASES else None
+        first = subscriber.wait_for_profile(timeout, worker_id=worker_id)
+        if first is not None and config.ENABLE_PROFILE_LEASES:
+            # 视图只负责唤醒，真正的归属以数据库认领为准（可能被其他 worker 抢先认领）
+            db_profile, profile = _load_first_from_db()
+        else:
+            db_profile, profile = _to_profile_pair(first)
+    else:
+        time.sleep(timeout)
+        db_profile, profile = _load_first_from_db()
+
+    if profile:
+        logger.info(f"等待队列中出现新用户: {profile.full_name} (ID: {db_profile.id})")
+        profile.print_info()
+    return db_profile, profile
+
+
+def renew_current_lease(local_mode: bool = False) -> bool:
+    """
+    为当前用户续约（按 PROFILE_LEASE_SECONDS / 3 节流，可在每轮检查前调用）
+
+    Returns:
+        bool: 仍持有当前用户返回 True；租约已被其他 worker 接管或用户已完成时返回 False
+              （续约时数据库出错不算失去租约，返回 True）
+    """
+    global _last_heartbeat
+    if local_mode or not config.ENABLE_PROFILE_LEASES or _current_profile_id is None:
+        return True
+    if time.monotonic() - _last_heartbeat < config.PROFILE_LEASE_SECONDS / 3:
+        return True
+
+    from db.utils import heartbeat_lease
+
+    try:
+        held = heartbeat_lease(_current_profile_id, _get_worker_id(), config.PROFILE_LEASE_SECONDS)
+    except Exception as e:
+        # 数据库暂时不可用时其他 worker 也无法认领，继续处理当前用户，下一轮再续约
+        logger.warning(f"续约失败，下一轮重试: {e}")
+        return True
+    _last_heartbeat = time.monotonic()
+    return held
+
+
+def waiting_candidates(local_mode: bool = False) -> List[Tuple[object, Profile]]:
+    """
+    并行预约的候选用户：按排队顺序的等待中用户，不包括当前用户、本进程已处理完的用户和
+    其他 worker 持有有效租约的用户。优先使用本地等待队列视图，避免在预约关键路径上查询数据库。
+    本地模式只处理固定用户，返回空列表。
+
+    Returns:
+        List[(db_record, Profile)]
+    """
+    if local_mode:
+        return []
+    from db.utils import get_all_waiting_profiles, is_claimable
+
+    excluded = set(_finished_ids)
+    if _current_profile_id is not None:
+        excluded.add(_current_profile_id)
+    try:
+        subscriber = _get_subscriber()
+        waiting = subscriber.view.snapshot() if subscriber is not None else get_all_waiting_profiles()
+    except Exception as e:
+        logger.error(f"获取并行预约的候选用户失败: {e}")
+        return []
+    if config.ENABLE_PROFILE_LEASES:
+        worker_id = _get_worker_id()
+        waiting = [p for p in waiting if is_claimable(p, worker_id)]
+    return [(p, Profile.from_db_record(p)) for p in waiting if p.id not in excluded]
+
+
+def switch_to_more_urgent_profile(local_mode: bool = False) -> Tuple[Optional[object], Optional[Profile]]:
+    """
+    等待队列中出现比当前用户更紧急的用户时（例如人工加权或居留许可即将到期），放下当前用户改为处理它。
+    只读本地等待队列视图（堆顶 O(log n)），不查询数据库；监听不可用时不切换。
+
+    Returns:
+        (db_record, Profile) — 已切换到更紧急的用户
+        (None, None) — 不需要切换
+    """
+    if local_mode or not config.ENABLE_URGENCY_PREEMPTION or _current_profile_id is None:
+        return None, None
+    subscriber = _get_subscriber()
+    if subscriber is None:
+        return None, None
+    from db.utils import urgency_key
+
+    current = subscriber.view.get(_current_profile_id)
+    worker_id = _get_worker_id() if config.ENABLE_PROFILE_LEASES else None
+    first = subscriber.view.first(worker_id)
+    if current is None or first is None or first.id == current.id or urgency_key(first) >= urgency_key(current):
+        return None, None
+
+    previous_name = Profile.from_db_record(current).full_name
+    if config.ENABLE_PROFILE_LEASES:
+        from db.utils import claim_profile
+
+        # 先认领新用户再放下当前用户：认领失败（已被其他 worker 抢先或数据库出错）时继续处理当前用户
+        if not claim_profile(first.id, worker_id, config.PROFILE_LEASE_SECONDS):
+            logger.info(f"更紧急的用户 (ID: {first.id}) 认领失败，继续处理 {previous_name}")
+            return None, None
+        _release_current_lease()
+
+    db_profile, profile = _to_profile_pair(first)
+    logger.info(f"等待队列中有更紧急的用户，从 {previous_name} 切换到 {profile.full_name} (ID: {db_profile.id})")
+    profile.print_info()
+    return db_profile, profile
+
+
+def claim_additional_profile(db_profile) -> bool:
+    """
+    认领匹配引擎选中的用户（未启用租约时直接返回 True）。
+    认领成功后调用方必须在处理完后调用 finish_additional_profile 或 release_additional_profile。
+    """
+    if not config.ENABLE_PROFILE_LEASES:
+        return True
+    from db.utils import claim_profile
+
+    return claim_profile(db_profile.id, _get_worker_id(), config.PROFILE_LEASE_SECONDS)
+
+
+def finish_additional_profile(db_profile) -> None:
+    """并行预约的用户已处理完（状态由发件箱写入），之后不再选中"""
+    if db_profile is None:
+        return
+    _finished_ids.add(db_profile.id)
+    subscriber = _get_subscriber()
+    if subscriber is not None:
+        subscriber.view.remove(db_profile.id)
+
+
+def release_additional_profile(db_profile) -> None:
+    """并行预约没有成功，释放租约让它回到等待队列"""
+    if db_profile is None or not config.ENABLE_PROFILE_LEASES:
+        return
+    from db.utils import release_lease
+
+    try:
+        release_lease(db_profile.id, _get_worker_id())
+    except Exception as e:
+        logger.error(f"释放用户 {db_profile.id} 的租约失败: {e}")
@@ -4,15 +4,14 @@
 负责预约成功/失败后的副作用操作：
 - 发送邮件通知
 - 更新数据库状态
-本地模式下跳过数据库操作。
+本地模式下跳过数据库操作。每个函数返回是否成功，供 superc.outbox 判断是否需要重试；
+数据库状态更新另外用 None 表示暂时出错（可重试），False 表示记录已不在等待状态（重试也不会成功）。
 """
 
 import logging
 from datetime import datetime
 from typing import Optional
 
-from superc.email.notify_email import send_notify_email, send_update_email_notice
-
 logger = logging.getLogger("main")
 
 
@@ -20,8 +19,9 @@ logger = logging.getLogger("main")
 # Email notifications
 # ---------------------------------------------------------------------------
 
-def notify_booking_success(email: str, full_name: str, appointment_dt: Optional[datetime], location: str = "SuperC") -> None:
+def notify_booking_success(email: str, full_name: str, appointment_dt: Optional[datetime], location: str = "SuperC") -> bool:
     """发送预约成功确认邮件"""
+    from superc.email.notify_email import send_notify_email
     try:
         appointment_info = {
             "name": full_name,
@@ -33,31 +33,36 @@ def notify_booking_success(email: str, full_name: str, appointment_dt: Optional[
             logger.info(f"已向用户 {email} 发送预约确认邮件")
         else:
             logger.warning("邮件发送失败，但预约已成功完成")
+        return bool(sent)
     except Exception as e:
         logger.error(f"发送邮件通知时发生错误: {e}")
+        return False
 
 
-def notify_email_update_needed(email: str, full_name: str) -> None:
+def notify_email_update_needed(email: str, full_name: str) -> bool:
     """向用户发送邮箱更新提醒（账号被限制时）"""
+    from superc.email.notify_email import send_update_email_notice
     try:
         sent = send_update_email_notice(email, full_name)
         if sent:
             logger.info(f"已向用户 {email} 发送邮箱更新提醒邮件")
         else:
             logger.warning(f"邮箱更新提醒邮件发送失败: {email}")
+        return bool(sent)
     except Exception as e:
         logger.error(f"发送邮箱更新提醒邮件时发生异常: {e}")
+        return False
 
 
 # ---------------------------------------------------------------------------
 # Database status updates
 # ---------------------------------------------------------------------------
 
-def mark_as_error(db_profile_id: Optional[int], full_name: str) -> None:
-    """将用户状态标记为 error"""
+def mark_as_error(db_profile_id: Optional[int], full_name: str) -> Optional[bool]:
+    """将用户状态标记为 error（返回值见模块说明）"""
     if db_profile_id is None:
         logger.info(f"[本地模式] 用户 {full_name} 状态标记为 error（无数据库更新）")
-        return
+        return True
 
     from db.utils import update_appointment_status
     try:
@@ -66,15 +71,17 @@ def mark_as_error(db_profile_id: Optional[int], full_name: str) -> None:
             logger.info(f"已更新用户 {full_name} 的状态为 'error'")
         else:
             logger.error("更新用户状态为error失败")
+        return success
     except Exception as e:
         logger.error(f"更新数据库状态时发生错误: {e}")
+        return None
 
 
-def mark_as_booked(db_profile_id: Optional[int], full_name: str, appointment_dt: Optional[datetime]) -> None:
-    """将用户状态标记为 booked"""
+def mark_as_booked(db_profile_id: Optional[int], full_name: str, appointment_dt: Optional[datetime]) -> Optional[bool]:
+    """将用户状态标记为 booked（返回值见模块说明）"""
     if db_profile_id is None:
         logger.info(f"[本地模式] 用户 {full_name} 预约成功！状态标记为 booked（无数据库更新）")
-        return
+        return True
 
     from db.utils import update_appointment_status
     try:
@@ -86,5 +93,7 @@ def mark_as_booked(db_profile_id: Optional[int], full_name: str, appointment_dt:
                 logger.info(f"已更新用户 {full_name} 的状态为 'booked'")
         else:
             logger.error("更新用户状态失败，但预约已成功")
+        return success
     except Exception as e:
         logger.error(f"更新数据库状态时发生错误: {e}")
+        return None
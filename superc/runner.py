@@ -11,9 +11,37 @@ import time
 from datetime import datetime
 
 from superc.appointment_checker import run_check
-from superc.config import LOCATIONS
-from superc.profile_loader import get_first_profile, get_next_profile
+from superc.config import (
+    ENABLE_FANOUT,
+    ENABLE_OUTBOX,
+    ENABLE_PREWARM,
+    FANOUT_MAX_PROFILES,
+    FANOUT_REQUESTS_PER_PROFILE,
+    FANOUT_RESERVED_TOKENS,
+    ENABLE_RATE_GOVERNOR,
+    LOCATIONS,
+    QUEUE_WAIT_TIMEOUT,
+    RATE_LIMIT_PENALTY_SECONDS,
+)
+from superc.fanout import FanOutBooker
+from superc.outbox import get_outbox
+from superc.prewarm import get_prewarmer
+from superc.profile_loader import (
+    can_wait_for_profiles,
+    check_profile_schema,
+    claim_additional_profile,
+    finish_additional_profile,
+    get_first_profile,
+    get_next_profile,
+    release_additional_profile,
+    renew_current_lease,
+    switch_to_more_urgent_profile,
+    wait_for_next_profile,
+    waiting_candidates,
+)
 from superc import result_handler
+from superc.utils.flight_recorder import get_flight_recorder
+from superc.utils.rate_governor import get_rate_governor
 
 logger = logging.getLogger("main")
 
@@ -22,46 +50,113 @@ POLL_INTERVAL = 60
 # 自动退出时间（小时）
 AUTO_EXIT_HOUR = 1
 
+# run_check 结果对应的主循环动作，见 next_action（superc/simulator.py 使用同一个判断）
+ACTION_WAIT = "wait"                        # 没有走到 Schritt 5（没有可用时间、Schritt 2-4 失败）: 等待下一轮
+ACTION_SERVER_ERROR = "server_error"        # Schritt 5 重试后仍是 superC server error: 等待 POLL_INTERVAL
+ACTION_ACCOUNT_BLOCKED = "account_blocked"  # zu vieler Terminanfragen: 暂停同一出口的请求，标记用户并切换
+ACTION_BOOKED = "booked"                    # 预约成功: 切换到下一个用户
+ACTION_RETRY = "retry"                      # 其他结果（验证码重试用完、Schritt 5 超时等）: 立即重查
+
+
+def next_action(has_appointment: bool, message: str) -> str:
+    """
+    把一次 run_check 的结果映射为主循环的动作
+    Input: has_appointment: bool, message: str - run_check 的前两个返回值
+    Output: str - ACTION_* 之一
+    """
+    if not has_appointment:
+        return ACTION_WAIT
+    if message == "superC server error":
+        return ACTION_SERVER_ERROR
+    if "zu vieler Terminanfragen" in message:
+        return ACTION_ACCOUNT_BLOCKED
+    if "预约已完成" in message:
+        return ACTION_BOOKED
+    return ACTION_RETRY
+
 
 def run(local_mode: bool = False) -> None:
     """程序主入口：加载用户并开始预约检查循环"""
     superc_config = LOCATIONS["superc"]
 
+    # 数据库缺少迁移字段时所有查询都会失败，不能当成等待队列为空
+    if not check_profile_schema(local_mode):
+        sys.exit(1)
+
     # 获取第一个待处理用户
     current_db_profile, current_profile = get_first_profile(local_mode=local_mode)
 
+    if not current_profile and can_wait_for_profiles(local_mode):
+        current_db_profile, current_profile = _wait_for_profile(local_mode)
+
     if not current_profile:
         logger.info("No profiles to process, exiting.")
         sys.exit(0)
 
+    # 放号前预热好的 session，只给紧接着的一次 run_check 使用
+    warm_state = None
+
     # 主循环
     while True:
         if datetime.now().hour == AUTO_EXIT_HOUR:
             logger.info(f"已到凌晨 {AUTO_EXIT_HOUR} 点，程序自动退出")
             break
 
+        # 多 worker 时定期续约；租约丢失说明用户已被其他 worker 接管或已完成
+        if not renew_current_lease(local_mode=local_mode):
+            logger.warning(f"用户 {current_profile.full_name} 的租约已失效，切换到下一个用户")
+            current_db_profile, current_profile = _advance_profile(local_mode)
+            if not current_profile:
+                logger.info("没有更多等待的用户，程序退出")
+                break
+
+        # 可用时间稀缺时优先给最紧急的用户
+        urgent_db_profile, urgent_profile = switch_to_more_urgent_profile(local_mode=local_mode)
+        if urgent_profile:
+            current_db_profile, current_profile = urgent_db_profile, urgent_profile
+
         try:
-            has_appointment, message, appointment_dt = run_check(superc_config, current_profile)
+            state, warm_state = warm_state, None
+            fanout = _new_fanout(superc_config, local_mode)
+            # 本轮的飞行记录由这里开始和结束，结果记在这一轮上（并行预约在工作线程中各自记录）
+            recorder = get_flight_recorder()
+            cycle = recorder.begin_cycle(superc_config["name"])
+            try:
+                has_appointment, message, appointment_dt = run_check(
+                    superc_config, current_profile, warm_state=state,
+                    on_slots=fanout.on_slots if fanout else None, cycle=cycle,
+                )
+            except Exception as e:
+                recorder.end_cycle(cycle, outcome=str(e))
+                raise
+            else:
+                recorder.end_cycle(cycle, outcome=message)
+            finally:
+                # 其他用户的并行预约无论当前用户结果如何都要收尾，否则成功的预约不会被记录
+                _settle_fanout(fanout)
 
-            # 无可用预约 → 等待后重试
-            if not has_appointment:
-                time.sleep(POLL_INTERVAL)
+            action = next_action(has_appointment, message)
+
+            # 无可用预约 → 等待后重试（临近放号时刻时顺便预热）
+            if action == ACTION_WAIT:
+                warm_state = _sleep_until_next_poll(superc_config)
                 continue
 
             # Server error → 等待后重试
-            if message == "superC server error":
+            if action == ACTION_SERVER_ERROR:
+                _dump_flight_recorder("schritt5_server_error")
                 logger.warning("检测到 superC server error，等待60秒后重试")
                 time.sleep(POLL_INTERVAL)
                 continue
 
             # ---------- 处理预约结果 ----------
-            should_advance = _handle_result(
-                message, appointment_dt, current_profile, current_db_profile
-            )
-
-            if should_advance:
+            if action in (ACTION_ACCOUNT_BLOCKED, ACTION_BOOKED):
+                _handle_result(message, appointment_dt, current_profile, current_db_profile)
+                # 预约成功时也保留完整页面，便于核对
+                if action == ACTION_BOOKED:
+                    _dump_flight_recorder("booked")
                 logger.info("处理完成！检查是否有下一个用户...")
-                current_db_profile, current_profile = get_next_profile(local_mode=local_mode)
+                current_db_profile, current_profile = _advance_profile(local_mode)
                 if current_profile:
                     logger.info("继续查询下一个用户的预约...")
                     continue
@@ -71,14 +166,94 @@ def run(local_mode: bool = False) -> None:
 
             # 未匹配任何已知结果
             logger.warning(f"出现未预期的消息: {message}")
+            _dump_flight_recorder("form_failure" if "填写表单失败" in message else "unexpected")
 
         except Exception as e:
             logger.error(f"检查过程中发生未预料的错误: {e}", exc_info=True)
+            _dump_flight_recorder("exception")
+
+
+def _advance_profile(local_mode: bool) -> tuple:
+    """切换到下一个用户，队列为空时等待新用户注册"""
+    db_profile, profile = get_next_profile(local_mode=local_mode)
+    if not profile and can_wait_for_profiles(local_mode):
+        db_profile, profile = _wait_for_profile(local_mode)
+    return db_profile, profile
+
+
+def _wait_for_profile(local_mode: bool) -> tuple:
+    """
+    等待队列为空时阻塞等待新用户注册，到自动退出时间仍无用户则返回 (None, None)
+    """
+    logger.info("等待队列为空，等待新用户注册...")
+    while datetime.now().hour != AUTO_EXIT_HOUR:
+        db_profile, profile = wait_for_next_profile(QUEUE_WAIT_TIMEOUT, local_mode=local_mode)
+        if profile:
+            return db_profile, profile
+    return None, None
+
+
+def _new_fanout(location_config: dict, local_mode: bool):
+    """同一批放号并行预约其他等待中的用户（本地模式只有一个用户，不启用）"""
+    if not ENABLE_FANOUT or local_mode:
+        return None
+    return FanOutBooker(
+        location_config,
+        candidates=lambda: waiting_candidates(local_mode=local_mode),
+        claim=claim_additional_profile,
+        max_profiles=FANOUT_MAX_PROFILES,
+        budget=_fanout_budget if ENABLE_RATE_GOVERNOR else None,
+    )
+
+
+def _fanout_budget() -> int:
+    """令牌桶余量（扣除留给当前用户 Schritt 5/6 的部分）还够几个用户并行预约"""
+    available = get_rate_governor().available(booking=True) - FANOUT_RESERVED_TOKENS
+    return max(0, int(available // FANOUT_REQUESTS_PER_PROFILE))
+
+
+def _settle_fanout(fanout) -> None:
+    """
+    等待并行预约完成并处理结果：和当前用户一样交给 _handle_result（预约成功、账号被限制），
+    处理完的用户不再选中，其余释放租约回到等待队列
+    """
+    if fanout is None:
+        return
+    for db_profile, profile, (_, message, appointment_dt) in fanout.results():
+        try:
+            handled = _handle_result(message, appointment_dt, profile, db_profile)
+        except Exception as e:
+            logger.error(f"处理 {profile.full_name} 的并行预约结果失败: {e}", exc_info=True)
+            handled = False
+        if handled:
+            finish_additional_profile(db_profile)
+        else:
+            logger.info(f"{profile.full_name} 并行预约未成功: {message}")
+            release_additional_profile(db_profile)
+
+
+def _sleep_until_next_poll(location_config: dict):
+    """
+    等待下一轮查询；等待期间跨过预热点时返回预热好的 WarmState，否则返回 None
+    """
+    if not ENABLE_PREWARM:
+        time.sleep(POLL_INTERVAL)
+        return None
+    return get_prewarmer(location_config).sleep_until_next_poll(POLL_INTERVAL)
+
+
+def _dump_flight_recorder(reason: str) -> None:
+    """把飞行记录器中最近几轮的请求/响应写盘，写盘失败不影响主循环"""
+    try:
+        get_flight_recorder().dump(reason)
+    except Exception as e:
+        logger.error(f"飞行记录器转储失败: {e}")
 
 
 def _handle_result(message: str, appointment_dt, profile, db_profile) -> bool:
     """
     处理单次检查结果，返回是否应该切换到下一个用户。
+    副作用（邮件、数据库状态）写入发件箱后立即返回，由后台线程投递。
 
     Returns:
         True  — 当前用户处理完毕，应获取下一个
@@ -86,18 +261,28 @@ def _handle_result(message: str, appointment_dt, profile, db_profile) -> bool:
     """
     db_id = db_profile.id if db_profile else None
 
+    action = next_action(True, message)
+
     # 情况1: 账号被限制（提交过于频繁）
-    if "zu vieler Terminanfragen" in message:
+    if action == ACTION_ACCOUNT_BLOCKED:
         logger.error("检测到错误: 提交过于频繁 (zu vieler Terminanfragen)")
-        result_handler.notify_email_update_needed(profile.email, profile.full_name)
-        result_handler.mark_as_error(db_id, profile.full_name)
+        if ENABLE_RATE_GOVERNOR:
+            get_rate_governor().penalize(RATE_LIMIT_PENALTY_SECONDS)
+        if ENABLE_OUTBOX:
+            get_outbox().enqueue_account_blocked(profile.email, profile.full_name, db_id)
+        else:
+            result_handler.notify_email_update_needed(profile.email, profile.full_name)
+            result_handler.mark_as_error(db_id, profile.full_name)
         return True
 
     # 情况2: 预约成功
-    if "预约已完成" in message:
+    if action == ACTION_BOOKED:
         logger.info(f"成功！ {message}")
-        result_handler.notify_booking_success(profile.email, profile.full_name, appointment_dt, location="SuperC")
-        result_handler.mark_as_booked(db_id, profile.full_name, appointment_dt)
+        if ENABLE_OUTBOX:
+            get_outbox().enqueue_booking_success(profile.email, profile.full_name, db_id, appointment_dt, location="SuperC")
+        else:
+            result_handler.notify_booking_success(profile.email, profile.full_name, appointment_dt, location="SuperC")
+            result_handler.mark_as_booked(db_id, profile.full_name, appointment_dt)
         return True
 
     return False
@@ -0,0 +1,625 @@
+"""
+离散事件模拟器
+
+在真实网站上调整 POLL_INTERVAL、限速参数和验证码识别方案既慢又有被封号的风险。模拟器在虚拟时间中
+运行 runner 的调度策略，几秒钟内模拟上千天，用来比较不同参数下的预约成功率:
+
+- 网站: 固定时刻集中放号（泊松数量、时间抖动）+ 全天零散出现的取消；没被抢走的时间由人工预约逐个拿走；
+  同一出口在滑动窗口内请求过多时返回 "zu vieler Terminanfragen"
+- 竞争的机器人: 各自按固定间隔轮询，看到可用时间后经过一段预约用时抢走一个
+- 我们的 runner: 真实的 RateGovernor（令牌桶）和 Prewarmer（轮询 / 放号前预热的等待策略）跑在虚拟时钟上。
+  每次检查得到和 run_check 相同的 (has_appointment, message)，再由 runner.next_action 决定下一步，
+  和 runner.run 走同一套分支: 没走到 Schritt 5（没有可用时间、Schritt 2-4 被限速）时等待下一轮，
+  superC server error 时等待一个轮询间隔，Schritt 5/6 被限速时暂停请求并切换用户，其他结果立即重查。
+  BookingFlow 的重试次数（config.BOOKING_STEP_RETRIES）、Schritt 5 时间预算、验证码最多 10 次重试
+  照原样建模；各步骤的网络用时、验证码识别用时和准确率从分布中抽样
+
+没有建模的部分: 并行预约（fan-out，一批放号同时为多个用户预约）、紧急程度切换和多 worker 租约——
+模拟中始终只有一个用户在被处理，用户之间没有区别；预约成功率因此是单用户 runner 的下限。
+
+网站和机器人是事件队列中的事件；runner 是一个顺序执行的过程，每次 sleep 都把虚拟时钟推进到醒来的时刻，
+并依次处理这段时间内发生的事件。
+
+用法:
+    result = Simulation(RunnerModel(captcha_accuracy=0.9), BotModel(count=10), seed=1).run(days=1000)
+    print(result.format())
+
+    python -m superc.simulator --days 1000 --bots 10 --captcha-accuracy 0.9
+"""
+
+import argparse
+import heapq
+import itertools
+import logging
+import math
+import random
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from superc import config
+from superc.prewarm import Prewarmer, WarmState, next_release_instant, parse_release_times
+from superc.runner import (
+    ACTION_ACCOUNT_BLOCKED,
+    ACTION_BOOKED,
+    ACTION_SERVER_ERROR,
+    ACTION_WAIT,
+    AUTO_EXIT_HOUR,
+    POLL_INTERVAL,
+    next_action,
+)
+from superc.utils.rate_governor import RateGovernor
+
+
+# 虚拟时间从这一天 00:00 开始（周一）
+EPOCH = datetime(2025, 1, 6)
+DAY = 24 * 3600.0
+
+# (has_appointment, message)，message 与真实流程中的消息一致，由 runner.next_action 判断下一步
+CheckResult = Tuple[bool, str]
+_NO_SLOT = (False, "当前没有可用预约时间")
+# Schritt 2-4 被网站限速: 真实流程在这几步失败时 has_appointment 为 False，runner 只是等待下一轮
+_QUERY_BLOCKED = (False, "Schritt 4 失败: zu vieler Terminanfragen")
+_SCHRITT_5_RESULTS: Dict[str, CheckResult] = {
+    "booked": (True, "Schritt 6 完成: 预约已完成，等待邮件确认"),
+    "rate_limited": (True, "预约失败: zu vieler Terminanfragen"),
+    "captcha_failed": (True, "填写表单失败: 验证码错误"),
+    "server_error": (True, "superC server error"),
+    "timeout": (True, "Schritt 5 POST请求超时"),
+    "slot_lost": (True, "Schritt 5 失败: 提交时间后未进入Schritt 5"),
+    "slot_taken": (True, "Schritt 5 失败: 选中的时间已被预约"),
+}
+
+
+@dataclass(frozen=True)
+class LogNormal:
+    """对数正态分布的用时，median 为中位数（秒）"""
+
+    median: float
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.median), self.sigma) if self.sigma > 0 else self.median
+
+
+@dataclass
+class SiteModel:
+    """预约网站: 放号、取消、人工预约和网站自己的限速"""
+
+    # 集中放号的时刻，每个时刻当天以 release_probability 的概率放号
+    release_times: Sequence[str] = ("07:00", "08:00")
+    release_probability: float = 0.5
+    release_jitter_seconds: float = 20.0
+    # 每次放号的数量（泊松分布均值）
+    slots_per_release: float = 3.0
+    # 其他时间零散出现的可用时间（取消等），每天的数量（泊松分布均值）
+    cancellations_per_day: float = 2.0
+    # 没有被机器人抢走时，一个可用时间被人工预约拿走的平均用时（指数分布）
+    human_take_seconds: float = 900.0
+    # 同一出口在 rate_limit_window_seconds 内的请求超过 rate_limit_requests 时返回 zu vieler Terminanfragen
+    rate_limit_requests: int = 40
+    rate_limit_window_seconds: float = 60.0
+    # Schritt 5 提交选中时间时返回 superC server error 的概率（没有实测数据，默认不出现）
+    server_error_probability: float = 0.0
+
+
+@dataclass
+class BotModel:
+    """其他人的预约机器人"""
+
+    count: int = 5
+    poll_interval_seconds: float = 30.0
+    # 从看到可用时间到提交完成的用时
+    booking_seconds: LogNormal = LogNormal(10.0, 0.5)
+
+
+@dataclass
+class RunnerModel:
+    """我们的 runner: 调度参数默认取当前配置，各步骤用时和验证码识别从分布中抽样"""
+
+    poll_interval: float = POLL_INTERVAL
+    prewarm: bool = config.ENABLE_PREWARM
+    prewarm_release_times: Sequence[str] = tuple(config.PREWARM_RELEASE_TIMES)
+    prewarm_lead_seconds: float = config.PREWARM_LEAD_SECONDS
+    rate_limits: Dict[str, float] = field(default_factory=lambda: dict(config.RATE_LIMITS["default"]))
+    rate_limit_penalty_seconds: float = config.RATE_LIMIT_PENALTY_SECONDS
+    step_retries: Dict[str, int] = field(default_factory=lambda: dict(config.BOOKING_STEP_RETRIES))
+    schritt_5_budget_seconds: float = config.STEP_BUDGETS["Schritt 5"]["total"]
+    # 等待预约的用户数，None 表示始终有用户在等待
+    profiles: Optional[int] = None
+    # Schritt 2-3 的请求数和用时（预热时提前完成）
+    schritt_2_3_requests: int = 3
+    schritt_2_3_seconds: LogNormal = LogNormal(1.5, 0.3)
+    schritt_4_seconds: LogNormal = LogNormal(0.6, 0.3)
+    # Schritt 5 提交选中时间、提交表单，Schritt 6 确认的用时
+    submit_seconds: LogNormal = LogNormal(0.8, 0.3)
+    captcha_seconds: LogNormal = LogNormal(3.0, 0.5)
+    captcha_accuracy: float = 0.8
+    captcha_retries: int = 10
+
+
+@dataclass
+class SimulationResult:
+    """模拟统计"""
+
+    days: float = 0.0
+    released: int = 0
+    booked: int = 0
+    taken_by_bots: int = 0
+    taken_by_humans: int = 0
+    polls: int = 0
+    requests: int = 0
+    rate_limited: int = 0
+    captcha_errors: int = 0
+    # 提交时间或提交表单时可用时间已经被别人拿走
+    slot_lost: int = 0
+    # 验证码重试用完、Schritt 5 超时等导致的立即重查
+    unexpected: int = 0
+    # Schritt 5 重试后仍是 superC server error，等待一个轮询间隔
+    server_errors: int = 0
+    prewarmed: int = 0
+    governor_wait_seconds: float = 0.0
+    # 每次预约成功距离这批可用时间出现的秒数
+    booking_delays: List[float] = field(default_factory=list)
+
+    @property
+    def success_rate(self) -> float:
+        """我们约到的时间占放出时间的比例"""
+        return self.booked / self.released if self.released else 0.0
+
+    def delay_percentile(self, q: float) -> float:
+        if not self.booking_delays:
+            return math.nan
+        ordered = sorted(self.booking_delays)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def format(self) -> str:
+        return "\n".join([
+            f"模拟 {self.days:.0f} 天: 放出 {self.released} 个时间，"
+            f"我们约到 {self.booked} ({self.success_rate:.1%})，机器人 {self.taken_by_bots}，人工 {self.taken_by_humans}",
+            f"轮询 {self.polls} 次，请求 {self.requests} 次，限速等待 {self.governor_wait_seconds:.0f}s，"
+            f"被网站限速 {self.rate_limited} 次，预热 {self.prewarmed} 次",
+            f"验证码错误 {self.captcha_errors} 次，时间被抢走 {self.slot_lost} 次，"
+            f"server error {self.server_errors} 次，意外结果 {self.unexpected} 次",
+            f"约到用时 p50/p90 = {self.delay_percentile(0.5):.1f}/{self.delay_percentile(0.9):.1f}s",
+        ])
+
+
+class VirtualClock:
+    """虚拟时钟和事件队列: sleep 把时间推进到醒来的时刻，并按时间顺序执行期间的事件"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self._events: list = []
+        self._sequence = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+
+    def datetime(self) -> datetime:
+        return EPOCH + timedelta(seconds=self.now)
+
+    def schedule(self, at: float, action: Callable, *args) -> None:
+        heapq.heappush(self._events, (at, next(self._sequence), action, args))
+
+    def next_event_at(self) -> float:
+        return self._events[0][0] if self._events else math.inf
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(self.now + max(seconds, 0.0))
+
+    def advance(self, until: float) -> None:
+        events = self._events
+        while events and events[0][0] <= until:
+            at, _, action, args = heapq.heappop(events)
+            self.now = max(self.now, at)
+            action(*args)
+        self.now = max(self.now, until)
+
+
+class _VirtualGovernor(RateGovernor):
+    """桶状态保存在内存中、时间来自虚拟时钟的 RateGovernor"""
+
+    def __init__(self, clock: VirtualClock, **limits) -> None:
+        super().__init__(identity="simulation", state_dir="simulation", clock=clock.time, sleep=clock.sleep, **limits)
+        self._state = (self.capacity, clock.time(), 0.0)
+
+    @contextmanager
+    def _locked_state(self) -> Iterator:
+        def write(tokens: float, updated_at: float, blocked_until: float) -> None:
+            self._state = (tokens, updated_at, blocked_until)
+
+        yield self._state, write
+
+    def steady(self, requests: int, cycle_seconds: float) -> bool:
+        """没有被暂停、桶接近满，并且每轮消耗的令牌在一轮内就能补回: 按这个节奏轮询不会等待"""
+        tokens, updated_at, blocked_until = self._state
+        now = self._clock()
+        tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+        return now >= blocked_until and tokens >= self.capacity - requests and self.rate * cycle_seconds >= requests
+
+
+class _SimulatedSite:
+    """网站和竞争机器人的状态，所有变化都是虚拟时钟上的事件"""
+
+    def __init__(self, model: SiteModel, bots: BotModel, clock: VirtualClock, seed: int, result: SimulationResult) -> None:
+        self.model = model
+        self.bots = bots
+        self.clock = clock
+        # 放号过程单独使用一个随机数序列: 同一个种子下不同 runner 参数面对完全相同的放号，比较时噪声更小
+        self._release_rng = random.Random(f"release-{seed}")
+        self.rng = random.Random(f"site-{seed}")
+        self.result = result
+        self.open_slots = 0
+        # 最近一次从没有到有可用时间的时刻
+        self.opened_at = 0.0
+        self._release_minutes = parse_release_times(model.release_times)
+        self._recent_requests: deque = deque()
+        self._bot_phases = [self.rng.uniform(0, bots.poll_interval_seconds) for _ in range(bots.count)]
+        self._idle_bots = set(range(bots.count))
+        # 人工预约事件的版本号，可用时间数变化后之前安排的事件作废
+        self._human_generation = 0
+
+    # -------------------- 放号 --------------------
+
+    def schedule_day(self, day: int) -> None:
+        """在每天 00:00 安排当天的放号和取消，并安排第二天"""
+        start, rng = day * DAY, self._release_rng
+        for minute in self._release_minutes:
+            if rng.random() < self.model.release_probability:
+                at = start + minute * 60 + abs(rng.gauss(0, self.model.release_jitter_seconds))
+                self.clock.schedule(at, self._release, _poisson(rng, self.model.slots_per_release))
+        for _ in range(_poisson(rng, self.model.cancellations_per_day)):
+            self.clock.schedule(start + rng.uniform(0, DAY), self._release, 1)
+        self.clock.schedule(start + DAY, self.schedule_day, day + 1)
+
+    def _release(self, count: int) -> None:
+        if count <= 0:
+            return
+        if self.open_slots == 0:
+            self.opened_at = self.clock.now
+            self._wake_bots()
+        self.open_slots += count
+        self.result.released += count
+        self._schedule_human()
+
+    def _schedule_human(self) -> None:
+        """每个可用时间以相同速率被人工预约拿走: 下一次人工预约的间隔服从速率为 open_slots / 平均用时 的指数分布"""
+        self._human_generation += 1
+        if self.open_slots > 0:
+            delay = self.rng.expovariate(self.open_slots / self.model.human_take_seconds)
+            self.clock.schedule(self.clock.now + delay, self._human_take, self._human_generation)
+
+    def _human_take(self, generation: int) -> None:
+        if generation != self._human_generation or self.open_slots == 0:
+            return
+        self.open_slots -= 1
+        self.result.taken_by_humans += 1
+        self._schedule_human()
+
+    def take(self) -> bool:
+        """我们提交表单: 还有可用时间时约到一个"""
+        if self.open_slots == 0:
+            return False
+        self.open_slots -= 1
+        self.result.booked += 1
+        self.result.booking_delays.append(self.clock.now - self.opened_at)
+        self._schedule_human()
+        return True
+
+    # -------------------- 竞争机器人 --------------------
+
+    def _next_bot_poll(self, bot: int) -> float:
+        interval = self.bots.poll_interval_seconds
+        phase = self._bot_phases[bot]
+        return phase + math.ceil((self.clock.now - phase) / interval) * interval
+
+    def _wake_bots(self) -> None:
+        """没有可用时间时机器人的轮询不影响任何状态，只在有可用时间时才安排它们的下一次轮询"""
+        for bot in self._idle_bots:
+            self.clock.schedule(self._next_bot_poll(bot), self._bot_poll, bot)
+        self._idle_bots.clear()
+
+    def _bot_poll(self, bot: int) -> None:
+        if self.open_slots == 0:
+            self._idle_bots.add(bot)
+            return
+        self.clock.schedule(self.clock.now + self.bots.booking_seconds.sample(self.rng), self._bot_book, bot)
+
+    def _bot_book(self, bot: int) -> None:
+        if self.open_slots > 0:
+            self.open_slots -= 1
+            self.result.taken_by_bots += 1
+            self._schedule_human()
+        self.clock.schedule(self._next_bot_poll(bot), self._bot_poll, bot)
+
+    # -------------------- 网站限速 --------------------
+
+    def request(self) -> bool:
+        """我们的一次请求；返回 False 表示网站提示 zu vieler Terminanfragen"""
+        now = self.clock.now
+        recent = self._recent_requests
+        while recent and recent[0] <= now - self.model.rate_limit_window_seconds:
+            recent.popleft()
+        recent.append(now)
+        self.result.requests += 1
+        return len(recent) <= self.model.rate_limit_requests
+
+
+class _SimulatedPrewarmer(Prewarmer):
+    """在虚拟时间中运行的 Prewarmer: 等待策略不变，warm 只发出 Schritt 2-3 的请求"""
+
+    def __init__(self, simulation: "Simulation") -> None:
+        model = simulation.runner_model
+        super().__init__(
+            {"name": "superc"},
+            release_times=model.prewarm_release_times,
+            lead_seconds=model.prewarm_lead_seconds,
+            now=simulation.clock.datetime,
+            sleep=simulation.clock.sleep,
+        )
+        self._simulation = simulation
+
+    def warm(self, release_at: datetime) -> Optional[WarmState]:
+        if not self._simulation._schritt_2_3():
+            return None
+        self._simulation.result.prewarmed += 1
+        return WarmState(session=None, url="", loc="", release_at=release_at)
+
+
+class Simulation:
+    """
+    在虚拟时间中运行 runner 的调度策略
+
+    Args:
+        runner_model: RunnerModel - 我们的调度参数和各步骤用时
+        bots: BotModel - 竞争的机器人
+        site: SiteModel - 放号过程和网站限速
+        seed: int - 随机数种子，相同参数和种子的结果完全相同
+    """
+
+    def __init__(
+        self,
+        runner_model: Optional[RunnerModel] = None,
+        bots: Optional[BotModel] = None,
+        site: Optional[SiteModel] = None,
+        seed: int = 0,
+    ) -> None:
+        self.runner_model = runner_model or RunnerModel()
+        self.rng = random.Random(f"runner-{seed}")
+        self.clock = VirtualClock()
+        self.result = SimulationResult()
+        self.site = _SimulatedSite(site or SiteModel(), bots or BotModel(), self.clock, seed, self.result)
+        self.governor = _VirtualGovernor(self.clock, **self.runner_model.rate_limits)
+        self.prewarmer = _SimulatedPrewarmer(self)
+
+    def run(self, days: float) -> SimulationResult:
+        """
+        模拟 days 天（用户用完时 runner 提前退出，网站继续运行到结束）
+        Input: days: float
+        Output: SimulationResult
+        """
+        end = days * DAY
+        self.site.schedule_day(0)
+        self._run_runner(end)
+        self.clock.advance(end)
+        self.result.days = days
+        self.result.governor_wait_seconds = self.governor.waited_seconds
+        return self.result
+
+    # ------------------------------------------------------------------
+    # runner.run 的主循环
+    # ------------------------------------------------------------------
+
+    def _run_runner(self, end: float) -> None:
+        model = self.runner_model
+        profiles = model.profiles
+        warm_state = None
+        while self.clock.now < end and (profiles is None or profiles > 0):
+            # 到 AUTO_EXIT_HOUR 自动退出，crontab 在下一个整点重新启动
+            if self.clock.datetime().hour == AUTO_EXIT_HOUR:
+                warm_state = None
+                self.clock.advance((self.clock.now // 3600 + 1) * 3600)
+                continue
+
+            state, warm_state = warm_state, None
+            has_appointment, message = self._run_check(state)
+            if "zu vieler" in message:
+                self.result.rate_limited += 1
+            action = next_action(has_appointment, message)
+
+            if action == ACTION_WAIT:
+                if model.prewarm:
+                    warm_state = self.prewarmer.sleep_until_next_poll(model.poll_interval)
+                else:
+                    self.clock.sleep(model.poll_interval)
+                if warm_state is None and (has_appointment, message) == _NO_SLOT:
+                    self._skip_quiet_polls(end)
+                continue
+
+            if action == ACTION_SERVER_ERROR:
+                self.result.server_errors += 1
+                self.clock.sleep(model.poll_interval)
+                continue
+
+            if action in (ACTION_ACCOUNT_BLOCKED, ACTION_BOOKED):
+                # 账号被限制或预约成功: 切换到下一个用户
+                if action == ACTION_ACCOUNT_BLOCKED:
+                    self.governor.penalize(model.rate_limit_penalty_seconds)
+                if profiles is not None:
+                    profiles -= 1
+                continue
+
+            # 未预期的结果: runner 不等待，立即开始下一轮
+            self.result.unexpected += 1
+
+    def _skip_quiet_polls(self, end: float) -> None:
+        """
+        没有可用时间时，到下一个网站事件（放号、取消等）之前的轮询结果一定是 no_slot，也不会触发限速:
+        按各步骤的中位用时一次跳过这些轮询，只累加计数。跳到预热点、自动退出时间之前为止，
+        这些时刻附近仍然逐轮模拟。模拟上千天时绝大部分时间都在这种空闲轮询中
+        """
+        if self.site.open_slots:
+            return
+        model = self.runner_model
+        requests = model.schritt_2_3_requests + 1
+        cycle = model.poll_interval + model.schritt_2_3_seconds.median + model.schritt_4_seconds.median
+        if not self.governor.steady(requests, cycle):
+            return
+
+        now = self.clock.datetime()
+        if now.hour == AUTO_EXIT_HOUR:
+            return
+        horizon = min(self.clock.next_event_at(), end)
+        exit_at = now.replace(hour=AUTO_EXIT_HOUR, minute=0, second=0, microsecond=0)
+        if exit_at <= now:
+            exit_at += timedelta(days=1)
+        horizon = min(horizon, self.clock.now + (exit_at - now).total_seconds())
+        if model.prewarm:
+            release_at = next_release_instant(now, self.prewarmer.release_minutes)
+            if release_at is not None:
+                warm_at = (release_at - now).total_seconds() - model.prewarm_lead_seconds - model.poll_interval
+                horizon = min(horizon, self.clock.now + warm_at)
+
+        # 留出一轮的余量，最后一轮之后的轮询照常模拟
+        skipped = int((horizon - self.clock.now) // cycle) - 1
+        if skipped <= 0:
+            return
+        self.clock.advance(self.clock.now + skipped * cycle)
+        self.result.polls += skipped
+        self.result.requests += skipped * requests
+
+    # ------------------------------------------------------------------
+    # BookingFlow: Schritt 2 → 6
+    # ------------------------------------------------------------------
+
+    def _request(self, booking: bool = False) -> bool:
+        self.governor.acquire(booking=booking)
+        return self.site.request()
+
+    def _schritt_2_3(self) -> bool:
+        for _ in range(self.runner_model.schritt_2_3_requests):
+            if not self._request():
+                return False
+        self.clock.sleep(self.runner_model.schritt_2_3_seconds.sample(self.rng))
+        return True
+
+    def _run_check(self, warm_state: Optional[WarmState]) -> CheckResult:
+        """
+        一次 run_check，返回和真实 run_check 相同的 (has_appointment, message)，交给 runner.next_action
+        """
+        model = self.runner_model
+        if warm_state is None and not self._schritt_2_3():
+            return _QUERY_BLOCKED
+
+        attempts: Dict[str, int] = {}
+        step = "Schritt 4"
+        while True:
+            if step == "Schritt 4":
+                if not self._request():
+                    return _QUERY_BLOCKED
+                self.clock.sleep(model.schritt_4_seconds.sample(self.rng))
+                self.result.polls += 1
+                if self.site.open_slots == 0:
+                    return _NO_SLOT
+                step = "Schritt 5"
+                continue
+
+            outcome = self._schritt_5_6()
+            if outcome in ("booked", "rate_limited", "captcha_failed"):
+                return _SCHRITT_5_RESULTS[outcome]
+            # server error → 重试 Schritt 5；超时 / 提交时间后未进入 Schritt 5 → 回到 Schritt 4（与 BookingFlow 相同）
+            attempts[step] = attempts.get(step, 0) + 1
+            if attempts[step] > model.step_retries.get(step, 0):
+                return _SCHRITT_5_RESULTS[outcome]
+            step = "Schritt 5" if outcome == "server_error" else "Schritt 4"
+
+    def _schritt_5_6(self) -> str:
+        model = self.runner_model
+        started = self.clock.now
+        # 提交选中的时间
+        if not self._request(booking=True):
+            return "rate_limited"
+        self.clock.sleep(model.submit_seconds.sample(self.rng))
+        error_probability = self.site.model.server_error_probability
+        if error_probability > 0 and self.rng.random() < error_probability:
+            return "server_error"
+        if self.site.open_slots == 0:
+            self.result.slot_lost += 1
+            return "slot_lost"
+
+        # fill_form_with_captcha_retry: 每次重试重新获取验证码、识别并提交
+        for _ in range(model.captcha_retries):
+            if not self._request(booking=True):
+                return "rate_limited"
+            self.clock.sleep(model.captcha_seconds.sample(self.rng))
+            if not self._request(booking=True):
+                return "rate_limited"
+            self.clock.sleep(model.submit_seconds.sample(self.rng))
+            if self.clock.now - started > model.schritt_5_budget_seconds:
+                return "timeout"
+            if self.rng.random() >= model.captcha_accuracy:
+                self.result.captcha_errors += 1
+                continue
+            if not self.site.take():
+                self.result.slot_lost += 1
+                return "slot_taken"
+            # Schritt 6 确认
+            if not self._request(booking=True):
+                return "rate_limited"
+            self.clock.sleep(model.submit_seconds.sample(self.rng))
+            return "booked"
+        return "captcha_failed"
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """泊松分布抽样（均值较小时的 Knuth 算法）"""
+    if mean <= 0:
+        return 0
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def main() -> None:
+    """CLI entry point"""
+    parser = argparse.ArgumentParser(description="在虚拟时间中模拟放号、竞争机器人和 runner 的调度策略")
+    parser.add_argument("--days", type=float, default=365, help="模拟天数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="runner 轮询间隔（秒）")
+    parser.add_argument("--no-prewarm", action="store_true", help="关闭放号前预热")
+    parser.add_argument("--per-minute", type=float, default=None, help="RateGovernor 每分钟令牌数")
+    parser.add_argument("--captcha-seconds", type=float, default=3.0, help="验证码识别用时中位数")
+    parser.add_argument("--captcha-accuracy", type=float, default=0.8, help="验证码识别准确率")
+    parser.add_argument("--bots", type=int, default=5, help="竞争机器人数量")
+    parser.add_argument("--bot-interval", type=float, default=30.0, help="机器人轮询间隔（秒）")
+    parser.add_argument("--site-limit", type=int, default=40, help="网站每分钟允许的请求数")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="Schritt 5 提交时 superC server error 的概率")
+    args = parser.parse_args()
+
+    # 被网站限速时 RateGovernor 的警告每次都会输出，模拟时只看统计
+    logging.getLogger("superc.utils.rate_governor").setLevel(logging.ERROR)
+
+    runner_model = RunnerModel(
+        poll_interval=args.poll_interval,
+        prewarm=not args.no_prewarm,
+        captcha_seconds=LogNormal(args.captcha_seconds, 0.5),
+        captcha_accuracy=args.captcha_accuracy,
+    )
+    if args.per_minute is not None:
+        runner_model.rate_limits["per_minute"] = args.per_minute
+    simulation = Simulation(
+        runner_model,
+        BotModel(count=args.bots, poll_interval_seconds=args.bot_interval),
+        SiteModel(rate_limit_requests=args.site_limit, server_error_probability=args.server_errors),
+        seed=args.seed,
+    )
+    print(simulation.run(args.days).format())
+
+
+if __name__ == "__main__":
+    main()
@@ -90,4 +90,15 @@ def parse_all_appointments(suggest_res_text: str) -> List[Dict]:
             except (ValueError, TypeError) as e:
                 logger.error(f"Error parsing date/time: date='{date_str}', time='{time_str}'. Error: {e}")
     
-    return appointments
\ No newline at end of file
+    return appointments
+
+
+def select_appointment_at(suggest_res_text: str, target_datetime: datetime) -> Tuple[bool, str, Optional[Dict[str, str]], Optional[datetime]]:
+    """
+    选择页面中指定时间的预约（并行预约时每个 session 预约分配给它的时间）
+    返回: (成功?, 消息, form_data, 预约日期时间对象)
+    """
+    for appointment in parse_all_appointments(suggest_res_text):
+        if appointment["datetime"] == target_datetime:
+            return True, "成功解析预约信息", appointment["form_data"], appointment["datetime"]
+    return False, f"预约时间 {target_datetime.strftime('%d.%m.%Y %H:%M')} 已不可用", None, None
@@ -0,0 +1,147 @@
+"""
+时间预算（deadline budget）
+
+替代所有请求统一的 30 秒超时: 每一轮检查有总预算 CYCLE_BUDGET_SECONDS，每个 Schritt 有自己的预算
+STEP_BUDGETS（total 为整步的时间，connect / read 为单个请求建立连接和等待响应的上限）。
+预算通过 ContextVar 向下传递，嵌套的预算不会超过外层剩余的时间:
+
+    with budget("cycle", config.CYCLE_BUDGET_SECONDS):
+        with budget("Schritt 4"):
+            session.post(...)        # 超时 = min(connect/read, 剩余预算)
+
+create_session 注册的 on_request hook 在每个请求发出前按剩余预算设置 httpx 超时，预算已用完时
+抛出 DeadlineExceeded（httpx.TimeoutException 的子类，调用方按超时处理）。验证码识别的 LLM 调用
+通过 remaining_seconds() 使用同一个预算。
+
+超出预算的步骤记录为指标（deadline_stats()），并输出一条 WARNING 日志。
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+import httpx
+
+from .. import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """预算已用完，请求没有发出"""
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """一个预算范围: expires_at 已经按外层预算截断"""
+
+    name: str
+    budget: float
+    started: float
+    expires_at: float
+    connect: Optional[float] = None
+    read: Optional[float] = None
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+_DEADLINE: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("superc_deadline", default=None)
+
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def current() -> Optional[Deadline]:
+    """当前上下文中最内层的预算（没有时为 None）"""
+    return _DEADLINE.get()
+
+
+def remaining_seconds() -> Optional[float]:
+    """当前预算剩余秒数，没有预算时为 None（调用方使用自己的默认超时）"""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else max(0.0, deadline.remaining())
+
+
+@contextmanager
+def budget(name: str, seconds: Optional[float] = None, connect: Optional[float] = None,
+           read: Optional[float] = None) -> Iterator[Deadline]:
+    """
+    进入一个预算范围，不传 seconds 时从 config.STEP_BUDGETS[name] 读取
+    Input: name: 步骤名, seconds: 总预算, connect / read: 单个请求的阶段上限
+    Output: Deadline（with 块内生效）
+    """
+    step = config.STEP_BUDGETS.get(name, {})
+    seconds = step.get("total") if seconds is None else seconds
+    connect = step.get("connect") if connect is None else connect
+    read = step.get("read") if read is None else read
+
+    parent = _DEADLINE.get()
+    started = time.monotonic()
+    expires_at = started + seconds if seconds is not None else float("inf")
+    if parent is not None:
+        expires_at = min(expires_at, parent.expires_at)
+        connect = parent.connect if connect is None else connect
+        read = parent.read if read is None else read
+    deadline = Deadline(name, seconds if seconds is not None else expires_at - started, started, expires_at, connect, read)
+
+    token = _DEADLINE.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _DEADLINE.reset(token)
+        _record(deadline, time.monotonic() - started)
+
+
+def _record(deadline: Deadline, elapsed: float) -> None:
+    overrun = elapsed - deadline.budget
+    with _stats_lock:
+        stats = _stats.setdefault(deadline.name, {"runs": 0, "overruns": 0, "max_overrun_seconds": 0.0, "total_seconds": 0.0})
+        stats["runs"] += 1
+        stats["total_seconds"] += elapsed
+        if overrun > 0:
+            stats["overruns"] += 1
+            stats["max_overrun_seconds"] = max(stats["max_overrun_seconds"], overrun)
+    if overrun > 0:
+        logger.warning(
+            f"{deadline.name} 超出时间预算: 用时 {elapsed:.1f}s，预算 {deadline.budget:.1f}s",
+            extra={"deadline_step": deadline.name, "overrun_seconds": overrun},
+        )
+
+
+def request_timeout(request: Optional[httpx.Request] = None) -> Optional[httpx.Timeout]:
+    """
+    按当前预算计算单个请求的超时
+    Input: request: 用于 DeadlineExceeded 的请求对象
+    Output: Optional[httpx.Timeout] - 没有预算时为 None；预算用完时抛出 DeadlineExceeded
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"{deadline.name} 时间预算 {deadline.budget:.1f}s 已用完", request=request)
+    connect = min(deadline.connect or remaining, remaining)
+    read = min(deadline.read or remaining, remaining)
+    return httpx.Timeout(connect=connect, read=read, write=read, pool=connect)
+
+
+def on_request(request: httpx.Request) -> None:
+    """httpx request hook: 按剩余预算设置本次请求的超时（排在限速 hook 之后，等待令牌的时间也计入预算）"""
+    timeout = request_timeout(request)
+    if timeout is not None:
+        request.extensions["timeout"] = timeout.as_dict()
+
+
+def deadline_stats() -> Dict[str, Dict[str, float]]:
+    """
+    各预算范围的指标
+    Output: {name: {runs, overruns, max_overrun_seconds, total_seconds}}
+    """
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
@@ -0,0 +1,254 @@
+"""
+飞行记录器
+
+在内存中保留最近 N 轮 run_check 的请求/响应元数据和内容（页面、验证码图片），
+带总内存上限。正常轮询不写盘；只有当一轮以异常结果结束（未预期消息、Schritt 5
+"superC server error"、表单失败等）时才由 runner 调用 dump() 把整段上下文写到
+data/flight_recorder/<时间>_<原因>/。
+
+用法:
+    cycle = get_flight_recorder().begin_cycle("superc")
+    session = httpx.Client(event_hooks={"response": [cycle.on_response]})
+    ...
+    get_flight_recorder().end_cycle(cycle, outcome=message)
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, List, Optional, Union
+
+import httpx
+
+from .. import config
+
+
+logger = logging.getLogger(__name__)
+
+_CURRENT_CYCLE: contextvars.ContextVar[Optional["RecordedCycle"]] = contextvars.ContextVar(
+    "superc_flight_cycle", default=None
+)
+
+_EXTENSIONS = (
+    ("text/html", "html"),
+    ("image/png", "png"),
+    ("image/jpeg", "jpg"),
+    ("application/json", "json"),
+)
+
+
+@dataclass
+class RecordedEntry:
+    """一次 HTTP 交互或一个页面快照"""
+
+    seq: int
+    kind: str  # 'http' | 'page'
+    name: str
+    timestamp: datetime
+    body: bytes
+    truncated: bool = False
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+
+@dataclass
+class RecordedCycle:
+    """一轮 run_check 的全部记录"""
+
+    cycle_id: int
+    label: str
+    started: datetime
+    max_body_bytes: int
+    entries: List[RecordedEntry] = field(default_factory=list)
+    outcome: Optional[str] = None
+    size: int = 0
+    _token: Optional[contextvars.Token] = field(default=None, repr=False)
+
+    def _add(self, kind: str, name: str, body: Union[bytes, str], meta: dict) -> None:
+        data = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+        truncated = len(data) > self.max_body_bytes
+        if truncated:
+            data = data[: self.max_body_bytes]
+        entry = RecordedEntry(len(self.entries), kind, name, datetime.now(), data, truncated, meta)
+        self.entries.append(entry)
+        self.size += entry.size
+
+    def on_response(self, response: httpx.Response) -> None:
+        """httpx response event hook：记录请求与响应"""
+        try:
+            response.read()
+            request = response.request
+            meta = {
+                "method": request.method,
+                "url": str(request.url),
+                "status": response.status_code,
+                "elapsed_ms": round(response.elapsed.total_seconds() * 1000, 1) if _has_elapsed(response) else None,
+                "content_type": response.headers.get("content-type", ""),
+                "request_body": request.content.decode("utf-8", errors="replace") if request.content else "",
+            }
+            self._add("http", f"{request.method} {request.url.path}", response.content, meta)
+        except Exception as e:  # 记录失败不能影响预约流程
+            logger.debug(f"飞行记录器记录响应失败: {e}")
+
+    def record_page(self, step_name: str, content: str) -> None:
+        """记录一个命名的页面快照（save_page_content 调用）"""
+        self._add("page", step_name, content, {"content_type": "text/html"})
+
+
+def _has_elapsed(response: httpx.Response) -> bool:
+    try:
+        response.elapsed
+        return True
+    except RuntimeError:
+        return False
+
+
+class FlightRecorder:
+    """最近 N 轮的环形缓冲区，超出条数或内存上限时淘汰最旧的一轮"""
+
+    def __init__(
+        self,
+        max_cycles: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_body_bytes: Optional[int] = None,
+        dump_dir: Optional[str] = None,
+    ) -> None:
+        self.max_cycles = config.FLIGHT_RECORDER_CYCLES if max_cycles is None else max_cycles
+        self.max_bytes = config.FLIGHT_RECORDER_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_body_bytes = config.FLIGHT_RECORDER_MAX_BODY_BYTES if max_body_bytes is None else max_body_bytes
+        self.dump_dir = dump_dir or config.FLIGHT_RECORDER_DIR
+        self._cycles: Deque[RecordedCycle] = deque()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def begin_cycle(self, label: str) -> RecordedCycle:
+        """开始新一轮记录，并设为当前上下文的记录目标"""
+        with self._lock:
+            cycle = RecordedCycle(self._next_id, label, datetime.now(), self.max_body_bytes)
+            self._next_id += 1
+            self._cycles.append(cycle)
+            self._evict()
+        cycle._token = _CURRENT_CYCLE.set(cycle)
+        return cycle
+
+    def end_cycle(self, cycle: RecordedCycle, outcome: Optional[str] = None) -> None:
+        """结束一轮记录，outcome 记在 begin_cycle 返回的这一轮上（并行预约的轮次可能在它之后开始）"""
+        cycle.outcome = outcome
+        if cycle._token is not None:
+            try:
+                _CURRENT_CYCLE.reset(cycle._token)
+            except ValueError:  # 在其他上下文中结束
+                _CURRENT_CYCLE.set(None)
+            cycle._token = None
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._cycles) > self.max_cycles:
+            self._cycles.popleft()
+        while len(self._cycles) > 1 and self.total_bytes > self.max_bytes:
+            self._cycles.popleft()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(cycle.size for cycle in self._cycles)
+
+    @property
+    def cycles(self) -> List[RecordedCycle]:
+        with self._lock:
+            return list(self._cycles)
+
+    def dump(self, reason: str) -> Optional[str]:
+        """
+        把缓冲区中的所有轮次写盘并清空
+
+        Args:
+            reason: 转储原因，用于目录名，如 'schritt5_server_error'
+
+        Returns:
+            Optional[str]: 转储目录路径，缓冲区为空时返回 None
+        """
+        with self._lock:
+            cycles = list(self._cycles)
+            self._cycles.clear()
+        if not cycles:
+            return None
+
+        slug = re.sub(r"[^\w.-]+", "_", reason).strip("_") or "dump"
+        path = os.path.join(self.dump_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{slug}")
+        os.makedirs(path, exist_ok=True)
+
+        manifest = {"reason": reason, "dumped_at": datetime.now().isoformat(), "cycles": []}
+        for cycle in cycles:
+            cycle_info = {
+                "cycle_id": cycle.cycle_id,
+                "label": cycle.label,
+                "started": cycle.started.isoformat(),
+                "outcome": cycle.outcome,
+                "entries": [],
+            }
+            for entry in cycle.entries:
+                filename = f"c{cycle.cycle_id}_{entry.seq:03d}_{_slugify(entry.name)}.{_extension(entry)}"
+                with open(os.path.join(path, filename), "wb") as f:
+                    f.write(entry.body)
+                cycle_info["entries"].append({
+                    "seq": entry.seq,
+                    "kind": entry.kind,
+                    "name": entry.name,
+                    "timestamp": entry.timestamp.isoformat(),
+                    "file": filename,
+                    "size": entry.size,
+                    "truncated": entry.truncated,
+                    **entry.meta,
+                })
+            manifest["cycles"].append(cycle_info)
+
+        with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"飞行记录器已转储 {len(cycles)} 轮记录到: {path} (原因: {reason})")
+        return path
+
+
+def _slugify(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name).strip("_")[:60] or "entry"
+
+
+def _extension(entry: RecordedEntry) -> str:
+    content_type = entry.meta.get("content_type", "")
+    for prefix, ext in _EXTENSIONS:
+        if content_type.startswith(prefix):
+            return ext
+    return "bin" if entry.kind == "http" else "txt"
+
+
+def current_cycle() -> Optional[RecordedCycle]:
+    """当前上下文正在记录的轮次（不在 run_check 内时为 None）"""
+    return _CURRENT_CYCLE.get()
+
+
+_recorder: Optional[FlightRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_flight_recorder() -> FlightRecorder:
+    """
+    获取进程内共享的飞行记录器
+    Input: None
+    Output: FlightRecorder instance
+    """
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = FlightRecorder()
+    return _recorder
@@ -20,7 +20,7 @@ import bs4
 from bs4 import BeautifulSoup, Tag
 
 from .gpt_call import recognize_captcha_with_gpt
-from .utils import save_page_content, download_captcha
+from .utils import save_page_content, fetch_captcha_image, save_captcha_image
 from ..config import USER_AGENT, BASE_URL
 from .. import config
 from ..profile import Profile
@@ -468,13 +468,15 @@ def fill_form(session: httpx.Client, soup: bs4.BeautifulSoup, location_name: str
     
     logger.info(f"表单数据准备完成: {form_data}")
 
-    # 下载并识别验证码
-    success, captcha_path = download_captcha(session, soup, location_name)
+    # 下载并识别验证码（图片只在内存中流转，响应本身已被飞行记录器记录）
+    success, captcha_image = fetch_captcha_image(session, soup)
     if not success:
-        return False, f"验证码下载失败: {captcha_path}", None
+        return False, f"验证码下载失败: {captcha_image}", None
+    if config.SAVE_CAPTCHA_IMAGES:
+        save_captcha_image(captcha_image, location_name)
 
-    logger.info(f"\n开始识别验证码: {captcha_path}")
-    captcha_text = recognize_captcha_with_gpt(captcha_path)
+    logger.info(f"\n开始识别验证码 ({len(captcha_image)} bytes)")
+    captcha_text = recognize_captcha_with_gpt(captcha_image)
     logger.info(f"验证码识别结果: {captcha_text}")
     if not captcha_text:
         logger.error("验证码识别失败")
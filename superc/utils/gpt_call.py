@@ -6,6 +6,7 @@ It loads API credentials from environment variables and provides a simple chat i
 
 Functions:
 	_get_client() -> openai.OpenAI: Returns a singleton OpenAI client instance.
+	prewarm_connection(timeout: float) -> bool: Opens the client's connection ahead of the first call.
 	gpt_chat(messages: list[dict], model: str, max_tokens: int, temperature: float) -> str: Calls the GPT chat completion API.
 
 Environment Variables:
@@ -15,9 +16,10 @@ Environment Variables:
 
 import os
 import base64
-import openai
 from dotenv import load_dotenv
 
+from .deadline import remaining_seconds
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -25,22 +27,39 @@ load_dotenv()
 OPENAI_KEY = os.getenv("OPENAI_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")  # Default to GPT-4o
 
-if not OPENAI_KEY:
-	raise ValueError("OPENAI_KEY not set in environment variables.")
-
 openai_client = None
 
 def _get_client():
 	"""
 	Get or initialize the OpenAI client.
+	The openai SDK is imported here (it takes ~0.5s to import) and OPENAI_KEY is only
+	required once a captcha actually needs to be recognized.
 	Input: None
 	Output: openai.OpenAI instance
 	"""
 	global openai_client
 	if openai_client is None:
+		if not OPENAI_KEY:
+			raise ValueError("OPENAI_KEY not set in environment variables.")
+		import openai
 		openai_client = openai.OpenAI(api_key=OPENAI_KEY)
 	return openai_client
 
+def prewarm_connection(timeout=5.0):
+	"""
+	Import the SDK, create the client and open its pooled TLS connection ahead of time
+	(a cheap authenticated GET /models), so the first captcha recognition does not pay for it.
+	Input: timeout (float): request timeout in seconds
+	Output: bool: True if the endpoint answered
+	"""
+	if not OPENAI_KEY:
+		return False
+	try:
+		_get_client().with_options(timeout=timeout).models.list()
+		return True
+	except Exception:
+		return False
+
 def gpt_chat(messages, model=OPENAI_MODEL, max_tokens=256, temperature=0.7):
 	"""
 	Call OpenAI GPT chat completion API.
@@ -63,18 +82,23 @@ def gpt_chat(messages, model=OPENAI_MODEL, max_tokens=256, temperature=0.7):
 	content = response.choices[0].message.content
 	return content.strip() if content else ""
 
-def recognize_captcha_with_gpt(image_path, model=None):
+def recognize_captcha_with_gpt(image, model=None):
 	"""
 	Recognize captcha from an image using OpenAI GPT-4o vision API.
+	Inside a deadline budget (superc.utils.deadline) the call is bounded by the remaining budget.
 	Input:
-		image_path (str): Path to the captcha image file
+		image (str | bytes): Path to the captcha image file, or the raw image bytes
 		model (str): Model name (default: 'gpt-4o')
 	Output:
 		str: Recognized captcha text
 	"""
 	# Read and encode image as base64
-	with open(image_path, "rb") as image_file:
-		base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+	if isinstance(image, (bytes, bytearray)):
+		image_bytes = bytes(image)
+	else:
+		with open(image, "rb") as image_file:
+			image_bytes = image_file.read()
+	base64_image = base64.b64encode(image_bytes).decode('utf-8')
 
 	messages = [
 		{
@@ -99,6 +123,10 @@ def recognize_captcha_with_gpt(image_path, model=None):
 	if model is None:
 		model = OPENAI_MODEL
 	client = _get_client()
+	# 在 Schritt 5 的时间预算内调用，不重试（SDK 的自动重试会超出预算）
+	remaining = remaining_seconds()
+	if remaining is not None:
+		client = client.with_options(timeout=max(remaining, 0.1), max_retries=0)
 	response = client.chat.completions.create(
 		model=model,
 		messages=messages,
@@ -0,0 +1,229 @@
+"""
+对冲请求（hedged requests）
+
+预约网站的尾延迟很不稳定。开启 ENABLE_HEDGING 后，Schritt 4 查询和 Schritt 5 提交的请求
+如果超过该步骤历史延迟的 HEDGE_PERCENTILE 分位数还没有响应，就在同一个 session 的另一个连接上
+发出一个相同的请求，先返回的响应生效，另一个的结果丢弃。
+
+安全规则:
+- 幂等请求（Schritt 4 选择地点和随后读取 suggest 页面，每次轮询都会重复发送）: 两个副本都可以发出
+- 非幂等请求（Schritt 5 提交选中的时间）: 只有原请求还卡在建立 TCP 连接、服务器还没有收到任何内容时
+  才发出副本，并且两个副本中只有先开始发送请求头的那个真正发出，另一个在发送前中止，
+  服务器最多收到一次提交。无法判断发送进度（例如 transport 不支持 trace）时不对冲。
+  BookingFlow 的失败重试遵守同样的规则，结果未知的提交不重发
+- 验证码表单提交不经过这里，从不对冲
+- 每个步骤对冲的请求数不超过请求总数的 HEDGE_MAX_RATIO，副本同样经过限速器，不会触发 "zu vieler"
+
+指标: Hedger.stats() 按步骤返回请求数、对冲数、对冲胜出数、因安全规则/预算未对冲的次数和当前对冲延迟。
+
+用法:
+    res = get_hedger().request(session, "POST", url, "Schritt 4", idempotent=True, data=payload)
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional
+
+import httpx
+
+from .. import config
+
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+
+
+class HedgeAborted(Exception):
+    """非幂等请求的副本在发送前中止（另一个副本已经开始发送）"""
+
+
+class _Race:
+    """一次对冲中两个副本的发送进度，通过 httpcore 的 trace 扩展跟踪"""
+
+    def __init__(self, exclusive: bool) -> None:
+        self.exclusive = exclusive
+        self.sender: Optional[str] = None
+        self._connecting = set()
+        self._lock = threading.Lock()
+
+    def tracer(self, copy: str) -> Callable[[str, dict], None]:
+        def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.started":
+                with self._lock:
+                    self._connecting.add(copy)
+            elif event.endswith("send_request_headers.started"):
+                with self._lock:
+                    self._connecting.discard(copy)
+                    if self.sender is None:
+                        self.sender = copy
+                    elif self.exclusive and self.sender != copy:
+                        raise HedgeAborted(f"{self.sender} 已发送，{copy} 中止")
+
+        return trace
+
+    def unsent(self) -> bool:
+        """原请求还在建立连接，服务器没有收到任何内容"""
+        with self._lock:
+            return self.sender is None and PRIMARY in self._connecting
+
+
+class Hedger:
+    """按步骤学习延迟分位数，超过分位数未响应的请求发出对冲副本"""
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        window: int = 200,
+        min_delay: float = 1.0,
+        max_ratio: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self._clock = clock
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+
+    def delay(self, step: str) -> Optional[float]:
+        """
+        当前的对冲延迟（该步骤延迟的 percentile 分位数）
+        Input: step: str
+        Output: Optional[float] - 样本不足 min_samples 时为 None（不对冲）
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(step, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(self.percentile * len(samples)))
+        return max(self.min_delay, samples[index])
+
+    def record(self, step: str, seconds: float) -> None:
+        """记录一次成功请求的延迟"""
+        with self._lock:
+            self._latencies.setdefault(step, deque(maxlen=self.window)).append(seconds)
+
+    def _count(self, step: str, name: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(step, {"requests": 0, "hedged": 0, "hedge_won": 0, "unsafe": 0, "over_budget": 0})
+            counts[name] += 1
+
+    def _within_budget(self, step: str) -> bool:
+        with self._lock:
+            counts = self._counts[step]
+            return counts["hedged"] + 1 <= max(1.0, self.max_ratio * counts["requests"])
+
+    def request(self, session: httpx.Client, method: str, url: str, step: str, idempotent: bool, **kwargs) -> httpx.Response:
+        """
+        发送请求，超过对冲延迟仍未响应时按安全规则发出副本
+        Input: session, method, url, step: 步骤名（延迟统计的 key）, idempotent: 请求是否可以重复发送, kwargs: 传给 session.request
+        Output: httpx.Response - 先到的成功响应；都失败时抛出原请求的异常
+        """
+        self._count(step, "requests")
+        hedge_after = self.delay(step)
+        race = _Race(exclusive=not idempotent)
+        started = self._clock()
+
+        if hedge_after is None:
+            response = self._send(session, race, PRIMARY, method, url, kwargs)
+            self.record(step, self._clock() - started)
+            return response
+
+        primary = self._submit(session, race, PRIMARY, method, url, kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return self._finish(step, started, primary)
+
+        if not idempotent and not race.unsent():
+            self._count(step, "unsafe")
+            return self._finish(step, started, primary)
+        if not self._within_budget(step):
+            self._count(step, "over_budget")
+            return self._finish(step, started, primary)
+
+        self._count(step, "hedged")
+        logger.info(f"{step} 请求 {hedge_after:.1f}s 未响应，在另一个连接上发出对冲请求")
+        hedge = self._submit(session, race, HEDGE, method, url, kwargs)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (primary, hedge):
+                if future in done and future.exception() is None:
+                    if future is hedge:
+                        self._count(step, "hedge_won")
+                        logger.info(f"{step} 对冲请求先返回 ({self._clock() - started:.1f}s)")
+                    return self._finish(step, started, future)
+        # 两个副本都失败: 抛出真正发出的那个的异常（另一个是发送前中止的）
+        failed = hedge if race.sender == HEDGE else primary
+        return failed.result()
+
+    def _finish(self, step: str, started: float, future: Future) -> httpx.Response:
+        response = future.result()
+        self.record(step, self._clock() - started)
+        return response
+
+    def _submit(self, *args) -> Future:
+        # 在调用方的 context 中执行，Schritt 标签（限速的预约额度）和时间预算随之传到线程中
+        return self._executor.submit(contextvars.copy_context().run, self._send, *args)
+
+    @staticmethod
+    def _send(session: httpx.Client, race: _Race, copy: str, method: str, url: str, kwargs: dict) -> httpx.Response:
+        # 同一个 session 的连接池在原连接占用时会新建连接，cookies、限速和飞行记录器 hooks 共用
+        return session.request(method, url, extensions={"trace": race.tracer(copy)}, **kwargs)
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        对冲指标
+        Output: {step: {requests, hedged, hedge_won, unsafe, over_budget, hedge_rate, win_rate, delay}}
+        """
+        with self._lock:
+            snapshot = {step: dict(counts) for step, counts in self._counts.items()}
+        for step, counts in snapshot.items():
+            counts["hedge_rate"] = counts["hedged"] / counts["requests"] if counts["requests"] else 0.0
+            counts["win_rate"] = counts["hedge_won"] / counts["hedged"] if counts["hedged"] else 0.0
+            counts["delay"] = self.delay(step)
+        return snapshot
+
+
+_hedger: Optional[Hedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    """
+    获取进程内共享的 Hedger（按 config 中 HEDGE_* 配置创建）
+    Input: None
+    Output: Hedger instance
+    """
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger(
+                    percentile=config.HEDGE_PERCENTILE,
+                    min_samples=config.HEDGE_MIN_SAMPLES,
+                    window=config.HEDGE_WINDOW,
+                    min_delay=config.HEDGE_MIN_DELAY_SECONDS,
+                    max_ratio=config.HEDGE_MAX_RATIO,
+                )
+    return _hedger
+
+
+def send(session: httpx.Client, method: str, url: str, step: str, idempotent: bool, **kwargs) -> httpx.Response:
+    """
+    页面导航使用的发送函数: 开启 ENABLE_HEDGING 时经过 Hedger，否则直接 session.request
+    """
+    if not config.ENABLE_HEDGING:
+        return session.request(method, url, **kwargs)
+    return get_hedger().request(session, method, url, step, idempotent, **kwargs)
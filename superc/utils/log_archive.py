@@ -0,0 +1,369 @@
+"""
+日志归档与查询工具
+
+把 data/logs 下轮转出来的纯文本日志压缩成分块归档（*.slog），并生成按
+时间戳 / 日志级别 / Schritt / 事件类型建立的 sidecar 索引（*.slog.idx.json）。
+查询时先用索引筛掉不相关的块，只解压可能命中的块。
+
+归档格式:
+    <name>.slog            多个 zlib 压缩块顺序拼接，每块最多 block_lines 行原始日志
+    <name>.slog.idx.json   每块的 offset/length、时间范围、级别/Schritt/事件计数
+
+Usage:
+    python -m superc.utils.log_archive pack data/logs/superc.log.1.bak
+    python -m superc.utils.log_archive query data/logs/archive/*.slog --schritt "Schritt 4" --event slot_found --since 7d
+"""
+
+import argparse
+import json
+import os
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+ARCHIVE_SUFFIX = ".slog"
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+DEFAULT_BLOCK_LINES = 4096
+DEFAULT_ARCHIVE_DIR = "data/logs/archive"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+
+# 新格式: "ts - LEVEL - schritt - message"；旧格式没有 schritt 字段: "ts - LEVEL - message"
+_LINE_PATTERN = re.compile(
+    r"^(?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (?P<level>[A-Z]+) - (?P<rest>.*)$"
+)
+# schritt 字段只可能是 "Schritt N"、"-" 或 logger 名称
+_SCHRITT_FIELD_PATTERN = re.compile(r"^(?P<schritt>Schritt \d+|-|[A-Za-z_][\w.]*) - (?P<message>.*)$")
+_SCHRITT_IN_MESSAGE = re.compile(r"Schritt\s*(\d+)")
+_LOGGER_SCHRITT = re.compile(r"^schritt(\d+)$")
+_SLOT_TIME_PATTERN = re.compile(
+    r"可用(?:预约)?时间[:：]?\s*(?:[A-Za-zäöüÄÖÜ]+,\s*)?(?P<slot>\d{2}\.\d{2}\.\d{4} \d{2}:\d{2})"
+)
+
+# 已知消息变体 -> 事件类型；顺序很重要（"当前没有可用预约时间" 也包含 "可用预约时间"）
+EVENT_MARKERS: Tuple[Tuple[str, str], ...] = (
+    ("当前没有可用预约时间", "no_slot"),
+    ("发现可用预约时间", "slot_found"),
+    ("新出现", "slot_new"),
+    ("zu vieler Terminanfragen", "rate_limited"),
+    ("superC server error", "server_error"),
+    ("验证码错误", "captcha_error"),
+    ("预约已完成", "booked"),
+)
+
+
+@dataclass
+class LogEntry:
+    """一条解析后的日志记录（续行，例如 traceback，会拼接进 message）"""
+
+    timestamp: datetime
+    level: str
+    schritt: str
+    message: str
+    event: Optional[str] = None
+
+    def format(self) -> str:
+        ts = self.timestamp.strftime(TIMESTAMP_FORMAT)[:-3]
+        return f"{ts} - {self.level} - {self.schritt} - {self.message}"
+
+
+def classify_message(message: str) -> Optional[str]:
+    """
+    把日志消息归类为已知事件类型
+
+    Returns:
+        Optional[str]: 'no_slot' / 'slot_found' / 'slot_new' / 'slot_time' / 'rate_limited' / ... ，未知消息返回 None
+    """
+    for marker, event in EVENT_MARKERS:
+        if marker in message:
+            return event
+    if _SLOT_TIME_PATTERN.search(message):
+        return "slot_time"
+    return None
+
+
+def extract_slot_datetime(message: str) -> Optional[datetime]:
+    """从 "可用预约时间 Mittwoch, 29.10.2025 16:00" 一类消息中提取预约时间"""
+    match = _SLOT_TIME_PATTERN.search(message)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group("slot"), "%d.%m.%Y %H:%M")
+    except ValueError:
+        return None
+
+
+def normalize_schritt(field: Optional[str], message: str) -> str:
+    """
+    统一 Schritt 标签: 消息里出现 "Schritt N" 优先，其次把 logger 名 schrittN 映射成 "Schritt N"，
+    旧格式（无字段）回退到 "-"
+    """
+    match = _SCHRITT_IN_MESSAGE.search(message)
+    if match:
+        return f"Schritt {match.group(1)}"
+    if field:
+        logger_match = _LOGGER_SCHRITT.match(field)
+        if logger_match:
+            return f"Schritt {logger_match.group(1)}"
+        return field
+    return "-"
+
+
+def parse_line(line: str) -> Optional[LogEntry]:
+    """
+    解析单行日志，兼容新旧两种格式
+
+    Returns:
+        Optional[LogEntry]: 非日志开头的行（续行、nohup 输出）返回 None
+    """
+    match = _LINE_PATTERN.match(line.rstrip("\r\n"))
+    if not match:
+        return None
+    try:
+        timestamp = datetime.strptime(match.group("timestamp"), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+    rest = match.group("rest")
+    field_match = _SCHRITT_FIELD_PATTERN.match(rest)
+    if field_match:
+        field, message = field_match.group("schritt"), field_match.group("message")
+    else:
+        field, message = None, rest
+
+    return LogEntry(
+        timestamp=timestamp,
+        level=match.group("level"),
+        schritt=normalize_schritt(field, message),
+        message=message,
+        event=classify_message(message),
+    )
+
+
+def iter_entries(lines: Iterable[str]) -> Iterator[LogEntry]:
+    """把原始行流转换为 LogEntry 流，续行追加到上一条记录"""
+    current: Optional[LogEntry] = None
+    for line in lines:
+        entry = parse_line(line)
+        if entry is not None:
+            if current is not None:
+                yield current
+            current = entry
+        elif current is not None and line.strip():
+            current.message += "\n" + line.rstrip("\r\n")
+    if current is not None:
+        yield current
+
+
+# ---------------------------------------------------------------------------
+# Pack
+# ---------------------------------------------------------------------------
+
+def _block_meta(lines: List[str], offset: int, length: int) -> Dict:
+    levels: Counter = Counter()
+    schritte: Counter = Counter()
+    events: Counter = Counter()
+    first_ts: Optional[datetime] = None
+    last_ts: Optional[datetime] = None
+
+    for entry in iter_entries(lines):
+        levels[entry.level] += 1
+        schritte[entry.schritt] += 1
+        if entry.event:
+            events[entry.event] += 1
+        if first_ts is None:
+            first_ts = entry.timestamp
+        last_ts = entry.timestamp
+
+    return {
+        "offset": offset,
+        "length": length,
+        "lines": len(lines),
+        "first_ts": first_ts.isoformat() if first_ts else None,
+        "last_ts": last_ts.isoformat() if last_ts else None,
+        "levels": dict(levels),
+        "schritte": dict(schritte),
+        "events": dict(events),
+    }
+
+
+def _split_blocks(lines: Iterable[str], block_lines: int) -> Iterator[List[str]]:
+    """按行数切块，但保证续行（traceback 等）和它所属的记录在同一块"""
+    block: List[str] = []
+    for line in lines:
+        if len(block) >= block_lines and parse_line(line) is not None:
+            yield block
+            block = []
+        block.append(line)
+    if block:
+        yield block
+
+
+def pack_log(source_path: str, out_dir: str = DEFAULT_ARCHIVE_DIR, block_lines: int = DEFAULT_BLOCK_LINES) -> str:
+    """
+    把一个纯文本日志压缩成分块归档并写出 sidecar 索引
+
+    Args:
+        source_path: 原始日志路径
+        out_dir: 归档输出目录
+        block_lines: 每个压缩块的行数上限
+
+    Returns:
+        str: 归档文件路径
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    archive_path = os.path.join(out_dir, os.path.basename(source_path) + ARCHIVE_SUFFIX)
+
+    blocks: List[Dict] = []
+    offset = 0
+    with open(source_path, "r", encoding="utf-8", errors="replace") as src, open(archive_path, "wb") as dst:
+        lines = (line for line in src if not line.lower().startswith("nohup: ignoring input"))
+        for block in _split_blocks(lines, block_lines):
+            payload = zlib.compress("".join(block).encode("utf-8"), 9)
+            dst.write(payload)
+            blocks.append(_block_meta(block, offset, len(payload)))
+            offset += len(payload)
+
+    index = {
+        "version": INDEX_VERSION,
+        "source": os.path.basename(source_path),
+        "block_lines": block_lines,
+        "blocks": blocks,
+    }
+    with open(archive_path + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+
+    return archive_path
+
+
+# ---------------------------------------------------------------------------
+# Query
+# ---------------------------------------------------------------------------
+
+def load_index(archive_path: str) -> Dict:
+    """读取归档对应的 sidecar 索引"""
+    with open(archive_path + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != INDEX_VERSION:
+        raise ValueError(f"不支持的索引版本: {index.get('version')}")
+    return index
+
+
+def _block_may_match(block: Dict, since: Optional[datetime], until: Optional[datetime],
+                     level: Optional[str], schritt: Optional[str], event: Optional[str]) -> bool:
+    if block["first_ts"] is None:
+        return False
+    if since and datetime.fromisoformat(block["last_ts"]) < since:
+        return False
+    if until and datetime.fromisoformat(block["first_ts"]) > until:
+        return False
+    if level and level not in block["levels"]:
+        return False
+    if schritt and schritt not in block["schritte"]:
+        return False
+    if event and event not in block["events"]:
+        return False
+    return True
+
+
+def query_archive(archive_path: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  level: Optional[str] = None, schritt: Optional[str] = None, event: Optional[str] = None,
+                  contains: Optional[str] = None) -> Iterator[LogEntry]:
+    """
+    查询归档，只解压索引判定可能命中的块
+
+    Args:
+        archive_path: *.slog 文件路径
+        since / until: 时间范围（含）
+        level: 日志级别，如 'ERROR'
+        schritt: 规范化后的 Schritt 标签，如 'Schritt 4'
+        event: 事件类型，如 'slot_found'
+        contains: 消息子串过滤
+
+    Returns:
+        Iterator[LogEntry]: 命中的日志记录
+    """
+    index = load_index(archive_path)
+    with open(archive_path, "rb") as f:
+        for block in index["blocks"]:
+            if not _block_may_match(block, since, until, level, schritt, event):
+                continue
+            f.seek(block["offset"])
+            text = zlib.decompress(f.read(block["length"])).decode("utf-8")
+            for entry in iter_entries(text.splitlines(keepends=True)):
+                if since and entry.timestamp < since:
+                    continue
+                if until and entry.timestamp > until:
+                    continue
+                if level and entry.level != level:
+                    continue
+                if schritt and entry.schritt != schritt:
+                    continue
+                if event and entry.event != event:
+                    continue
+                if contains and contains not in entry.message:
+                    continue
+                yield entry
+
+
+def parse_time_arg(value: str, now: Optional[datetime] = None) -> datetime:
+    """
+    解析命令行时间参数: 相对时间 '7d' / '12h' / '30m'，或绝对时间 '2025-08-01' / '2025-08-01 10:00'
+    """
+    now = now or datetime.now()
+    relative = re.fullmatch(r"(\d+)([dhm])", value.strip())
+    if relative:
+        amount, unit = int(relative.group(1)), relative.group(2)
+        delta = {"d": timedelta(days=amount), "h": timedelta(hours=amount), "m": timedelta(minutes=amount)}[unit]
+        return now - delta
+    return datetime.fromisoformat(value.strip())
+
+
+def main() -> None:
+    """CLI entry point: pack / query"""
+    parser = argparse.ArgumentParser(description="SuperC 日志归档与查询")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = sub.add_parser("pack", help="压缩日志并生成索引")
+    pack_parser.add_argument("paths", nargs="+", help="原始日志文件")
+    pack_parser.add_argument("--out-dir", default=DEFAULT_ARCHIVE_DIR, help="归档输出目录")
+    pack_parser.add_argument("--block-lines", type=int, default=DEFAULT_BLOCK_LINES, help="每块行数")
+
+    query_parser = sub.add_parser("query", help="按索引查询归档")
+    query_parser.add_argument("paths", nargs="+", help="*.slog 归档文件")
+    query_parser.add_argument("--since", help="起始时间，如 7d / 2025-08-01")
+    query_parser.add_argument("--until", help="结束时间，如 1d / 2025-08-08 12:00")
+    query_parser.add_argument("--level", help="日志级别，如 ERROR")
+    query_parser.add_argument("--schritt", help="Schritt 标签，如 'Schritt 4'")
+    query_parser.add_argument("--event", help="事件类型: " + ", ".join(sorted({e for _, e in EVENT_MARKERS} | {"slot_time"})))
+    query_parser.add_argument("--contains", help="消息子串")
+    query_parser.add_argument("--count", action="store_true", help="只输出命中条数")
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        for path in args.paths:
+            archive_path = pack_log(path, args.out_dir, args.block_lines)
+            raw_size = os.path.getsize(path)
+            packed_size = os.path.getsize(archive_path)
+            print(f"{path} -> {archive_path} ({raw_size} -> {packed_size} bytes)")
+        return
+
+    since = parse_time_arg(args.since) if args.since else None
+    until = parse_time_arg(args.until) if args.until else None
+    total = 0
+    for path in args.paths:
+        for entry in query_archive(path, since, until, args.level, args.schritt, args.event, args.contains):
+            total += 1
+            if not args.count:
+                print(entry.format())
+    if args.count:
+        print(total)
+
+
+if __name__ == "__main__":
+    main()
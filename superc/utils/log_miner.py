@@ -0,0 +1,179 @@
+"""
+历史日志挖掘
+
+从 data/logs/superc.log* 中提取每一次轮询的结果，转换为 slot_history 的 Sighting 记录，
+用历史数据给轮询策略（放号热力图）提供初始数据。
+
+文件用 mmap 映射后由一个正则在字节层面直接定位相关的行，其余的行（页面保存、表单填写、traceback 等，
+占日志的绝大部分）不解码也不逐行处理；命中的行再交给 log_archive.parse_line 解析，
+新旧日志格式（有 / 没有 schritt 字段）和消息变体的识别都复用 log_archive。
+
+识别的消息:
+    查询完成，当前没有可用预约时间 / Schritt 4 结果: 当前没有可用预约时间     -> no_slot
+    发现可用预约时间 / Schritt 4: 发现可用预约时间                           -> slots（开始一次有可用时间的轮询）
+    可用预约时间 Mittwoch, 29.10.2025 16:00 / 找到可用时间: ...              -> 该轮询的可用时间
+    zu vieler Terminanfragen                                                 -> rate_limited
+    心跳汇总: 600s 内 9 次相同结果已折叠 (... 当前没有可用预约时间)           -> 展开为 9 次 no_slot
+
+日志中没有单轮耗时的记录 latency 为 NaN；心跳汇总使用其中的平均耗时。
+
+Usage:
+    python -m superc.utils.log_miner data/logs/superc.log* --summary
+    python -m superc.utils.log_miner data/logs/superc.log* --import
+"""
+
+import argparse
+import glob
+import math
+import mmap
+import os
+import re
+from datetime import timedelta
+from typing import Iterable, Iterator, List, Optional
+
+from .log_archive import LogEntry, extract_slot_datetime, parse_line
+from .slot_history import Sighting, SlotHistory
+
+
+DEFAULT_LOG_GLOB = "data/logs/superc.log*"
+
+# 只匹配带时间戳、并且包含相关关键字的整行（多行模式，在 mmap 上直接搜索）
+_INTERESTING_LINE = re.compile(
+    rb"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} - [A-Z]+ - [^\n]*?"
+    rb"(?:" + b"|".join(re.escape(marker.encode("utf-8")) for marker in (
+        "可用预约时间", "可用时间", "zu vieler Terminanfragen", "心跳汇总",
+    )) + rb")[^\n]*",
+    re.MULTILINE,
+)
+_HEARTBEAT = re.compile(r"心跳汇总: (?P<elapsed>\d+)s 内 (?P<count>\d+) 次相同结果已折叠")
+_HEARTBEAT_AVG = re.compile(r"min/avg/max = [\d.]+/(?P<avg>[\d.]+)/")
+# 同一次轮询的 "发现可用预约时间" 和具体时间之间最多相隔多久
+_POLL_WINDOW = timedelta(seconds=60)
+
+
+def mine_file(path: str) -> Iterator[LogEntry]:
+    """
+    流式读取一个日志文件中的相关记录
+    Input: path: str
+    Output: Iterator[LogEntry]（event 为 no_slot / slot_found / slot_time / rate_limited 等）
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for match in _INTERESTING_LINE.finditer(mapped):
+            entry = parse_line(match.group(0).decode("utf-8", errors="replace"))
+            if entry is not None and entry.event is not None:
+                yield entry
+
+
+def to_sightings(entries: Iterable[LogEntry], location: str = "superc") -> Iterator[Sighting]:
+    """
+    把一个文件的记录（按时间顺序）转换为每次轮询一条的 Sighting
+    Input: entries: Iterable[LogEntry], location: str
+    Output: Iterator[Sighting]
+    """
+    pending: Optional[Sighting] = None
+    slots: set = set()
+
+    def flush() -> Optional[Sighting]:
+        nonlocal pending
+        if pending is None:
+            return None
+        sighting, pending = pending, None
+        sighting.slot_count = max(1, len(slots))
+        sighting.earliest_slot = min(slots) if slots else None
+        return sighting
+
+    for entry in entries:
+        if entry.event == "slot_time":
+            if pending is not None and entry.timestamp - pending.timestamp <= _POLL_WINDOW:
+                slot = extract_slot_datetime(entry.message)
+                if slot is not None:
+                    slots.add(slot)
+            continue
+        if entry.event not in ("no_slot", "slot_found", "rate_limited"):
+            continue
+
+        done = flush()
+        if done is not None:
+            yield done
+        if entry.event == "slot_found":
+            pending, slots = Sighting(entry.timestamp, location, "slots", latency=math.nan), set()
+        elif entry.event == "rate_limited":
+            yield Sighting(entry.timestamp, location, "rate_limited", latency=math.nan)
+        else:
+            yield from _no_slot_polls(entry, location)
+
+    done = flush()
+    if done is not None:
+        yield done
+
+
+def _no_slot_polls(entry: LogEntry, location: str) -> Iterator[Sighting]:
+    """一条 "没有可用时间" 记录；心跳汇总展开为均匀分布在汇总窗口内的多次轮询"""
+    heartbeat = _HEARTBEAT.search(entry.message)
+    if heartbeat is None:
+        yield Sighting(entry.timestamp, location, "no_slot", latency=math.nan)
+        return
+    count, elapsed = int(heartbeat.group("count")), float(heartbeat.group("elapsed"))
+    avg = _HEARTBEAT_AVG.search(entry.message)
+    latency = float(avg.group("avg")) if avg else math.nan
+    step = elapsed / count if count else 0.0
+    for i in range(count):
+        yield Sighting(entry.timestamp - timedelta(seconds=step * (count - 1 - i)), location, "no_slot", latency=latency)
+
+
+def mine_logs(paths: Iterable[str], location: str = "superc") -> List[Sighting]:
+    """
+    挖掘多个日志文件，结果按时间排序（轮转文件的先后顺序不重要）
+    Input: paths: Iterable[str], location: str
+    Output: List[Sighting]
+    """
+    sightings: List[Sighting] = []
+    for path in paths:
+        sightings.extend(to_sightings(mine_file(path), location))
+    sightings.sort(key=lambda s: s.timestamp)
+    return sightings
+
+
+def import_logs(paths: Iterable[str], store: SlotHistory, location: str = "superc") -> int:
+    """
+    把挖掘结果按时间顺序合并进 SlotHistory（历史记录通常早于已有的实时记录）；已有实时记录覆盖的
+    时间段（见 SlotHistory.merge）内的记录跳过，重复运行或日志和实时记录重叠都不会产生重复记录
+    Input: paths, store: SlotHistory, location: str
+    Output: int - 写入条数
+    """
+    return store.merge(location, mine_logs(paths, location))
+
+
+def main() -> None:
+    """CLI entry point"""
+    parser = argparse.ArgumentParser(description="从历史日志中提取轮询结果")
+    parser.add_argument("paths", nargs="*", help=f"日志文件（默认 {DEFAULT_LOG_GLOB}）")
+    parser.add_argument("--location", default="superc", help="日志对应的地点")
+    parser.add_argument("--import", dest="do_import", action="store_true", help="写入 slot_history")
+    parser.add_argument("--dir", default=None, help="slot_history 目录（默认 config.SLOT_HISTORY_DIR）")
+    parser.add_argument("--summary", action="store_true", help="只输出统计")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(DEFAULT_LOG_GLOB))
+    if args.do_import:
+        written = import_logs(paths, SlotHistory(args.dir), args.location)
+        print(f"写入 {written} 条记录")
+        return
+
+    sightings = mine_logs(paths, args.location)
+    if args.summary:
+        outcomes = {}
+        for s in sightings:
+            outcomes[s.outcome] = outcomes.get(s.outcome, 0) + 1
+        span = f"{sightings[0].timestamp} ~ {sightings[-1].timestamp}" if sightings else "-"
+        print(f"{len(sightings)} 次轮询 ({span}): {outcomes}")
+        return
+    for s in sightings:
+        earliest = s.earliest_slot.strftime("%d.%m.%Y %H:%M") if s.earliest_slot else "-"
+        print(f"{s.timestamp:%Y-%m-%d %H:%M:%S} {s.outcome:<12} {s.slot_count:>3} {earliest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-"""Helpers for consistent logging configuration and Supabase mirroring."""
+"""Helpers for consistent logging configuration, heartbeat aggregation and Supabase mirroring."""
 
 from __future__ import annotations
 
+import atexit
 import logging
-from typing import Optional
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
 
 from .. import config
 
@@ -37,6 +40,144 @@ class SupabaseLogHandler(logging.Handler):
             self.handleError(record)
 
 
+class HeartbeatAggregator(logging.Filter):
+    """Collapse runs of identical idle-poll records into periodic summary records.
+
+    The first record of a run passes through; repeats are absorbed and counted.
+    A summary (count, time span, ``cycle_seconds`` latency stats) is emitted every
+    ``interval`` seconds and right before any other INFO+ record, so state changes
+    (slot seen, error, rate limit) still appear immediately and in order.
+
+    One instance is shared by all root handlers; the per-record decision is cached
+    so every handler sees the same outcome.
+    """
+
+    SUMMARY_LOGGER = "heartbeat"
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        markers: Optional[Sequence[str]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__()
+        self._interval = config.HEARTBEAT_SUMMARY_INTERVAL if interval is None else interval
+        self._markers = tuple(config.HEARTBEAT_MARKERS if markers is None else markers)
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._handlers: List[logging.Handler] = []
+        self._emitting = False
+        self._last_record: Optional[logging.LogRecord] = None
+        self._last_decision = True
+        self._reset_run(None, None)
+
+    def _reset_run(self, key: Optional[str], template: Optional[logging.LogRecord]) -> None:
+        self._key = key
+        self._template = template
+        self._count = 0
+        self._window_start = self._clock()
+        self._latency_n = 0
+        self._latency_sum = 0.0
+        self._latency_min = float("inf")
+        self._latency_max = 0.0
+
+    def attach(self, handler: logging.Handler) -> None:
+        """Install the aggregator on ``handler`` (idempotent)."""
+        with self._lock:
+            if handler not in self._handlers:
+                self._handlers.append(handler)
+            if self not in handler.filters:
+                handler.addFilter(self)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self._emitting:
+            return True
+        with self._lock:
+            if record is self._last_record:
+                return self._last_decision
+            decision = self._decide(record)
+            self._last_record = record
+            self._last_decision = decision
+            return decision
+
+    def flush(self) -> None:
+        """Emit the pending summary, if any (called at shutdown and before state changes)."""
+        with self._lock:
+            self._emit_summary()
+
+    def _is_heartbeat(self, record: logging.LogRecord, message: str) -> bool:
+        return record.levelno == logging.INFO and any(marker in message for marker in self._markers)
+
+    def _decide(self, record: logging.LogRecord) -> bool:
+        try:
+            message = record.getMessage()
+        except Exception:
+            return True
+
+        if self._is_heartbeat(record, message):
+            key = f"{record.name}:{message}"
+            if key != self._key:
+                self._emit_summary()
+                self._reset_run(key, record)
+                return True
+
+            self._count += 1
+            self._template = record
+            latency = getattr(record, "cycle_seconds", None)
+            if isinstance(latency, (int, float)):
+                self._latency_n += 1
+                self._latency_sum += latency
+                self._latency_min = min(self._latency_min, latency)
+                self._latency_max = max(self._latency_max, latency)
+
+            if self._clock() - self._window_start >= self._interval:
+                self._emit_summary()
+            return False
+
+        if record.levelno >= logging.INFO and self._key is not None:
+            self._emit_summary()
+            self._reset_run(None, None)
+        return True
+
+    def _emit_summary(self) -> None:
+        if self._count == 0 or self._template is None:
+            return
+
+        elapsed = self._clock() - self._window_start
+        message = f"心跳汇总: {elapsed:.0f}s 内 {self._count} 次相同结果已折叠 ({self._template.getMessage()})"
+        if self._latency_n:
+            avg = self._latency_sum / self._latency_n
+            message += f"，单轮耗时 min/avg/max = {self._latency_min:.2f}/{avg:.2f}/{self._latency_max:.2f}s"
+
+        summary = logging.getLogger(self.SUMMARY_LOGGER).makeRecord(
+            self.SUMMARY_LOGGER, logging.INFO, self._template.pathname, self._template.lineno, message, None, None
+        )
+        summary.schritt = getattr(self._template, "schritt", config.DEFAULT_SCHRITT)
+
+        # 保留当前 run，只重置计数窗口
+        self._reset_run(self._key, self._template)
+
+        self._emitting = True
+        try:
+            for handler in list(self._handlers):
+                if summary.levelno >= handler.level:
+                    handler.handle(summary)
+        finally:
+            self._emitting = False
+
+
+_heartbeat_aggregator: Optional[HeartbeatAggregator] = None
+
+
+def _install_heartbeat_aggregator(root_logger: logging.Logger) -> None:
+    global _heartbeat_aggregator
+    if _heartbeat_aggregator is None:
+        _heartbeat_aggregator = HeartbeatAggregator()
+        atexit.register(_heartbeat_aggregator.flush)
+    for handler in root_logger.handlers:
+        _heartbeat_aggregator.attach(handler)
+
+
 def _resolve_log_level(level: Optional[int]) -> int:
     if level is not None:
         return level
@@ -54,7 +195,7 @@ def _resolve_log_level(level: Optional[int]) -> int:
 
 
 def setup_logging(level: Optional[int] = None, *, force: bool = False) -> None:
-    """Configure root logging once and, if enabled, attach the Supabase mirror."""
+    """Configure root logging once, attach the Supabase mirror and the heartbeat aggregator if enabled."""
 
     resolved_level = _resolve_log_level(level)
 
@@ -62,14 +203,14 @@ def setup_logging(level: Optional[int] = None, *, force: bool = False) -> None:
 
     logging.getLogger("httpx").setLevel(logging.WARNING)
 
-    if not config.ENABLE_SUPABASE_LOGS:
-        return
-
     root_logger = logging.getLogger()
-    if any(isinstance(handler, SupabaseLogHandler) for handler in root_logger.handlers):
-        return
-
-    supabase_handler = SupabaseLogHandler()
-    supabase_handler.setLevel(logging.INFO)
-    supabase_handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
-    root_logger.addHandler(supabase_handler)
+    if config.ENABLE_SUPABASE_LOGS and not any(
+        isinstance(handler, SupabaseLogHandler) for handler in root_logger.handlers
+    ):
+        supabase_handler = SupabaseLogHandler()
+        supabase_handler.setLevel(logging.INFO)
+        supabase_handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
+        root_logger.addHandler(supabase_handler)
+
+    if config.ENABLE_HEARTBEAT_AGGREGATION:
+        _install_heartbeat_aggregator(root_logger)
@@ -0,0 +1,282 @@
+"""
+页面快照归档
+
+save_page_content 只把页面放入队列，由后台线程完成 gzip 压缩、按 sha256 去重写盘，
+并在 index.jsonl 中追加一条元数据。避免在 Schritt 4/5 这些对延迟敏感的步骤里同步写大文件，
+也避免秒级时间戳文件名在并发时互相覆盖。
+
+目录结构:
+    data/pages/<location>/objects/<sha[:2]>/<sha>.html.gz   快照内容（同内容只存一份）
+    data/pages/<location>/index.jsonl                        每次保存一行: ts, step, sha256, size, stored
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .. import config
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.jsonl"
+OBJECTS_DIRNAME = "objects"
+OBJECT_SUFFIX = ".html.gz"
+
+
+@dataclass
+class _Snapshot:
+    content: str
+    step_name: str
+    location_name: str
+    timestamp: datetime
+
+
+class PageArchiver:
+    """后台页面归档器：submit() 非阻塞入队，写盘、去重和保留策略都在工作线程中完成"""
+
+    def __init__(
+        self,
+        base_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        retention_every: Optional[int] = None,
+    ) -> None:
+        self.base_dir = base_dir or config.PAGE_ARCHIVE_DIR
+        self.max_bytes = config.PAGE_ARCHIVE_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age_days = config.PAGE_ARCHIVE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        self.retention_every = max(1, config.PAGE_ARCHIVE_RETENTION_EVERY if retention_every is None else retention_every)
+        self._queue: "queue.Queue[Optional[_Snapshot]]" = queue.Queue(
+            maxsize=config.PAGE_ARCHIVE_QUEUE_SIZE if queue_size is None else queue_size
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 每个地点目录当前的对象总大小，首次写入时扫描一次
+        self._stored_bytes: Dict[str, int] = {}
+        # 每个地点目录本进程的写入次数，用于定期按保留天数清理
+        self._writes: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def submit(self, content: str, step_name: str, location_name: str) -> bool:
+        """
+        把页面放入归档队列（不阻塞）
+
+        Returns:
+            bool: 队列已满被丢弃时返回 False
+        """
+        self._ensure_started()
+        snapshot = _Snapshot(content, step_name, location_name, datetime.now())
+        try:
+            self._queue.put_nowait(snapshot)
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待队列中的快照全部写盘
+
+        Returns:
+            bool: 超时前全部写完返回 True
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="page-archiver", daemon=True)
+                self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        self._prune_existing()
+        while True:
+            snapshot = self._queue.get()
+            try:
+                if snapshot is not None:
+                    self._write(snapshot)
+            except Exception as e:
+                logger.error(f"页面快照写入失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _prune_existing(self) -> None:
+        """工作线程启动时先对已有的地点目录执行一次保留策略"""
+        if not os.path.isdir(self.base_dir):
+            return
+        for name in sorted(os.listdir(self.base_dir)):
+            if not os.path.isdir(os.path.join(self._location_dir(name), OBJECTS_DIRNAME)):
+                continue
+            try:
+                self.enforce_retention(name)
+            except Exception as e:
+                logger.error(f"页面快照保留策略执行失败 ({name}): {e}")
+
+    def _location_dir(self, location_name: str) -> str:
+        return os.path.join(self.base_dir, location_name)
+
+    def _object_path(self, location_name: str, digest: str) -> str:
+        return os.path.join(self._location_dir(location_name), OBJECTS_DIRNAME, digest[:2], digest + OBJECT_SUFFIX)
+
+    def _write(self, snapshot: _Snapshot) -> None:
+        raw = snapshot.content.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._object_path(snapshot.location_name, digest)
+
+        is_new = not os.path.exists(path)
+        if is_new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(raw, compresslevel=6))
+            os.replace(tmp_path, path)
+        else:
+            # 重复内容只刷新 mtime，保留策略按最近引用时间淘汰
+            os.utime(path)
+        stored = os.path.getsize(path)
+
+        entry = {
+            "ts": snapshot.timestamp.isoformat(timespec="microseconds"),
+            "step": snapshot.step_name,
+            "sha256": digest,
+            "size": len(raw),
+            "stored": stored,
+            "new": is_new,
+        }
+        index_path = os.path.join(self._location_dir(snapshot.location_name), INDEX_FILENAME)
+        with open(index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+        logger.info(f"页面内容已归档: {snapshot.location_name}/{snapshot.step_name} sha256={digest[:12]}{'' if is_new else ' (重复)'}")
+
+        location = snapshot.location_name
+        writes = self._writes[location] = self._writes.get(location, 0) + 1
+        if writes % self.retention_every == 0:
+            # 定期按保留天数清理，否则没有超出大小上限时过期快照永远不会删除
+            self.enforce_retention(location)
+        elif is_new:
+            total = self._stored_bytes.get(location)
+            if total is None:
+                total = sum(size for _, _, size in self._list_objects(location))
+            else:
+                total += stored
+            self._stored_bytes[location] = total
+            if total > self.max_bytes:
+                self.enforce_retention(location)
+
+    def _list_objects(self, location_name: str) -> List[tuple]:
+        """返回 [(mtime, path, size)]，按 mtime 升序"""
+        objects_dir = os.path.join(self._location_dir(location_name), OBJECTS_DIRNAME)
+        found = []
+        for root, _, files in os.walk(objects_dir):
+            for name in files:
+                if not name.endswith(OBJECT_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        found.sort()
+        return found
+
+    def enforce_retention(self, location_name: str) -> int:
+        """
+        按保留天数和总大小上限删除最旧的快照，并压缩 index.jsonl
+
+        Returns:
+            int: 删除的快照数量
+        """
+        objects = self._list_objects(location_name)
+        cutoff = time.time() - self.max_age_days * 86400
+        total = sum(size for _, _, size in objects)
+        removed = 0
+
+        for mtime, path, size in objects:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+
+        self._stored_bytes[location_name] = total
+        if removed:
+            self._compact_index(location_name)
+            logger.info(f"页面快照保留策略: 删除 {removed} 个旧快照，剩余 {total} 字节")
+        return removed
+
+    def _compact_index(self, location_name: str) -> None:
+        index_path = os.path.join(self._location_dir(location_name), INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            return
+        kept = []
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    digest = json.loads(line)["sha256"]
+                except (ValueError, KeyError):
+                    continue
+                if os.path.exists(self._object_path(location_name, digest)):
+                    kept.append(line)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp_path, index_path)
+
+    # ------------------------------------------------------------------
+    # Readers
+    # ------------------------------------------------------------------
+
+    def read_index(self, location_name: str) -> List[dict]:
+        """读取某个地点的快照元数据"""
+        index_path = os.path.join(self._location_dir(location_name), INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            return []
+        with open(index_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def read_snapshot(self, location_name: str, digest: str) -> str:
+        """按 sha256 读取快照 HTML"""
+        with open(self._object_path(location_name, digest), "rb") as f:
+            return gzip.decompress(f.read()).decode("utf-8")
+
+
+_archiver: Optional[PageArchiver] = None
+_archiver_lock = threading.Lock()
+
+
+def get_page_archiver() -> PageArchiver:
+    """
+    获取进程内共享的页面归档器
+    Input: None
+    Output: PageArchiver instance
+    """
+    global _archiver
+    if _archiver is None:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = PageArchiver()
+                # 正常退出时尽量把队列里剩下的快照写完
+                atexit.register(_archiver.flush, 5.0)
+    return _archiver
@@ -5,15 +5,18 @@ This module contains functions for navigating through the appointment booking pa
 import httpx
 import bs4
 import logging
-from typing import Tuple, Union, Optional
+from typing import Callable, Dict, List, Tuple, Union, Optional
 from urllib.parse import urljoin
 from datetime import date, datetime
 import re
 
 from .. import config
 from .utils import validate_page_step, save_page_content
+from . import hedging
 from ..profile import Profile
-from .appointment_selector import select_first_appointment
+from .appointment_selector import select_appointment_at
+from .slot_tracker import get_slot_tracker, refresh_form_data
+from ..matching import SlotMatcher
 from .form_filler import fill_form_with_captcha_retry
 
 
@@ -35,6 +38,7 @@ def log_verbose(logger: logging.Logger, message: str, level: int = logging.INFO)
     if config.VERBOSE_LOGGING:
         logger.log(level, message)
 
+@config.schritt_scope("Schritt 2")
 def enter_schritt_2_page(session: httpx.Client, selection_text: str) -> Tuple[bool, str]:
     """
     进入Schritt 2页面并完成操作: 选择RWTH Studenten服务类型并选择地点类型 (Super C oder Infostelle)
@@ -67,6 +71,7 @@ def enter_schritt_2_page(session: httpx.Client, selection_text: str) -> Tuple[bo
     
     return True, next_url
 
+@config.schritt_scope("Schritt 3")
 def enter_schritt_3_page(session: httpx.Client, url: str) -> Tuple[bool, Union[str, str]]:
     """
     进入Schritt 3页面并完成操作: 添加位置信息 (Standortauswahl)
@@ -87,9 +92,14 @@ def enter_schritt_3_page(session: httpx.Client, url: str) -> Tuple[bool, Union[s
     log_verbose(SCHRITT_3_LOGGER, "Schritt 3 完成: 成功提取位置信息")
     return True, loc.get('value')
 
-def enter_schritt_4_page(session: httpx.Client, url: str, loc: str, submit_text: str, location_name: str, current_profile: Optional[Profile]) -> Tuple[bool, str, Optional[dict], Optional[Profile], Optional[datetime]]:
+@config.schritt_scope("Schritt 4")
+def enter_schritt_4_page(session: httpx.Client, url: str, loc: str, submit_text: str, location_name: str, current_profile: Optional[Profile],
+                         target_datetime: Optional[datetime] = None,
+                         on_slots: Optional[Callable[[List[Dict], datetime], None]] = None) -> Tuple[bool, str, Optional[dict], Optional[Profile], Optional[datetime]]:
     """
     进入Schritt 4页面并完成操作: 检查预约时间可用性并选择第一个可用时间，同时选择合适的profile
+    target_datetime: 只预约这个时间（并行预约中分配给当前 profile 的时间）
+    on_slots: 选定时间后回调 (页面上所有可用时间, 选定的时间)，用于把其余时间分配给其他用户
     返回: (成功?, 消息, form_data, 选择的profile, 预约日期时间对象)
     """
     payload = {
@@ -100,7 +110,8 @@ def enter_schritt_4_page(session: httpx.Client, url: str, loc: str, submit_text:
     }
     # 进入 Schritt 4
     try:
-        res = session.post(url, data=payload, follow_redirects=True)
+        # 选择地点每次轮询都会重复发送，可以对冲
+        res = hedging.send(session, "POST", url, "Schritt 4", idempotent=True, data=payload, follow_redirects=True)
         
         if res.status_code != 200:
             return False, f"Schritt 4 请求失败，状态码: {res.status_code}", None, None, None
@@ -130,12 +141,14 @@ def enter_schritt_4_page(session: httpx.Client, url: str, loc: str, submit_text:
         log_verbose(SCHRITT_4_LOGGER, "已经在suggest页面，使用当前响应")
         suggest_res = res
     else:
-        # 否则发送GET请求到suggest页面
+        # 否则发送GET请求到suggest页面（和选择地点一样是幂等的 Schritt 4 查询，可以对冲）
         suggest_url = urljoin(BASE_URL, 'suggest')
-        suggest_res = session.get(suggest_url)
+        suggest_res = hedging.send(session, "GET", suggest_url, "Schritt 4", idempotent=True)
     
     # 检查是否有可用预约时间,没有直接返回。结束 function。
     if "Kein freier Termin verfügbar" in suggest_res.text:
+        if target_datetime is None:
+            get_slot_tracker().observe_empty(location_name)
         return False, "当前没有可用预约时间", None, None, None
 
     # ============================================================
@@ -143,27 +156,55 @@ def enter_schritt_4_page(session: httpx.Client, url: str, loc: str, submit_text:
     SCHRITT_4_LOGGER.info("发现可用预约时间")
     save_page_content(suggest_res.text, '4_term_available', location_name)
 
-    # select_first_appointment now returns a datetime object
-    success, message, form_data, appointment_datetime = select_first_appointment(suggest_res.text)
-    if not success:
-        return False, message, None, None, None
-
-    # e.g. 可用预约时间 Mittwoch, 29.10.2025 16:00
-    SCHRITT_4_LOGGER.info(f"可用预约时间 {appointment_datetime.strftime('%A, %d.%m.%Y %H:%M') if appointment_datetime else 'N/A'}")
-    
-    # ==================== ang ================================
-    # Compare appointment date with configured cutoff date
-    # if appointment_datetime and appointment_datetime.date() >= config.APPOINTMENT_CUTOFF_DATE:
-    #     cutoff_str = config.APPOINTMENT_CUTOFF_DATE.strftime("%d.%m.%Y")
-    #     return False, f"预约时间过晚: {appointment_datetime.strftime('%d.%m.%Y')} (截止: {cutoff_str})", None, None, None
-    # ============================================================
-
     selected_profile = current_profile
     if not selected_profile:
         return False, "预约时间没有可用的profile", None, None, None
 
+    if target_datetime is not None:
+        success, message, form_data, appointment_datetime = select_appointment_at(suggest_res.text, target_datetime)
+        if not success:
+            return False, message, None, None, None
+    else:
+        # 按用户的偏好地点、日期范围和全局截止日期选择最早的合适时间
+        # 时间容器和上一轮相同时复用上一次的解析结果
+        observation = get_slot_tracker().observe(location_name, suggest_res.text)
+        appointments = observation.appointments
+        if observation.diff.new:
+            SCHRITT_4_LOGGER.info(
+                f"新出现 {len(observation.diff.new)} 个预约时间: 最早 {observation.diff.new[0].strftime('%d.%m.%Y %H:%M')}",
+                extra={"slot_event": "new", "new_slots": len(observation.diff.new)},
+            )
+        if not appointments:
+            return False, "有可用时间但无法找到具体的预约表单", None, None, None
+        slot = SlotMatcher.from_appointments(appointments, location_name).take_best(selected_profile)
+
+        # 其余时间（当前用户不接受时是全部时间）分配给其他等待中的用户
+        if on_slots is not None:
+            try:
+                on_slots(appointments, slot.datetime if slot else None)
+            except Exception as e:
+                SCHRITT_4_LOGGER.error(f"分配其余预约时间失败: {e}", exc_info=True)
+
+        if slot is None:
+            earliest = min(a["datetime"] for a in appointments)
+            return False, f"没有符合条件的预约时间: 最早 {earliest.strftime('%d.%m.%Y %H:%M')}，共 {len(appointments)} 个", None, None, None
+        form_data, appointment_datetime = slot.form_data, slot.datetime
+        if not observation.parsed:
+            # 复用的 form_data 中 checksum 可能已过期，只从本轮页面中这个时间的表单取最新的易变字段
+            refreshed = refresh_form_data(suggest_res.text, form_data)
+            if refreshed is not None:
+                form_data = refreshed
+            else:
+                success, message, form_data, appointment_datetime = select_appointment_at(suggest_res.text, slot.datetime)
+                if not success:
+                    return False, message, None, None, None
+
+    # e.g. 可用预约时间 Mittwoch, 29.10.2025 16:00
+    SCHRITT_4_LOGGER.info(f"可用预约时间 {appointment_datetime.strftime('%A, %d.%m.%Y %H:%M') if appointment_datetime else 'N/A'}")
+
     return True, "Schritt 4 完成: 成功选择预约和profile", form_data, selected_profile, appointment_datetime
 
+@config.schritt_scope("Schritt 5")
 def enter_schritt_5_page(session: httpx.Client, form_data: dict, location_name: str, selected_profile: Optional[Profile]) -> Tuple[bool, str, Optional[bs4.BeautifulSoup]]:
     """
     进入Schritt 5页面并完成所有操作: 
@@ -190,7 +231,14 @@ def enter_schritt_5_page(session: httpx.Client, form_data: dict, location_name:
     }
 
     try:
-        submit_res = session.post(submit_url, data=form_data, headers=headers, timeout=30.0)
+        # 提交选中的时间不能重复发送，只在请求还没发出时对冲（见 hedging 的安全规则）
+        submit_res = hedging.send(session, "POST", submit_url, "Schritt 5", idempotent=False,
+                                  data=form_data, headers=headers)
+    except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+        # 连接没有建立，服务器没有收到这次提交，可以原样重发
+        error_msg = f"Schritt 5 POST请求未发出: {str(e)}"
+        SCHRITT_5_LOGGER.error(error_msg)
+        return False, error_msg, None
     except httpx.TimeoutException as e:
         error_msg = f"Schritt 5 POST请求超时: {str(e)}"
         SCHRITT_5_LOGGER.error(error_msg)
@@ -248,6 +296,7 @@ def enter_schritt_5_page(session: httpx.Client, form_data: dict, location_name:
     else:
         return False, f"Schritt 5页面填写表单失败: {result[1]}", None
 
+@config.schritt_scope("Schritt 6")
 def enter_schritt_6_page(session: httpx.Client, soup: bs4.BeautifulSoup, location_name: str) -> Tuple[bool, str]:
     """
     进入Schritt 6页面并完成操作: 邮件确认 - 完成预约确认流程
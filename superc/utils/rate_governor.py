@@ -0,0 +1,204 @@
+"""
+预约网站请求限速（跨进程令牌桶）
+
+网站对过于频繁的请求返回 "zu vieler Terminanfragen"。所有发往预约网站的请求在发出前
+先从令牌桶取令牌，同一出口身份（egress identity，通常对应一个出口 IP）的所有 worker 进程
+共享同一个桶，桶状态保存在 data/rate_governor/<identity>.bucket 中并用文件锁保护。
+
+桶容量 = burst + booking_burst。普通查询（Schritt 2-4）只能用到 burst 部分，
+最后 booking_burst 个令牌留给 Schritt 5/6 的预约提交，查询再密集也不会把预约需要的请求额度耗光。
+并行预约（superc/fanout.py）在 booking_requests() 中发出的 Schritt 2-4 请求同样算作预约请求。
+
+用法:
+    session = httpx.Client(event_hooks={"request": [get_rate_governor().on_request]})
+"""
+
+import contextvars
+import logging
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from .. import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有 fcntl，只在进程内限速
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# 桶状态: tokens, updated_at, blocked_until（time.time()，多进程共享所以不能用 monotonic）
+_STATE = struct.Struct("<ddd")
+# 这些 Schritt 中的请求属于预约提交，可以使用预留的 booking_burst
+BOOKING_SCHRITTE = ("Schritt 5", "Schritt 6")
+# 为某个时间发起的预约（并行预约的独立 session），其中所有请求都算作预约请求
+_BOOKING_REQUESTS: contextvars.ContextVar[bool] = contextvars.ContextVar("superc_booking_requests", default=False)
+
+
+@contextmanager
+def booking_requests() -> Iterator[None]:
+    """在这个上下文中发出的请求（包括 Schritt 2-4）都可以使用预留的 booking_burst"""
+    token = _BOOKING_REQUESTS.set(True)
+    try:
+        yield
+    finally:
+        _BOOKING_REQUESTS.reset(token)
+
+
+class RateGovernor:
+    """按出口身份共享的令牌桶，acquire() 在令牌不足时阻塞到补足为止"""
+
+    def __init__(
+        self,
+        identity: str = "default",
+        per_minute: float = 30.0,
+        burst: int = 10,
+        booking_burst: int = 10,
+        state_dir: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.identity = identity
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.booking_burst = booking_burst
+        self.capacity = float(burst + booking_burst)
+        self.state_dir = state_dir or config.RATE_GOVERNOR_DIR
+        self.path = os.path.join(self.state_dir, f"{identity}.bucket")
+        self._clock = clock
+        self._sleep = sleep
+        self._local_lock = threading.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def acquire(self, booking: bool = False) -> float:
+        """
+        取一个令牌，不足时等待
+        Input: booking: bool - 预约提交请求，可以使用预留的 booking_burst
+        Output: float - 本次等待的秒数
+        """
+        # 普通请求取完令牌后桶里至少还要剩 booking_burst 个
+        floor = 0.0 if booking else float(self.booking_burst)
+        waited = 0.0
+        while True:
+            with self._locked_state() as (state, write):
+                tokens, updated_at, blocked_until = state
+                now = self._clock()
+                tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+                if now >= blocked_until and tokens - 1.0 >= floor:
+                    write(tokens - 1.0, now, blocked_until)
+                    break
+                write(tokens, now, blocked_until)
+                delay = max(blocked_until - now, (floor + 1.0 - tokens) / self.rate if self.rate > 0 else 1.0)
+            delay = max(delay, 0.01)
+            self._sleep(delay)
+            waited += delay
+
+        self.acquired += 1
+        self.waited_seconds += waited
+        if waited >= 1.0:
+            logger.info(f"请求限速: 等待 {waited:.1f}s（{self.identity}）")
+        return waited
+
+    def available(self, booking: bool = False) -> float:
+        """
+        当前不用等待就能取到的令牌数（不消耗令牌）
+        Input: booking: bool - 按预约请求计算（可以用到预留的 booking_burst）
+        Output: float
+        """
+        with self._locked_state() as (state, _):
+            tokens, updated_at, blocked_until = state
+            now = self._clock()
+            if now < blocked_until:
+                return 0.0
+            tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+        return max(0.0, tokens - (0.0 if booking else float(self.booking_burst)))
+
+    def penalize(self, seconds: float) -> None:
+        """
+        网站已经提示请求过多时，让同一出口的所有 worker 暂停 seconds 秒并清空桶
+        Input: seconds: float
+        """
+        with self._locked_state() as (state, write):
+            now = self._clock()
+            write(0.0, now, max(state[2], now + seconds))
+        logger.warning(f"检测到请求过多，{self.identity} 暂停请求 {seconds:.0f}s")
+
+    def on_request(self, request: httpx.Request) -> None:
+        """httpx request hook: 只对预约网站的请求限速，Schritt 5/6 和 booking_requests() 中的请求算作预约提交"""
+        if request.url.host != _termin_host():
+            return
+        self.acquire(booking=_BOOKING_REQUESTS.get() or config.get_current_schritt() in BOOKING_SCHRITTE)
+
+    def stats(self) -> Dict[str, float]:
+        """本进程的限速统计"""
+        return {"acquired": self.acquired, "waited_seconds": round(self.waited_seconds, 3)}
+
+    # ------------------------------------------------------------------
+    # Shared state
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _locked_state(self) -> Iterator:
+        """持锁读取桶状态，yield (state, write)；文件不存在时视为满桶"""
+        with self._local_lock:
+            os.makedirs(self.state_dir, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, _STATE.size, 0) if hasattr(os, "pread") else os.read(fd, _STATE.size)
+                if len(raw) == _STATE.size:
+                    state = _STATE.unpack(raw)
+                else:
+                    state = (self.capacity, self._clock(), 0.0)
+
+                def write(tokens: float, updated_at: float, blocked_until: float) -> None:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.write(fd, _STATE.pack(tokens, updated_at, blocked_until))
+
+                yield state, write
+            finally:
+                # 关闭文件描述符同时释放 flock
+                os.close(fd)
+
+
+def _termin_host() -> str:
+    return urlparse(config.BASE_URL).hostname or ""
+
+
+def egress_identity() -> str:
+    """当前进程的出口身份: 环境变量 SUPERC_EGRESS_ID，未设置时为 'default'"""
+    return os.getenv("SUPERC_EGRESS_ID") or "default"
+
+
+_governor: Optional[RateGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_rate_governor() -> RateGovernor:
+    """
+    获取进程内共享的限速器（按 RATE_LIMITS 中当前出口身份的配置创建，没有则用 'default'）
+    Input: None
+    Output: RateGovernor instance
+    """
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                identity = egress_identity()
+                limits = config.RATE_LIMITS.get(identity) or config.RATE_LIMITS["default"]
+                _governor = RateGovernor(identity=identity, **limits)
+    return _governor
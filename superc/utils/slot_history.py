@@ -0,0 +1,404 @@
+"""
+可用时间观测记录（时间序列）
+
+每一次 Schritt 4 轮询的结果追加写入本地列式文件，用于分析放号规律、调整轮询频率:
+
+    data/slot_history/<location>/timestamp.col      float64  轮询时间（epoch 秒）
+                                /outcome.col        int8     no_slot / slots / error / rate_limited
+                                /slot_count.col     int32    可用时间数
+                                /earliest_slot.col  float64  最早可用时间（epoch 秒，没有时为 NaN）
+                                /latency.col        float32  Schritt 4 用时（秒）
+
+每列是定长数组，只追加不修改，一年约 50 万次轮询也只有十几 MB；热力图只需要读 timestamp /
+outcome / slot_count 三列。多个 worker 写同一地点时用文件锁保护；写到一半崩溃导致的列长度不一致
+在下一次写入时截断到最短的列。
+
+预约流程中的轮询记录通过 SlotHistoryWriter 在后台线程写入，Schritt 4 之后不等文件锁和写盘就进入 Schritt 5。
+
+用法:
+    get_slot_history_writer().submit(Sighting(datetime.now(), "superc", "slots", 3, earliest, 0.8))
+
+    store = get_slot_history()
+    heatmap = store.heatmap("superc", since=datetime.now() - timedelta(days=30))
+    print(heatmap.format())
+
+    python -m superc.utils.slot_history heatmap superc --since 30d
+"""
+
+import argparse
+import atexit
+import bisect
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+from .. import config
+from .log_archive import parse_time_arg
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有 fcntl，只在进程内加锁
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+OUTCOMES = ("no_slot", "slots", "error", "rate_limited")
+# (列名, array typecode)
+COLUMNS = (
+    ("timestamp", "d"),
+    ("outcome", "b"),
+    ("slot_count", "i"),
+    ("earliest_slot", "d"),
+    ("latency", "f"),
+)
+WEEKDAYS = ("Mo", "Di", "Mi", "Do", "Fr", "Sa", "So")
+
+
+@dataclass
+class Sighting:
+    """一次轮询的结果"""
+
+    timestamp: datetime
+    location: str
+    outcome: str
+    slot_count: int = 0
+    earliest_slot: Optional[datetime] = None
+    latency: float = 0.0
+
+
+@dataclass
+class Heatmap:
+    """按 星期 x 小时 统计的轮询结果，每个矩阵为 7 行（周一到周日）24 列"""
+
+    polls: List[List[int]] = field(default_factory=lambda: [[0] * 24 for _ in range(7)])
+    slot_polls: List[List[int]] = field(default_factory=lambda: [[0] * 24 for _ in range(7)])
+    # 从没有可用时间变为有可用时间的次数（放号）
+    releases: List[List[int]] = field(default_factory=lambda: [[0] * 24 for _ in range(7)])
+
+    def rate(self, weekday: int, hour: int) -> float:
+        """该时段轮询中看到可用时间的比例"""
+        polls = self.polls[weekday][hour]
+        return self.slot_polls[weekday][hour] / polls if polls else 0.0
+
+    def format(self, matrix: str = "releases") -> str:
+        """文本表格，matrix 为 polls / slot_polls / releases"""
+        rows = getattr(self, matrix)
+        lines = ["    " + "".join(f"{hour:>4}" for hour in range(24))]
+        for weekday, row in enumerate(rows):
+            lines.append(f"{WEEKDAYS[weekday]:<4}" + "".join(f"{value:>4}" for value in row))
+        return "\n".join(lines)
+
+
+def _to_columns(sightings: List[Sighting]) -> dict:
+    return {
+        "timestamp": array("d", (s.timestamp.timestamp() for s in sightings)),
+        "outcome": array("b", (OUTCOMES.index(s.outcome) for s in sightings)),
+        "slot_count": array("i", (s.slot_count for s in sightings)),
+        "earliest_slot": array("d", (s.earliest_slot.timestamp() if s.earliest_slot else math.nan for s in sightings)),
+        "latency": array("f", (s.latency for s in sightings)),
+    }
+
+
+class SlotHistory:
+    """按地点分目录的列式追加存储"""
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.root = root or config.SLOT_HISTORY_DIR
+        self._lock = threading.Lock()
+
+    def _dir(self, location: str) -> str:
+        return os.path.join(self.root, location)
+
+    @contextmanager
+    def _locked(self, location: str) -> Iterator[str]:
+        directory = self._dir(location)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, open(os.path.join(directory, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield directory
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _rows(directory: str) -> int:
+        """各列完整记录数的最小值"""
+        counts = []
+        for name, typecode in COLUMNS:
+            path = os.path.join(directory, name + ".col")
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // array(typecode).itemsize)
+        return min(counts)
+
+    def append(self, sighting: Sighting) -> None:
+        """追加一条记录"""
+        self.append_many([sighting])
+
+    def append_many(self, sightings: Iterable[Sighting]) -> int:
+        """
+        批量追加（例如从历史日志导入），同一地点的记录一次写入
+        Input: sightings: Iterable[Sighting]
+        Output: int - 写入条数
+        """
+        by_location = {}
+        for sighting in sightings:
+            by_location.setdefault(sighting.location, []).append(sighting)
+
+        for location, items in by_location.items():
+            values = _to_columns(items)
+            with self._locked(location) as directory:
+                rows = self._rows(directory)
+                for name, typecode in COLUMNS:
+                    with open(os.path.join(directory, name + ".col"), "ab") as f:
+                        # 上次写到一半崩溃的列截断到完整记录数，保持各列对齐
+                        f.truncate(rows * array(typecode).itemsize)
+                        values[name].tofile(f)
+        return sum(len(items) for items in by_location.values())
+
+    def merge(self, location: str, sightings: Iterable[Sighting],
+              tolerance: float = 60.0, covered_gap: float = 600.0) -> int:
+        """
+        把可能早于已有数据的记录按时间顺序合并进来（例如导入历史日志），已有记录覆盖的时间段内的记录跳过:
+        - 和某条已有记录相差不超过 tolerance 秒（重复导入，或同一次轮询在日志和实时记录中各有一条）
+        - 落在两条相距不超过 covered_gap 秒的已有记录之间（这段时间一直有实时轮询记录，
+          日志心跳展开出的轮询时间和实时记录对不上，但是同一批轮询）
+        会重写整个地点的列文件，只用于离线导入，实时轮询用 append
+        Input: location: str, sightings: Iterable[Sighting], tolerance / covered_gap: float（秒）
+        Output: int - 新写入条数
+        """
+        with self._locked(location) as directory:
+            existing = list(self.read(location))
+            stamps = sorted(s.timestamp.timestamp() for s in existing)
+
+            def covered(ts: float) -> bool:
+                i = bisect.bisect_left(stamps, ts)
+                before = stamps[i - 1] if i > 0 else -math.inf
+                after = stamps[i] if i < len(stamps) else math.inf
+                return min(ts - before, after - ts) <= tolerance or after - before <= covered_gap
+
+            added = [s for s in sightings if s.location == location and not covered(s.timestamp.timestamp())]
+            if not added:
+                return 0
+            rows = sorted(existing + added, key=lambda s: s.timestamp)
+            values = _to_columns(rows)
+            # 先写好所有临时文件再逐个替换，缩小列之间不一致的窗口
+            for name, _ in COLUMNS:
+                with open(os.path.join(directory, name + ".col.tmp"), "wb") as f:
+                    values[name].tofile(f)
+            for name, _ in COLUMNS:
+                os.replace(os.path.join(directory, name + ".col.tmp"), os.path.join(directory, name + ".col"))
+        return len(added)
+
+    def _load(self, location: str, names: Iterable[str]) -> dict:
+        directory = self._dir(location)
+        if not os.path.isdir(directory):
+            return {name: array(typecode) for name, typecode in COLUMNS if name in names}
+        rows = self._rows(directory)
+        columns = {}
+        for name, typecode in COLUMNS:
+            if name not in names:
+                continue
+            column = array(typecode)
+            with open(os.path.join(directory, name + ".col"), "rb") as f:
+                column.fromfile(f, rows)
+            columns[name] = column
+        return columns
+
+    def read(self, location: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Iterator[Sighting]:
+        """
+        按时间范围读取记录（含两端）
+        Input: location: str, since / until: Optional[datetime]
+        Output: Iterator[Sighting]
+        """
+        columns = self._load(location, [name for name, _ in COLUMNS])
+        low = since.timestamp() if since else -math.inf
+        high = until.timestamp() if until else math.inf
+        for i, ts in enumerate(columns["timestamp"]):
+            if not low <= ts <= high:
+                continue
+            earliest = columns["earliest_slot"][i]
+            yield Sighting(
+                timestamp=datetime.fromtimestamp(ts),
+                location=location,
+                outcome=OUTCOMES[columns["outcome"][i]],
+                slot_count=columns["slot_count"][i],
+                earliest_slot=None if math.isnan(earliest) else datetime.fromtimestamp(earliest),
+                latency=columns["latency"][i],
+            )
+
+    def heatmap(self, location: str, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Heatmap:
+        """
+        按 星期 x 小时（本地时间）统计轮询次数、看到可用时间的次数和放号次数
+        Input: location: str, since / until: Optional[datetime]
+        Output: Heatmap
+        """
+        columns = self._load(location, ("timestamp", "outcome", "slot_count"))
+        low = since.timestamp() if since else -math.inf
+        high = until.timestamp() if until else math.inf
+        heatmap = Heatmap()
+        had_slots: Optional[bool] = None
+        no_slot, slots = OUTCOMES.index("no_slot"), OUTCOMES.index("slots")
+        for ts, outcome, count in zip(columns["timestamp"], columns["outcome"], columns["slot_count"]):
+            if outcome not in (no_slot, slots):
+                continue  # 出错的轮询不知道有没有可用时间
+            seen = outcome == slots and count > 0
+            if low <= ts <= high:
+                moment = datetime.fromtimestamp(ts)
+                weekday, hour = moment.weekday(), moment.hour
+                heatmap.polls[weekday][hour] += 1
+                if seen:
+                    heatmap.slot_polls[weekday][hour] += 1
+                    if had_slots is False:
+                        heatmap.releases[weekday][hour] += 1
+            had_slots = seen
+        return heatmap
+
+
+class SlotHistoryWriter:
+    """后台写入器：submit() 非阻塞入队，工作线程把队列中积攒的记录一次 append_many 写入"""
+
+    def __init__(self, store: Optional[SlotHistory] = None, queue_size: Optional[int] = None) -> None:
+        self._store = store
+        self._queue: "queue.Queue[Sighting]" = queue.Queue(
+            maxsize=config.SLOT_HISTORY_QUEUE_SIZE if queue_size is None else queue_size
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def store(self) -> SlotHistory:
+        return self._store or get_slot_history()
+
+    def submit(self, sighting: Sighting) -> bool:
+        """
+        把一条记录放入写入队列（不阻塞）
+
+        Returns:
+            bool: 队列已满被丢弃时返回 False
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(sighting)
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待队列中的记录全部写盘
+
+        Returns:
+            bool: 超时前全部写完返回 True
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="slot-history", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.store.append_many(batch)
+            except Exception as e:
+                logger.error(f"写入可用时间观测记录失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_history: Optional[SlotHistory] = None
+_history_lock = threading.Lock()
+_writer: Optional[SlotHistoryWriter] = None
+
+
+def get_slot_history() -> SlotHistory:
+    """
+    获取进程内共享的 SlotHistory（目录为 config.SLOT_HISTORY_DIR）
+    Input: None
+    Output: SlotHistory instance
+    """
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = SlotHistory()
+    return _history
+
+
+def get_slot_history_writer() -> SlotHistoryWriter:
+    """
+    获取进程内共享的后台写入器（写入 get_slot_history()）
+    Input: None
+    Output: SlotHistoryWriter instance
+    """
+    global _writer
+    if _writer is None:
+        with _history_lock:
+            if _writer is None:
+                _writer = SlotHistoryWriter()
+                # 正常退出时尽量把队列里剩下的记录写完
+                atexit.register(_writer.flush, 5.0)
+    return _writer
+
+
+def main() -> None:
+    """CLI entry point: heatmap / tail"""
+    parser = argparse.ArgumentParser(description="SuperC 可用时间观测记录")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    heatmap_parser = sub.add_parser("heatmap", help="按星期 x 小时输出统计")
+    heatmap_parser.add_argument("location", help="地点，如 superc")
+    heatmap_parser.add_argument("--since", help="起始时间，如 30d / 2025-08-01")
+    heatmap_parser.add_argument("--until", help="结束时间")
+    heatmap_parser.add_argument("--matrix", default="releases", choices=("polls", "slot_polls", "releases"))
+    heatmap_parser.add_argument("--dir", default=None, help="存储目录（默认 config.SLOT_HISTORY_DIR）")
+
+    tail_parser = sub.add_parser("tail", help="输出最近的记录")
+    tail_parser.add_argument("location", help="地点，如 superc")
+    tail_parser.add_argument("--since", default="1d", help="起始时间，如 1d")
+    tail_parser.add_argument("--dir", default=None, help="存储目录（默认 config.SLOT_HISTORY_DIR）")
+
+    args = parser.parse_args()
+    store = SlotHistory(args.dir)
+    since = parse_time_arg(args.since) if args.since else None
+
+    if args.command == "heatmap":
+        until = parse_time_arg(args.until) if args.until else None
+        print(store.heatmap(args.location, since, until).format(args.matrix))
+        return
+
+    for s in store.read(args.location, since):
+        earliest = s.earliest_slot.strftime("%d.%m.%Y %H:%M") if s.earliest_slot else "-"
+        print(f"{s.timestamp:%Y-%m-%d %H:%M:%S} {s.outcome:<12} {s.slot_count:>3} {earliest:<16} {s.latency:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
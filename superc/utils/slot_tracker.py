@@ -0,0 +1,170 @@
+"""
+可用时间变化检测
+
+有可用时间时，每一轮 Schritt 4 都会用 BeautifulSoup 完整解析 suggest 页面，即使和上一轮完全相同。
+SlotTracker 对页面中的时间容器（details_suggest_times / sugg_accordion）计算指纹，按地点保存
+上一次解析出的时间集合：指纹相同时直接复用，不再解析；不同时重新解析并和上一次比较，得到
+新出现 / 消失 / 未变化的时间。新出现的时间作为事件通知订阅者（add_listener）。
+
+指纹计算前去掉每次请求都会变化的隐藏字段（checksum、pow_token、pow_nonce），所以复用的
+form_data 可能已经过期: 真正提交预约前用 refresh_form_data 从当前页面取选中时间的最新易变字段
+（只用正则定位这一个表单，不重新解析整个页面）。
+
+用法:
+    observation = get_slot_tracker().observe("superc", suggest_res.text)
+    observation.diff.new   # 本轮新出现的时间
+"""
+
+import hashlib
+import html
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .appointment_selector import parse_all_appointments
+
+
+logger = logging.getLogger(__name__)
+
+_CONTAINER_MARKERS = ('id="details_suggest_times"', 'id="sugg_accordion"')
+# 每次请求都不同的隐藏字段，计算指纹前清空它们的值
+_VOLATILE_FIELDS = re.compile(r'(name="(?:checksum|pow_token|pow_nonce)"\s+value=")[^"]*"')
+_VOLATILE_NAMES = ("checksum", "pow_token", "pow_nonce")
+_SUGGESTION_FORM = re.compile(r'<form[^>]*class="suggestion_form"[^>]*>(.*?)</form>', re.S)
+_VOLATILE_VALUES = re.compile(r'name="(checksum|pow_token|pow_nonce)"\s+value="([^"]*)"')
+
+
+def suggest_fingerprint(suggest_res_text: str) -> Optional[str]:
+    """
+    时间容器的指纹（从容器开始到最后一个表单结束，去掉易变字段后的哈希）
+    Input: suggest_res_text: str - suggest 页面 HTML
+    Output: Optional[str] - 找不到时间容器时为 None
+    """
+    start = -1
+    for marker in _CONTAINER_MARKERS:
+        start = suggest_res_text.find(marker)
+        if start >= 0:
+            break
+    if start < 0:
+        return None
+    end = suggest_res_text.rfind("</form>")
+    region = suggest_res_text[start:end if end > start else len(suggest_res_text)]
+    return hashlib.blake2b(_VOLATILE_FIELDS.sub(r'\1"', region).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def refresh_form_data(suggest_res_text: str, form_data: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """
+    指纹未变时复用的 form_data 只有易变字段可能过期：按其余字段在当前页面中找到同一个表单，
+    用正则取出最新的 checksum / pow_token / pow_nonce
+    Input: suggest_res_text: str - 本轮 suggest 页面 HTML, form_data: Dict[str, str] - 上一次解析出的表单数据
+    Output: Optional[Dict[str, str]] - 更新后的表单数据，页面中找不到这个表单时为 None
+    """
+    stable = [f'name="{name}" value="{html.escape(value or "")}"'
+              for name, value in form_data.items() if name not in _VOLATILE_NAMES]
+    for match in _SUGGESTION_FORM.finditer(suggest_res_text):
+        block = match.group(1)
+        if all(field in block for field in stable):
+            refreshed = dict(form_data)
+            refreshed.update((name, html.unescape(value)) for name, value in _VOLATILE_VALUES.findall(block))
+            return refreshed
+    return None
+
+
+@dataclass
+class SlotDiff:
+    """和上一轮相比的时间变化（均按时间排序）"""
+
+    new: List[datetime] = field(default_factory=list)
+    vanished: List[datetime] = field(default_factory=list)
+    unchanged: List[datetime] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.new or self.vanished)
+
+
+@dataclass
+class Observation:
+    """一次观察的结果: parsed 为 False 表示指纹未变、appointments 是上一次解析的结果"""
+
+    location: str
+    fingerprint: Optional[str]
+    appointments: List[Dict]
+    diff: SlotDiff
+    parsed: bool
+
+
+class SlotTracker:
+    """按地点保存上一次的指纹和时间集合"""
+
+    def __init__(self, parse: Callable[[str], List[Dict]] = parse_all_appointments) -> None:
+        self._parse = parse
+        self._last: Dict[str, Tuple[Optional[str], List[Dict]]] = {}
+        self._listeners: List[Callable[[str, SlotDiff], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, SlotDiff], None]) -> None:
+        """时间集合变化时回调 listener(location, diff)"""
+        self._listeners.append(listener)
+
+    def last(self, location: str) -> List[Dict]:
+        """上一次观察到的时间（没有观察过时为空）"""
+        with self._lock:
+            return self._last.get(location, (None, []))[1]
+
+    def observe(self, location: str, suggest_res_text: str) -> Observation:
+        """
+        观察一次有可用时间的 suggest 页面
+        Input: location: str, suggest_res_text: str
+        Output: Observation
+        """
+        fingerprint = suggest_fingerprint(suggest_res_text)
+        with self._lock:
+            last_fingerprint, last_appointments = self._last.get(location, (None, []))
+        if fingerprint is not None and fingerprint == last_fingerprint:
+            unchanged = sorted(a["datetime"] for a in last_appointments)
+            return Observation(location, fingerprint, last_appointments, SlotDiff(unchanged=unchanged), parsed=False)
+        return self._update(location, fingerprint, self._parse(suggest_res_text), parsed=True)
+
+    def observe_empty(self, location: str) -> Observation:
+        """观察到 "Kein freier Termin verfügbar": 之前的时间全部消失"""
+        return self._update(location, None, [], parsed=False)
+
+    def _update(self, location: str, fingerprint: Optional[str], appointments: List[Dict], parsed: bool) -> Observation:
+        with self._lock:
+            _, last_appointments = self._last.get(location, (None, []))
+            self._last[location] = (fingerprint, appointments)
+        before = {a["datetime"] for a in last_appointments}
+        now = {a["datetime"] for a in appointments}
+        diff = SlotDiff(new=sorted(now - before), vanished=sorted(before - now), unchanged=sorted(now & before))
+        if diff.changed:
+            self._notify(location, diff)
+        return Observation(location, fingerprint, appointments, diff, parsed)
+
+    def _notify(self, location: str, diff: SlotDiff) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(location, diff)
+            except Exception as e:
+                logger.error(f"可用时间变化回调失败: {e}", exc_info=True)
+
+
+_tracker: Optional[SlotTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_slot_tracker() -> SlotTracker:
+    """
+    获取进程内共享的 SlotTracker
+    Input: None
+    Output: SlotTracker instance
+    """
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = SlotTracker()
+    return _tracker
@@ -15,7 +15,10 @@ import bs4
 import httpx
 
 # 使用相对导入
+from .. import config
 from ..config import USER_AGENT, get_captcha_dir
+from .flight_recorder import current_cycle
+from .page_archive import get_page_archiver
 
 
 logger = logging.getLogger(__name__)
@@ -52,22 +55,23 @@ def validate_page_step(html_content: Union[str, httpx.Response, Any], expected_s
 
 def save_page_content(content: str, step_name: str, location_name: str) -> None:
     """
-    保存页面内容到文件
+    保存页面内容: 记录到当前轮次的飞行记录器（内存），失败时由 runner 统一转储；
+    PAGE_ARCHIVE_ALWAYS 打开时额外入队到后台归档线程写入 data/pages/<location>
     """
-    dir_path = f'data/pages/{location_name}'
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-    
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'{dir_path}/step_{step_name}_{timestamp}.html'
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(content)
-    logger.info(f'页面内容已保存到: {filename}')
+    cycle = current_cycle()
+    if cycle is not None:
+        cycle.record_page(step_name, content)
 
-def download_captcha(session: httpx.Client, soup: bs4.BeautifulSoup, location_name: str) -> Tuple[bool, str]:
+    if cycle is None or config.PAGE_ARCHIVE_ALWAYS:
+        if not get_page_archiver().submit(content, step_name, location_name):
+            logger.warning(f'页面归档队列已满，丢弃快照: {location_name}/{step_name}')
+
+def fetch_captcha_image(session: httpx.Client, soup: bs4.BeautifulSoup) -> Tuple[bool, Union[bytes, str]]:
     """
-    下载验证码图片
+    下载验证码图片到内存
+
+    Returns:
+        Tuple[bool, Union[bytes, str]]: (成功?, 图片字节 或 错误信息)
     """
     captcha_div = soup.find("div", {"id": "captcha_image_audio_div"})
     if not captcha_div:
@@ -88,18 +92,35 @@ def download_captcha(session: httpx.Client, soup: bs4.BeautifulSoup, location_na
         img_response = session.get(img_url)
         if img_response.status_code != 200:
             return False, f"下载验证码图片失败，状态码：{img_response.status_code}"
-        
-        dir_path = get_captcha_dir(location_name)
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'{dir_path}/captcha_{timestamp}.png'
-        
-        with open(filename, 'wb') as f:
-            f.write(img_response.content)
-        
-        logger.info(f'验证码图片已保存到: {filename}')
-        return True, filename
+        return True, img_response.content
+    except Exception as e:
+        return False, f"下载验证码图片时发生错误：{str(e)}"
+
+def save_captcha_image(image: bytes, location_name: str) -> str:
+    """
+    把验证码图片写入 data/<location>/captcha，返回文件路径
+    """
+    dir_path = get_captcha_dir(location_name)
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'{dir_path}/captcha_{timestamp}.png'
+    
+    with open(filename, 'wb') as f:
+        f.write(image)
+    
+    logger.info(f'验证码图片已保存到: {filename}')
+    return filename
+
+def download_captcha(session: httpx.Client, soup: bs4.BeautifulSoup, location_name: str) -> Tuple[bool, str]:
+    """
+    下载验证码图片并保存到磁盘
+    """
+    success, image = fetch_captcha_image(session, soup)
+    if not success:
+        return False, str(image)
+    try:
+        return True, save_captcha_image(image, location_name)
     except Exception as e:
         return False, f"下载验证码图片时发生错误：{str(e)}"
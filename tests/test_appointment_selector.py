@@ -8,7 +8,7 @@ from pathlib import Path
 from typing import Tuple, Optional, Dict, List
 from datetime import datetime
 
-from superc.utils.appointment_selector import select_first_appointment, parse_all_appointments
+from superc.utils.appointment_selector import select_first_appointment, parse_all_appointments, select_appointment_at
 
 def test_select_first_appointment_from_saved_page():
     # data/debugPage/step_4_term_available_20251003_152049.html
@@ -49,3 +49,16 @@ def test_parse_all_appointments_from_saved_page():
     appointments = parse_all_appointments(suggest_html)
     
     assert len(appointments) == 8
+
+def test_select_appointment_at_picks_requested_slot():
+    html_path = Path(__file__).resolve().parent.parent / "data/debugPage/step_4_term_available_20251003_152049.html"
+    suggest_html = html_path.read_text(encoding="utf-8")
+    appointments = parse_all_appointments(suggest_html)
+    target = appointments[-1]["datetime"]
+
+    success, _, form_data, appointment_datetime = select_appointment_at(suggest_html, target)
+    assert success and appointment_datetime == target
+    assert form_data == appointments[-1]["form_data"]
+
+    success, message, _, _ = select_appointment_at(suggest_html, datetime(2030, 1, 1, 8, 0))
+    assert not success and "已不可用" in message
@@ -0,0 +1,180 @@
+"""
+PYTHONPATH=. pytest tests/test_booking_flow.py
+"""
+
+from datetime import datetime
+
+import httpx
+import pytest
+
+from superc import booking_flow
+from superc.utils import page_navigation
+from superc.booking_flow import BookingContext, BookingFlow, Step
+from superc.profile import Profile
+from superc.utils.slot_history import SlotHistory, SlotHistoryWriter
+
+
+LOCATION = {"name": "superc", "selection_text": "Super C", "submit_text": "Außenstelle RWTH auswählen"}
+SLOT = datetime(2025, 12, 11, 8, 30)
+
+
+@pytest.fixture(autouse=True)
+def history(tmp_path, monkeypatch):
+    writer = SlotHistoryWriter(SlotHistory(str(tmp_path)))
+    monkeypatch.setattr(booking_flow, "get_slot_history_writer", lambda: writer)
+    return writer
+
+
+def _profile():
+    return Profile("A", "Test", "a@example.com", "0151", 1, 1, 1990)
+
+
+def _stub_pages(monkeypatch, schritt_5_results, calls):
+    """把各个 Schritt 替换为记录调用的桩函数，Schritt 5 依次返回 schritt_5_results"""
+    results = iter(schritt_5_results)
+
+    def schritt_2(session, selection_text):
+        calls.append("2")
+        session.cookies.set("JSESSIONID", "abc")
+        return True, "https://example.invalid/location"
+
+    def schritt_3(session, url):
+        calls.append("3")
+        return True, "loc-1"
+
+    def schritt_4(session, url, loc, submit_text, location_name, profile, target_datetime=None, on_slots=None):
+        calls.append("4")
+        return True, "Schritt 4 完成", {"date": "20251211"}, profile, SLOT
+
+    def schritt_5(session, form_data, location_name, profile):
+        calls.append(("5", session.cookies.get("JSESSIONID")))
+        return next(results)
+
+    def schritt_6(session, soup, location_name):
+        calls.append("6")
+        return True, "Schritt 6 完成: 预约已完成，等待邮件确认"
+
+    for name, func in [("2", schritt_2), ("3", schritt_3), ("4", schritt_4), ("5", schritt_5), ("6", schritt_6)]:
+        monkeypatch.setattr(booking_flow, f"enter_schritt_{name}_page", func)
+
+
+def _flow(retries):
+    sessions = []
+
+    def factory():
+        sessions.append(httpx.Client())
+        return sessions[-1]
+
+    return BookingFlow(factory(), factory, retries=retries), sessions
+
+
+def test_unsent_schritt_5_retries_in_place_on_new_connection_with_cookies(monkeypatch):
+    calls = []
+    _stub_pages(monkeypatch, [
+        (False, "Schritt 5 POST请求未发出: connection refused", None),
+        (True, "superC server error", None),
+        (True, "Schritt 5 完成: 成功选择时间并填写表单", object()),
+    ], calls)
+    flow, sessions = _flow({"Schritt 5": 2})
+
+    result = flow.run(BookingContext(LOCATION, _profile()))
+
+    assert result == (True, "Schritt 6 完成: 预约已完成，等待邮件确认", SLOT)
+    # 没有回到 Schritt 2，连接失败后换了新连接，会话 cookie 保留
+    assert calls == ["2", "3", "4", ("5", "abc"), ("5", "abc"), ("5", "abc"), "6"]
+    assert len(sessions) == 2 and sessions[0].is_closed and flow.session is sessions[1]
+
+
+def test_read_timeout_on_schritt_5_post_is_not_resent(monkeypatch):
+    calls, posts = [], []
+    _stub_pages(monkeypatch, [], calls)
+    monkeypatch.setattr(booking_flow, "enter_schritt_5_page", page_navigation.enter_schritt_5_page)
+    polls = iter([
+        (True, "Schritt 4 完成", {"date": "20251211"}, _profile(), SLOT),
+        (False, "当前没有可用预约时间", None, None, None),
+    ])
+    monkeypatch.setattr(booking_flow, "enter_schritt_4_page", lambda *args, **kwargs: (calls.append("4"), next(polls))[1])
+
+    def handler(request):
+        posts.append(request.method)
+        raise httpx.ReadTimeout("read timeout", request=request)
+
+    def factory():
+        return httpx.Client(transport=httpx.MockTransport(handler))
+
+    flow = BookingFlow(factory(), factory, retries={"Schritt 5": 2})
+    result = flow.run(BookingContext(LOCATION, _profile()))
+
+    # 服务器可能已经处理了第一次提交，回到 Schritt 4 重新读取，不再重发
+    assert posts == ["POST"]
+    assert calls == ["2", "3", "4", "4"]
+    assert result == (False, "当前没有可用预约时间", None)
+
+
+def test_each_schritt_4_poll_is_recorded(monkeypatch, history):
+    calls = []
+    _stub_pages(monkeypatch, [(False, "Schritt 5 失败: 提交时间后未进入Schritt 5", None)] * 2, calls)
+    flow, _ = _flow({"Schritt 5": 1})
+
+    flow.run(BookingContext(LOCATION, _profile()))
+
+    # 轮询记录在后台线程写入
+    assert history.flush(timeout=5)
+    polls = list(history.store.read("superc"))
+    assert [poll.outcome for poll in polls] == ["slots", "slots"]
+
+
+def test_slot_lost_in_schritt_5_resumes_at_schritt_4(monkeypatch):
+    calls = []
+    _stub_pages(monkeypatch, [
+        (False, "Schritt 5 失败: 提交时间后未进入Schritt 5", None),
+        (True, "Schritt 5 完成: 成功选择时间并填写表单", object()),
+    ], calls)
+    flow, _ = _flow({"Schritt 5": 1})
+
+    ctx = BookingContext(LOCATION, _profile())
+    assert flow.run(ctx)[0] is True
+    assert calls == ["2", "3", "4", ("5", "abc"), "4", ("5", "abc"), "6"]
+    assert ctx.attempts == {Step.SCHRITT_5: 1}
+
+
+def test_retries_exhausted_return_original_result(monkeypatch):
+    calls = []
+    _stub_pages(monkeypatch, [(True, "superC server error", None)] * 2, calls)
+    flow, _ = _flow({"Schritt 5": 1})
+
+    assert flow.run(BookingContext(LOCATION, _profile())) == (True, "superC server error", None)
+    assert calls.count(("5", "abc")) == 2
+
+
+def test_non_transient_failure_is_not_retried(monkeypatch):
+    calls = []
+    _stub_pages(monkeypatch, [(False, "Schritt 5页面填写表单失败: 验证码错误", None)], calls)
+    flow, _ = _flow({"Schritt 5": 3})
+
+    assert flow.run(BookingContext(LOCATION, _profile())) == (True, "Schritt 5页面填写表单失败: 验证码错误", None)
+    assert calls == ["2", "3", "4", ("5", "abc")]
+
+
+def test_warm_context_starts_at_schritt_4(monkeypatch):
+    calls = []
+    _stub_pages(monkeypatch, [(True, "Schritt 5 完成: 成功选择时间并填写表单", object())], calls)
+    flow, _ = _flow({})
+
+    ctx = BookingContext(LOCATION, _profile(), step=Step.SCHRITT_4, url="https://example.invalid/location", loc="loc-1")
+    assert flow.run(ctx)[2] == SLOT
+    assert calls == ["4", ("5", None), "6"]
+
+
+def test_no_slot_log_carries_cycle_seconds_for_heartbeat_stats(monkeypatch, caplog):
+    calls = []
+    _stub_pages(monkeypatch, [], calls)
+    monkeypatch.setattr(booking_flow, "enter_schritt_4_page",
+                        lambda *args, **kwargs: (False, "当前没有可用预约时间", None, None, None))
+    flow, _ = _flow({})
+
+    with caplog.at_level("INFO", logger="schritt4"):
+        assert flow.run(BookingContext(LOCATION, _profile())) == (False, "当前没有可用预约时间", None)
+
+    record = next(r for r in caplog.records if r.getMessage().startswith("Schritt 4 page:"))
+    assert record.cycle_seconds >= 0
@@ -7,6 +7,8 @@ Run with: PYTHONPATH=. pytest tests/test_config.py
 import pytest
 import sys
 import os
+import logging
+import threading
 
 # Add project root to path for direct config import
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -68,3 +70,45 @@ def test_get_captcha_dir_no_trailing_slash():
     """Test get_captcha_dir doesn't add unnecessary trailing slashes"""
     result = get_captcha_dir("superc")
     assert not result.endswith("/")
+
+
+def _make_record(name: str) -> logging.LogRecord:
+    return config._inject_schritt(name, logging.INFO, __file__, 1, "message %s", ("arg",), None)
+
+
+def test_schritt_scope_tags_records():
+    """Records created inside schritt_scope carry the Schritt, outside fall back to the logger name"""
+    with config.schritt_scope("Schritt 4"):
+        inside = _make_record("schritt4")
+    outside = _make_record("main")
+
+    assert inside.schritt == "Schritt 4"
+    assert outside.schritt == "main"
+
+
+def test_schritt_scope_as_decorator_and_reset():
+    @config.schritt_scope("Schritt 5")
+    def step():
+        return config.get_current_schritt()
+
+    assert step() == "Schritt 5"
+    assert config.get_current_schritt() is None
+
+    token = config.set_current_schritt("Schritt 2")
+    config.set_current_schritt("Schritt 3")
+    config.reset_current_schritt(token)
+    assert config.get_current_schritt() is None
+
+
+def test_schritt_is_isolated_per_thread():
+    seen = {}
+
+    def worker():
+        seen["schritt"] = _make_record("httpx").schritt
+
+    with config.schritt_scope("Schritt 6"):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    assert seen["schritt"] == "httpx"
@@ -0,0 +1,169 @@
+"""
+PYTHONPATH=. pytest tests/test_db_utils.py
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_create_engine():
+    """import db.utils 不应读取数据库配置或创建 engine（未配置数据库时也能导入）"""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("DB_")}
+    result = subprocess.run(
+        [sys.executable, "-c", "import db.utils; print(db.utils._engine is None and db.utils._session_factory is None)"],
+        cwd=project_root,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "True"
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch):
+    """内存 SQLite 替换数据库 engine，预置一个用户和三个等待中的 profile"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import StaticPool
+
+    import db.utils
+    from db.models import AppointmentProfile, Base, User
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[User.__table__, AppointmentProfile.__table__])
+    with engine.begin() as connection:
+        connection.execute(text(
+            "insert into users (id, email, password_hash, role, created_at, updated_at) "
+            "values (1, 'test@example.com', 'x', 'member', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+        ))
+        for profile_id in (1, 2, 3):
+            connection.execute(text(
+                "insert into appointment_profiles (id, user_id, vorname, appointment_status, created_at) "
+                "values (:id, 1, :name, 'waiting', :created_at)"
+            ), {"id": profile_id, "name": f"User{profile_id}", "created_at": f"2025-01-0{profile_id} 00:00:00"})
+
+    monkeypatch.setattr(db.utils, "_engine", None)
+    monkeypatch.setattr(db.utils, "_session_factory", None)
+    db.utils.configure_engine(engine)
+    return engine
+
+
+def test_workers_claim_distinct_profiles_in_queue_order(sqlite_db):
+    from db.utils import claim_waiting_profile
+
+    claimed = [claim_waiting_profile(f"worker-{i}", lease_seconds=60) for i in range(4)]
+    assert [p.id if p else None for p in claimed] == [1, 2, 3, None]
+    assert claimed[0].claimed_by == "worker-0"
+
+    # 同一 worker 再次认领会拿回自己持有的用户
+    assert claim_waiting_profile("worker-1", lease_seconds=60).id == 2
+
+
+def test_expired_lease_can_be_taken_over(sqlite_db):
+    from db.utils import claim_waiting_profile, heartbeat_lease, release_lease
+
+    assert claim_waiting_profile("crashed", lease_seconds=-1).id == 1
+    assert claim_waiting_profile("alive", lease_seconds=60).id == 1
+
+    assert heartbeat_lease(1, "alive", lease_seconds=60)
+    assert not heartbeat_lease(1, "crashed", lease_seconds=60)
+
+    assert not release_lease(1, "crashed")
+    assert release_lease(1, "alive")
+    assert claim_waiting_profile("next", lease_seconds=60).id == 1
+
+
+def _row(engine, profile_id):
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "select appointment_status, appointment_date, completed_at, claimed_by from appointment_profiles where id = :id"
+        ), {"id": profile_id}).one()
+
+
+def test_status_transition_is_guarded_and_idempotent(sqlite_db):
+    from datetime import datetime
+
+    from db.utils import claim_waiting_profile, transition_appointment_status, update_appointment_status
+
+    assert claim_waiting_profile("worker", lease_seconds=60).id == 1
+    booked_at = datetime(2025, 3, 4, 9, 30)
+    assert update_appointment_status(1, "booked", booked_at)
+    status, appointment_date, completed_at, claimed_by = _row(sqlite_db, 1)
+    assert status == "booked" and claimed_by is None
+    assert str(appointment_date).startswith("2025-03-04 09:30")
+
+    # 重试：成功且不改动预约日期 / 完成时间
+    assert update_appointment_status(1, "booked", datetime(2025, 5, 6, 10, 0))
+    assert _row(sqlite_db, 1)[1:3] == (appointment_date, completed_at)
+
+    # 已 booked 的用户不能再被标记为 error
+    assert not update_appointment_status(1, "error")
+    assert _row(sqlite_db, 1)[0] == "booked"
+
+    assert transition_appointment_status(2, "waiting", "error")
+    assert not transition_appointment_status(99, "waiting", "booked")
+
+
+def test_claim_specific_profile_respects_other_leases(sqlite_db):
+    from db.utils import claim_profile, claim_waiting_profile
+
+    assert claim_waiting_profile("other", lease_seconds=60).id == 1
+    assert not claim_profile(1, "me", lease_seconds=60)
+    assert claim_profile(3, "me", lease_seconds=60)
+    assert claim_profile(3, "me", lease_seconds=60)
+    assert claim_waiting_profile("third", lease_seconds=60).id == 2
+
+
+def test_queue_is_served_by_urgency(sqlite_db):
+    from sqlalchemy import text
+
+    from db.utils import claim_waiting_profile, get_all_waiting_profiles, get_first_waiting_profile
+
+    with sqlite_db.begin() as connection:
+        connection.execute(text("update appointment_profiles set permit_expires_at = '2025-03-01' where id = 3"))
+        connection.execute(text("update appointment_profiles set priority = 1 where id = 2"))
+
+    assert [p.id for p in get_all_waiting_profiles()] == [2, 3, 1]
+    assert get_first_waiting_profile().id == 2
+    assert [claim_waiting_profile(f"w{i}", lease_seconds=60).id for i in range(3)] == [2, 3, 1]
+
+
+def test_missing_profile_columns_reports_unmigrated_schema(sqlite_db):
+    from sqlalchemy import create_engine, text
+
+    from db.utils import missing_profile_columns
+
+    assert missing_profile_columns() == {}
+
+    legacy = create_engine("sqlite://")
+    with legacy.begin() as connection:
+        connection.execute(text("create table appointment_profiles (id integer primary key, appointment_status text)"))
+    assert missing_profile_columns(legacy)["ddl_profile_leases.sql"] == ["claimed_by", "lease_expires_at"]
+    assert missing_profile_columns(legacy)["ddl_profile_preferences.sql"] == ["earliest_date", "latest_date", "priority"]
+
+
+def test_heartbeat_db_error_is_not_a_lost_lease(sqlite_db, monkeypatch):
+    import db.utils
+    from superc import config, profile_loader
+
+    monkeypatch.setattr(config, "ENABLE_PROFILE_LEASES", True)
+    monkeypatch.setattr(profile_loader, "_worker_id", "worker")
+    monkeypatch.setattr(profile_loader, "_current_profile_id", 1)
+    monkeypatch.setattr(profile_loader, "_last_heartbeat", 0.0)
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("server closed the connection unexpectedly")
+
+    monkeypatch.setattr(db.utils, "heartbeat_lease", unavailable)
+    assert profile_loader.renew_current_lease()
+    assert profile_loader._last_heartbeat == 0.0  # 下一轮立即重试
+
+    monkeypatch.setattr(db.utils, "heartbeat_lease", lambda *args: False)
+    assert not profile_loader.renew_current_lease()
@@ -0,0 +1,53 @@
+"""
+PYTHONPATH=. pytest tests/test_deadline.py
+"""
+
+import time
+
+import httpx
+import pytest
+
+from superc.utils import deadline
+
+
+def _client(seen):
+    def handler(request):
+        seen.append(request.extensions["timeout"])
+        return httpx.Response(200)
+
+    return httpx.Client(transport=httpx.MockTransport(handler), timeout=30.0,
+                        event_hooks={"request": [deadline.on_request]})
+
+
+def test_requests_use_phase_limits_clamped_to_remaining_budget():
+    seen = []
+    with _client(seen) as session:
+        session.get("https://example.invalid/")
+        with deadline.budget("test cycle", 5.0):
+            with deadline.budget("test step", 60.0, connect=2.0, read=10.0):
+                session.get("https://example.invalid/")
+
+    # 没有预算时使用 session 默认超时；嵌套预算不超过外层剩余的 5 秒
+    assert seen[0] == {"connect": 30.0, "read": 30.0, "write": 30.0, "pool": 30.0}
+    assert seen[1]["connect"] == 2.0
+    assert 4.5 < seen[1]["read"] <= 5.0
+
+
+def test_step_budget_read_from_config(monkeypatch):
+    monkeypatch.setattr(deadline.config, "STEP_BUDGETS", {"Schritt 9": {"total": 7, "connect": 1, "read": 3}})
+    with deadline.budget("Schritt 9") as d:
+        assert d.budget == 7 and deadline.request_timeout().read == 3
+        assert 6.5 < deadline.remaining_seconds() <= 7
+    assert deadline.remaining_seconds() is None
+
+
+def test_exhausted_budget_raises_timeout_and_records_overrun():
+    seen = []
+    with _client(seen) as session, deadline.budget("test overrun", 0.01):
+        time.sleep(0.02)
+        with pytest.raises(httpx.TimeoutException):
+            session.get("https://example.invalid/")
+    assert seen == []
+
+    stats = deadline.deadline_stats()["test overrun"]
+    assert stats["runs"] == 1 and stats["overruns"] == 1 and stats["max_overrun_seconds"] > 0
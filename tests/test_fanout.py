@@ -0,0 +1,104 @@
+"""
+PYTHONPATH=. pytest tests/test_fanout.py
+"""
+
+import threading
+from datetime import date, datetime
+
+from superc.fanout import FanOutBooker
+from superc.profile import Profile
+
+
+def _profile(name):
+    return Profile(name, "Test", f"{name.lower()}@example.com", "0151", 1, 1, 1990)
+
+
+def _slots(*hours):
+    return [{"form_data": {"date": "20251211"}, "datetime": datetime(2025, 12, 11, hour, 0)} for hour in hours]
+
+
+def test_fanout_assigns_free_slots_by_constraints_and_skips_lost_claims():
+    profiles = [(1, _profile("A")), (2, _profile("B")), (3, _profile("C"))]
+    profiles[0][1].earliest_date = date(2025, 12, 12)  # 不接受这批时间
+    booked = []
+
+    def book(location_config, profile, slot_dt):
+        booked.append((profile.vorname, slot_dt.hour))
+        return True, "Schritt 6 完成: 预约已完成，等待邮件确认", slot_dt
+
+    fanout = FanOutBooker({"name": "superc"}, candidates=lambda: profiles, claim=lambda db_id: db_id != 3, book=book)
+    fanout.on_slots(_slots(10, 8, 9, 9), datetime(2025, 12, 11, 8, 0))
+    results = fanout.results(timeout=5)
+
+    assert [db_id for db_id, _, _ in results] == [2]
+    assert booked == [("B", 9)]
+
+
+def test_fanout_books_other_profiles_concurrently():
+    claimed = []
+    started = threading.Barrier(2, timeout=5)
+
+    def book(location_config, profile, slot_dt):
+        started.wait()  # 两个预约同时进行才能通过
+        return True, "Schritt 6 完成: 预约已完成，等待邮件确认", slot_dt
+
+    candidates = [(1, _profile("A")), (2, _profile("B"))]
+    fanout = FanOutBooker({"name": "superc"}, candidates=lambda: candidates,
+                          claim=lambda db_id: claimed.append(db_id) or True, max_profiles=3, book=book)
+    fanout.on_slots(_slots(8, 9, 10), datetime(2025, 12, 11, 8, 0))
+    results = fanout.results(timeout=5)
+
+    assert claimed == [1, 2]
+    assert [(db_id, result[2].hour) for db_id, _, result in results] == [(1, 9), (2, 10)]
+
+
+def test_fanout_skips_single_slot_and_reports_failures():
+    candidates = lambda: [(1, _profile("A"))]
+    fanout = FanOutBooker({"name": "superc"}, candidates=candidates, claim=lambda db_id: True)
+    fanout.on_slots(_slots(8), datetime(2025, 12, 11, 8, 0))
+    assert fanout.results() == []
+
+    def book(location_config, profile, slot_dt):
+        raise RuntimeError("timeout")
+
+    fanout = FanOutBooker({"name": "superc"}, candidates=candidates, claim=lambda db_id: True, book=book)
+    fanout.on_slots(_slots(8, 9), datetime(2025, 12, 11, 8, 0))
+    [(db_id, _, (has_appointment, message, appointment_dt))] = fanout.results(timeout=5)
+    assert db_id == 1 and not has_appointment and appointment_dt is None
+
+
+def test_fanout_is_capped_by_request_budget():
+    candidates = [(1, _profile("A")), (2, _profile("B")), (3, _profile("C"))]
+    book = lambda location_config, profile, slot_dt: (True, "Schritt 6 完成: 预约已完成，等待邮件确认", slot_dt)
+
+    fanout = FanOutBooker({"name": "superc"}, candidates=lambda: candidates, claim=lambda db_id: True,
+                          book=book, budget=lambda: 1)
+    fanout.on_slots(_slots(8, 9, 10, 11), datetime(2025, 12, 11, 8, 0))
+    assert [db_id for db_id, _, _ in fanout.results(timeout=5)] == [1]
+
+    claimed = []
+    fanout = FanOutBooker({"name": "superc"}, candidates=lambda: candidates,
+                          claim=lambda db_id: claimed.append(db_id) or True, book=book, budget=lambda: 0)
+    fanout.on_slots(_slots(8, 9, 10, 11), datetime(2025, 12, 11, 8, 0))
+    assert fanout.results(timeout=5) == [] and claimed == []
+
+
+def test_blocked_fanout_account_is_handled_like_current_profile(monkeypatch):
+    from superc import runner
+
+    handled, released, finished = [], [], []
+
+    class _Results:
+        def results(self):
+            return [
+                (1, _profile("A"), (False, "zu vieler Terminanfragen", None)),
+                (2, _profile("B"), (False, "Schritt 4 失败: 没有可用时间", None)),
+            ]
+
+    monkeypatch.setattr(runner, "_handle_result",
+                        lambda message, dt, profile, db_profile: handled.append(db_profile) or "zu vieler" in message)
+    monkeypatch.setattr(runner, "finish_additional_profile", finished.append)
+    monkeypatch.setattr(runner, "release_additional_profile", released.append)
+
+    runner._settle_fanout(_Results())
+    assert handled == [1, 2] and finished == [1] and released == [2]
@@ -0,0 +1,80 @@
+"""
+PYTHONPATH=. pytest tests/test_flight_recorder.py
+"""
+
+import json
+import os
+import threading
+
+import httpx
+
+from superc.utils.flight_recorder import FlightRecorder, current_cycle
+
+
+def _client_for(cycle):
+    def handler(request):
+        if request.url.path.endswith(".php"):
+            return httpx.Response(200, content=b"\x89PNG...", headers={"content-type": "image/png"})
+        return httpx.Response(200, text="<h1>Schritt 4</h1>", headers={"content-type": "text/html"})
+
+    return httpx.Client(transport=httpx.MockTransport(handler), event_hooks={"response": [cycle.on_response]})
+
+
+def test_ring_buffer_keeps_last_cycles_and_memory_cap(tmp_path):
+    recorder = FlightRecorder(max_cycles=3, max_bytes=10_000, max_body_bytes=100, dump_dir=str(tmp_path))
+
+    for i in range(5):
+        cycle = recorder.begin_cycle("superc")
+        cycle.record_page(f"page_{i}", "x" * 500)
+        recorder.end_cycle(cycle)
+
+    cycles = recorder.cycles
+    assert [c.cycle_id for c in cycles] == [2, 3, 4]
+    assert all(c.entries[0].truncated and c.size == 100 for c in cycles)
+
+    small = FlightRecorder(max_cycles=10, max_bytes=250, max_body_bytes=100, dump_dir=str(tmp_path))
+    for i in range(5):
+        cycle = small.begin_cycle("superc")
+        cycle.record_page("page", "y" * 100)
+        small.end_cycle(cycle)
+    assert small.total_bytes <= 250
+
+
+def test_dump_writes_http_exchanges_and_pages(tmp_path):
+    recorder = FlightRecorder(max_cycles=3, max_bytes=1_000_000, max_body_bytes=10_000, dump_dir=str(tmp_path))
+
+    cycle = recorder.begin_cycle("superc")
+    assert current_cycle() is cycle
+    with _client_for(cycle) as client:
+        client.post("https://example.test/auslaenderamt/location", data={"loc": "1"})
+        client.get("https://example.test/securimage_show.php")
+    cycle.record_page("5_term_selected", "<h1>Schritt 5</h1>")
+    recorder.end_cycle(cycle, outcome="superC server error")
+    assert current_cycle() is None
+
+    path = recorder.dump("schritt5_server_error")
+
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    entries = manifest["cycles"][0]["entries"]
+    assert manifest["cycles"][0]["outcome"] == "superC server error"
+    assert [e["kind"] for e in entries] == ["http", "http", "page"]
+    assert entries[0]["request_body"] == "loc=1"
+    assert entries[1]["file"].endswith(".png")
+    assert recorder.cycles == []
+    assert recorder.dump("again") is None
+
+
+def test_outcome_stays_on_its_cycle_when_fanout_cycles_start_later(tmp_path):
+    recorder = FlightRecorder(max_cycles=5, max_bytes=1_000_000, max_body_bytes=10_000, dump_dir=str(tmp_path))
+
+    main = recorder.begin_cycle("superc")
+    # 并行预约在工作线程中开始自己的轮次，晚于当前用户的轮次
+    worker = threading.Thread(target=lambda: recorder.end_cycle(recorder.begin_cycle("superc"), outcome="fanout"))
+    worker.start()
+    worker.join()
+    recorder.end_cycle(main, outcome="superC server error")
+
+    with open(os.path.join(recorder.dump("schritt5_server_error"), "manifest.json"), encoding="utf-8") as f:
+        outcomes = [cycle["outcome"] for cycle in json.load(f)["cycles"]]
+    assert outcomes == ["superC server error", "fanout"]
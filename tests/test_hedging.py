@@ -0,0 +1,92 @@
+"""
+PYTHONPATH=. pytest tests/test_hedging.py
+"""
+
+import threading
+import time
+
+import httpx
+
+from superc.utils.hedging import Hedger
+
+
+class _SlowTransport(httpx.BaseTransport):
+    """第 n 个请求等待 delays[n] 秒后返回；connecting=True 时等待发生在建立连接阶段（服务器还没收到请求）"""
+
+    def __init__(self, delays, connecting=False):
+        self._delays = iter(delays)
+        self.connecting = connecting
+        self.received = []
+        self._lock = threading.Lock()
+
+    def handle_request(self, request):
+        with self._lock:
+            delay = next(self._delays)
+        trace = request.extensions.get("trace")
+        if self.connecting and trace:
+            trace("connection.connect_tcp.started", {})
+        time.sleep(delay)
+        if trace:
+            trace("http11.send_request_headers.started", {})
+        with self._lock:
+            self.received.append(delay)
+        return httpx.Response(200, text=str(delay))
+
+
+def _hedger(**kwargs):
+    hedger = Hedger(min_samples=3, min_delay=0.05, **kwargs)
+    for _ in range(3):
+        hedger.record("Schritt 4", 0.05)
+        hedger.record("Schritt 5", 0.05)
+    return hedger
+
+
+def test_idempotent_request_is_hedged_and_first_response_wins():
+    transport = _SlowTransport([1.0, 0.0, 1.0, 0.0])
+    hedger = _hedger(max_ratio=0.1)
+    with httpx.Client(transport=transport) as session:
+        started = time.monotonic()
+        response = hedger.request(session, "POST", "https://example.invalid/location", "Schritt 4", idempotent=True)
+        assert response.text == "0.0" and time.monotonic() - started < 0.5
+
+        # 预算用完（10% 上限）后不再对冲，等原请求返回
+        assert hedger.request(session, "POST", "https://example.invalid/location", "Schritt 4", idempotent=True).text == "1.0"
+
+    stats = hedger.stats()["Schritt 4"]
+    assert (stats["requests"], stats["hedged"], stats["hedge_won"], stats["over_budget"]) == (2, 1, 1, 1)
+    assert stats["hedge_rate"] == 0.5 and stats["win_rate"] == 1.0
+
+
+def test_non_idempotent_request_already_sent_is_not_hedged():
+    transport = _SlowTransport([0.3, 0.0])
+    hedger = _hedger()
+    with httpx.Client(transport=transport) as session:
+        response = hedger.request(session, "POST", "https://example.invalid/suggest", "Schritt 5", idempotent=False)
+
+    assert response.text == "0.3"
+    assert transport.received == [0.3]
+    assert hedger.stats()["Schritt 5"]["unsafe"] == 1
+
+
+def test_non_idempotent_request_stuck_connecting_reaches_server_once():
+    transport = _SlowTransport([0.5, 0.0], connecting=True)
+    hedger = _hedger()
+    with httpx.Client(transport=transport) as session:
+        response = hedger.request(session, "POST", "https://example.invalid/suggest", "Schritt 5", idempotent=False)
+        hedger._executor.shutdown(wait=True)
+
+    assert response.text == "0.0"
+    # 原请求连接建立后发现副本已经发出，在发送前中止
+    assert transport.received == [0.0]
+    assert hedger.stats()["Schritt 5"]["hedge_won"] == 1
+
+
+def test_no_hedging_until_enough_samples():
+    hedger = Hedger(min_samples=3, min_delay=0.1)
+    assert hedger.delay("Schritt 4") is None
+    with httpx.Client(transport=_SlowTransport([0.0])) as session:
+        hedger.request(session, "GET", "https://example.invalid/", "Schritt 4", idempotent=True)
+    assert hedger.stats()["Schritt 4"]["hedged"] == 0
+    for seconds in (0.2, 0.4):
+        hedger.record("Schritt 4", seconds)
+    assert hedger.delay("Schritt 4") == 0.4
@@ -0,0 +1,28 @@
+"""
+PYTHONPATH=. pytest tests/test_imports.py
+"""
+
+import os
+import subprocess
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_runner_import_is_lazy_and_does_not_need_openai_key():
+    """import superc.runner 不应加载 openai / SQLAlchemy，也不要求设置 OPENAI_KEY"""
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_KEY"}
+    code = (
+        "import sys, superc.runner, superc.utils.gpt_call; "
+        "print(sorted(m for m in ('openai', 'sqlalchemy') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=project_root, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_run_check_is_still_exported_from_package():
+    from superc import run_check
+    from superc.appointment_checker import run_check as direct
+
+    assert run_check is direct
@@ -0,0 +1,58 @@
+"""
+PYTHONPATH=. pytest tests/test_log_archive.py
+"""
+
+from datetime import datetime
+
+from superc.utils.log_archive import classify_message, load_index, pack_log, parse_line, query_archive
+
+
+SAMPLE_LOG = """nohup: ignoring input
+2025-08-07 09:51:17,583 - INFO - Schritt 4 结果: 当前没有可用预约时间
+2025-08-07 09:52:20,100 - INFO - Schritt 4: 发现可用预约时间
+2025-08-07 09:52:20,200 - INFO - Schritt 4: 找到可用时间: Mittwoch, 22.10.2025 15:30, 选择profile: Max
+2025-08-14 10:00:01,000 - INFO - schritt4 - Schritt 4 page: 当前没有可用预约时间
+2025-08-14 10:01:02,000 - INFO - schritt4 - 发现可用预约时间
+2025-08-14 10:01:02,500 - ERROR - main - 检查过程中发生未预料的错误: boom
+Traceback (most recent call last):
+  File "runner.py", line 1, in run
+2025-08-14 10:02:00,000 - ERROR - Schritt 5 - 预约失败: zu vieler Terminanfragen
+"""
+
+
+def test_parse_line_handles_old_and_new_formats():
+    old = parse_line("2025-08-07 09:52:20,100 - INFO - Schritt 4: 发现可用预约时间")
+    assert old is not None
+    assert old.schritt == "Schritt 4"
+    assert old.event == "slot_found"
+
+    new = parse_line("2025-08-14 10:01:02,000 - INFO - schritt4 - 发现可用预约时间")
+    assert new is not None
+    assert new.schritt == "Schritt 4"
+    assert new.message == "发现可用预约时间"
+
+    assert parse_line("  File \"runner.py\", line 1, in run") is None
+
+
+def test_classify_message_variants():
+    assert classify_message("Schritt 4 结果: 当前没有可用预约时间") == "no_slot"
+    assert classify_message("可用预约时间 Mittwoch, 29.10.2025 16:00") == "slot_time"
+    assert classify_message("预约失败: zu vieler Terminanfragen") == "rate_limited"
+    assert classify_message("启动 SupaC 预约检查程序") is None
+
+
+def test_pack_and_query_only_matching_blocks(tmp_path):
+    source = tmp_path / "superc.log"
+    source.write_text(SAMPLE_LOG, encoding="utf-8")
+
+    archive = pack_log(str(source), out_dir=str(tmp_path / "archive"), block_lines=3)
+    index = load_index(archive)
+    assert len(index["blocks"]) >= 2
+    assert all("nohup" not in b["schritte"] for b in index["blocks"])
+
+    found = list(query_archive(archive, since=datetime(2025, 8, 10), schritt="Schritt 4", event="slot_found"))
+    assert [e.timestamp for e in found] == [datetime(2025, 8, 14, 10, 1, 2)]
+
+    errors = list(query_archive(archive, level="ERROR"))
+    assert len(errors) == 2
+    assert "Traceback" in errors[0].message
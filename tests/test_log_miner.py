@@ -0,0 +1,89 @@
+"""
+PYTHONPATH=. pytest tests/test_log_miner.py
+"""
+
+import math
+from datetime import datetime, timedelta
+
+from superc.utils.log_miner import import_logs, mine_logs
+from superc.utils.slot_history import SlotHistory, Sighting
+
+
+OLD_FORMAT = """nohup: ignoring input
+2025-06-23 10:59:19,215 - INFO - 当前进程PID: 511954
+2025-06-23 10:59:21,381 - INFO - 查询完成，当前没有可用预约时间
+2025-06-23 11:00:21,381 - INFO - 发现可用预约时间
+2025-06-23 11:00:21,400 - INFO - 页面内容已保存到: data/pages/superc/step_4_term_available.html
+2025-06-23 11:01:30,000 - ERROR - 检测到错误: 提交过于频繁，请稍后再试 (关键词: zu vieler Terminanfragen)
+"""
+
+NEW_FORMAT = """2025-08-07 09:55:30,100 - INFO - Schritt 4 - Schritt 4 结果: 当前没有可用预约时间
+2025-08-07 09:56:30,903 - INFO - Schritt 4 - Schritt 4: 发现可用预约时间
+2025-08-07 09:56:30,920 - INFO - Schritt 4 - Schritt 4: 找到可用时间: Mittwoch, 15.10.2025 16:00, 选择profile: zheng tan
+2025-08-07 09:56:30,921 - INFO - Schritt 4 - 可用预约时间 Mittwoch, 15.10.2025 09:30
+2025-08-07 09:56:31,000 - ERROR - Schritt 5 - Schritt 5 POST请求超时
+Traceback (most recent call last):
+  File "x.py", line 1, in <module>
+2025-08-07 10:06:30,000 - INFO - heartbeat - 心跳汇总: 600s 内 3 次相同结果已折叠 (Schritt 4 page: 当前没有可用预约时间)，单轮耗时 min/avg/max = 1.00/1.50/2.00s
+2025-08-07 10:07:00,000 - INFO - Schritt 6 - 已更新用户 A B 的状态为 'booked'，预约时间: Mittwoch, 15.10.2025 16:00
+"""
+
+
+def _write_logs(tmp_path):
+    paths = []
+    # 轮转文件的文件名顺序和时间顺序不一致
+    for name, text in (("superc.log", NEW_FORMAT), ("superc.log.bak", OLD_FORMAT), ("superc.log.2", "")):
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def test_mines_old_and_new_formats_into_sightings(tmp_path):
+    sightings = mine_logs(_write_logs(tmp_path))
+
+    assert [(s.timestamp.strftime("%m-%d %H:%M:%S"), s.outcome, s.slot_count) for s in sightings] == [
+        ("06-23 10:59:21", "no_slot", 0),
+        ("06-23 11:00:21", "slots", 1),
+        ("06-23 11:01:30", "rate_limited", 0),
+        ("08-07 09:55:30", "no_slot", 0),
+        ("08-07 09:56:30", "slots", 2),
+        # 心跳汇总展开为 3 次轮询，均匀分布在 600s 窗口内
+        ("08-07 09:59:50", "no_slot", 0),
+        ("08-07 10:03:10", "no_slot", 0),
+        ("08-07 10:06:30", "no_slot", 0),
+    ]
+    # 旧格式只有 "发现可用预约时间"，没有具体时间
+    assert sightings[1].earliest_slot is None and math.isnan(sightings[1].latency)
+    assert sightings[4].earliest_slot == datetime(2025, 10, 15, 9, 30)
+    assert [s.latency for s in sightings[5:]] == [1.5] * 3
+
+
+def test_import_merges_before_live_records_and_is_idempotent(tmp_path):
+    paths = _write_logs(tmp_path)
+    store = SlotHistory(str(tmp_path / "history"))
+    store.append(Sighting(datetime(2025, 9, 1, 7, 0), "superc", "no_slot", latency=0.5))
+
+    assert import_logs(paths, store) == 8
+    assert import_logs(paths, store) == 0
+
+    stored = list(store.read("superc"))
+    assert len(stored) == 9 and stored[-1].timestamp == datetime(2025, 9, 1, 7, 0)
+    assert [s.timestamp for s in stored] == sorted(s.timestamp for s in stored)
+    assert sum(map(sum, store.heatmap("superc").releases)) == 2
+
+
+def test_merge_skips_sightings_in_time_ranges_covered_by_live_records(tmp_path):
+    store = SlotHistory(str(tmp_path))
+    live = datetime(2025, 9, 1, 10, 0)
+    store.append_many([Sighting(live + timedelta(minutes=m), "superc", "no_slot", latency=0.5) for m in range(31)])
+
+    mined = [
+        Sighting(live + timedelta(minutes=10, seconds=30), "superc", "no_slot"),  # 心跳展开的时间和实时记录对不上
+        Sighting(live + timedelta(minutes=30, seconds=40), "superc", "no_slot"),  # 最后一条实时记录之后 40s
+        Sighting(live - timedelta(hours=1), "superc", "no_slot"),
+        Sighting(live + timedelta(hours=1), "superc", "slots", 2),
+    ]
+    assert store.merge("superc", mined) == 2
+    assert store.merge("superc", mined) == 0
+    assert len(list(store.read("superc"))) == 33
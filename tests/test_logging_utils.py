@@ -0,0 +1,73 @@
+"""
+PYTHONPATH=. pytest tests/test_logging_utils.py
+"""
+
+import logging
+
+from superc.utils.logging_utils import HeartbeatAggregator
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_logger(name, aggregator, handlers):
+    logger = logging.getLogger(name)
+    logger.handlers = []
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    for handler in handlers:
+        logger.addHandler(handler)
+        aggregator.attach(handler)
+    return logger
+
+
+def test_repeated_heartbeats_are_collapsed_and_flushed_before_state_change():
+    clock = _FakeClock()
+    aggregator = HeartbeatAggregator(interval=600, markers=("当前没有可用预约时间",), clock=clock)
+    handler = _ListHandler()
+    logger = _make_logger("test.heartbeat.collapse", aggregator, [handler])
+
+    for i in range(5):
+        clock.now += 60
+        logger.info("Schritt 4 page: 当前没有可用预约时间", extra={"cycle_seconds": 1.0 + i})
+    logger.info("发现可用预约时间")
+
+    assert handler.messages[0] == "Schritt 4 page: 当前没有可用预约时间"
+    assert handler.messages[1].startswith("心跳汇总")
+    assert "4 次" in handler.messages[1]
+    assert "2.00/3.50/5.00" in handler.messages[1]
+    assert handler.messages[2] == "发现可用预约时间"
+    assert len(handler.messages) == 3
+
+
+def test_periodic_summary_and_errors_pass_immediately():
+    clock = _FakeClock()
+    aggregator = HeartbeatAggregator(interval=300, markers=("当前没有可用预约时间",), clock=clock)
+    console, mirror = _ListHandler(), _ListHandler()
+    logger = _make_logger("test.heartbeat.periodic", aggregator, [console, mirror])
+
+    for _ in range(12):
+        clock.now += 60
+        logger.info("当前没有可用预约时间")
+
+    summaries = [m for m in console.messages if m.startswith("心跳汇总")]
+    assert len(summaries) == 2
+    assert console.messages == mirror.messages
+
+    logger.error("预约失败: zu vieler Terminanfragen")
+    assert console.messages[-1] == "预约失败: zu vieler Terminanfragen"
+    assert console.messages[-2].startswith("心跳汇总")
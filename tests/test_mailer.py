@@ -0,0 +1,102 @@
+"""
+PYTHONPATH=. pytest tests/test_mailer.py
+"""
+
+import smtplib
+import threading
+from email.mime.text import MIMEText
+
+from superc.email.mailer import SmtpConfig, SmtpMailer, resolve_encryption_mode
+
+CONFIG = SmtpConfig(
+    server="smtp.example.com", port=465, user="bot", password="secret",
+    sender="bot@example.com", encryption_mode="SSL", timeout=1.0,
+)
+
+
+class _FakeConnection:
+    def __init__(self, log, fail_first_send=False):
+        self.log = log
+        self.fail_first_send = fail_first_send
+        self.closed = False
+
+    def send_message(self, message):
+        if self.fail_first_send:
+            self.fail_first_send = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.log.append(("send", id(self), message["To"]))
+
+    def noop(self):
+        return 250, b"OK"
+
+    def quit(self):
+        self.closed = True
+
+
+def _message(to):
+    message = MIMEText("hello", "plain", "utf-8")
+    message["To"] = to
+    return message
+
+
+def test_messages_reuse_one_connection():
+    log, connections = [], []
+
+    def factory(config):
+        connection = _FakeConnection(log)
+        connections.append(connection)
+        return connection
+
+    mailer = SmtpMailer(CONFIG, connection_factory=factory)
+    futures = [mailer.submit(_message(f"user{i}@example.com")) for i in range(5)]
+    assert all(f.result(timeout=5) for f in futures)
+    assert mailer.send(_message("last@example.com"))
+    mailer.close()
+
+    assert len(connections) == 1
+    assert [to for _, _, to in log] == [f"user{i}@example.com" for i in range(5)] + ["last@example.com"]
+    assert connections[0].closed
+
+
+def test_reconnects_when_server_drops_connection():
+    log, connections = [], []
+
+    def factory(config):
+        connection = _FakeConnection(log, fail_first_send=not connections)
+        connections.append(connection)
+        return connection
+
+    mailer = SmtpMailer(CONFIG, connection_factory=factory)
+    assert mailer.send(_message("a@example.com"))
+    assert mailer.send(_message("b@example.com"))
+    mailer.close()
+
+    assert len(connections) == 2
+    assert [to for _, _, to in log] == ["a@example.com", "b@example.com"]
+
+
+def test_queued_burst_is_sent_as_batches():
+    log = []
+    gate = threading.Event()
+
+    def factory(config):
+        gate.wait(5)  # 第一次建连期间让消息在队列中堆积
+        return _FakeConnection(log)
+
+    mailer = SmtpMailer(CONFIG, connection_factory=factory, batch_size=3)
+    sizes = []
+    original = mailer._send_batch
+    mailer._send_batch = lambda batch: (sizes.append(len(batch)), original(batch))
+
+    futures = [mailer.submit(_message(f"u{i}@example.com")) for i in range(7)]
+    gate.set()
+    assert all(f.result(timeout=5) for f in futures)
+    mailer.close()
+    assert sum(sizes) == 7 and max(sizes) <= 3 and len(sizes) < 7
+
+
+def test_resolve_encryption_mode():
+    assert resolve_encryption_mode("", 465) == "SSL"
+    assert resolve_encryption_mode("", 587) == "STARTTLS"
+    assert resolve_encryption_mode("tls", 25) == "STARTTLS"
+    assert resolve_encryption_mode("plaintext", 25) == "NONE"
@@ -0,0 +1,58 @@
+"""
+PYTHONPATH=. pytest tests/test_matching.py
+"""
+
+import time
+from datetime import date, datetime, timedelta
+
+from superc.matching import Slot, SlotMatcher
+from superc.profile import Profile
+
+
+def _profile(name, locations="superc", earliest=None, latest=None, priority=0):
+    return Profile(name, "Test", f"{name}@example.com", "0151", 1, 1, 1990,
+                   preferred_locations=locations, earliest_date=earliest, latest_date=latest, priority=priority)
+
+
+def _slots(location, *days):
+    return [Slot(datetime(2025, 12, day, 9, 0), location) for day in days]
+
+
+def test_take_best_respects_location_and_date_window():
+    matcher = SlotMatcher(_slots("superc", 1, 5, 10) + _slots("infostelle", 3), cutoff=None)
+
+    assert matcher.take_best(_profile("a", earliest=date(2025, 12, 2))).datetime.day == 5
+    assert matcher.take_best(_profile("b", locations="superc, infostelle")).datetime.day == 1
+    assert matcher.take_best(_profile("c", locations="infostelle", latest=date(2025, 12, 2))) is None
+    # latest_date 当天包含在内
+    assert matcher.take_best(_profile("d", locations="infostelle", latest=date(2025, 12, 3))).location == "infostelle"
+    assert matcher.free_count == 1
+
+
+def test_global_cutoff_is_exclusive():
+    matcher = SlotMatcher(_slots("superc", 1, 5), cutoff=date(2025, 12, 5))
+    assert matcher.take_best(_profile("a", earliest=date(2025, 12, 2))) is None
+    assert matcher.take_best(_profile("b")).datetime.day == 1
+
+
+def test_assign_orders_by_priority_then_queue_and_skips_reserved():
+    matcher = SlotMatcher(_slots("superc", 1, 2, 3), cutoff=None)
+    assert matcher.reserve("superc", datetime(2025, 12, 1, 9, 0))
+    candidates = [(1, _profile("a")), (2, _profile("b", priority=5)), (3, _profile("c")), (4, _profile("d"))]
+
+    assignments = matcher.assign(candidates)
+    assert [(a.key, a.slot.datetime.day) for a in assignments] == [(2, 2), (1, 3)]
+
+
+def test_matching_hundreds_of_users_is_fast():
+    start = datetime(2025, 12, 1, 8, 0)
+    slots = [Slot(start + timedelta(minutes=15 * i), "superc") for i in range(200)]
+    candidates = [(i, _profile(str(i), earliest=date(2025, 12, 1 + i % 3), priority=i % 4)) for i in range(500)]
+
+    began = time.perf_counter()
+    assignments = SlotMatcher(slots, cutoff=None).assign(candidates)
+    elapsed = time.perf_counter() - began
+
+    assert len(assignments) == 200
+    assert len({a.slot.datetime for a in assignments}) == 200
+    assert elapsed < 0.05
@@ -0,0 +1,60 @@
+"""
+PYTHONPATH=. pytest tests/test_notify_email.py
+"""
+
+import os
+import shutil
+
+import pytest
+
+from superc.email import notify_email
+
+
+@pytest.fixture
+def asset_dir(tmp_path, monkeypatch):
+    """把模板和图片复制到临时目录，避免修改仓库中的文件"""
+    for filename in ("email_template.html", "email_update_required.html", "wechat.png", "code.jpg"):
+        shutil.copy(os.path.join(notify_email.ASSET_DIR, filename), tmp_path / filename)
+    monkeypatch.setattr(notify_email, "ASSET_DIR", str(tmp_path))
+    monkeypatch.setattr(notify_email, "_asset_cache", {})
+    return tmp_path
+
+
+def _bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_template_is_cached_until_file_changes(asset_dir, monkeypatch):
+    reads = []
+    original = notify_email._read_text
+    monkeypatch.setattr(notify_email, "_read_text", lambda path: reads.append(path) or original(path))
+
+    info = {"name": "Max", "appointment_datetime": "2025-01-01 09:00", "location": "SuperC"}
+    _, first = notify_email.get_email_content(info)
+    notify_email.get_email_content(info)
+    assert len(reads) == 1
+    assert "Max" in first
+
+    template = asset_dir / "email_template.html"
+    template.write_text("<p>Neu: {name} {appointment_datetime} {location}</p>", encoding="utf-8")
+    _bump_mtime(template)
+    _, changed = notify_email.get_email_content(info)
+    assert changed == "<p>Neu: Max 2025-01-01 09:00 SuperC</p>"
+    assert len(reads) == 2
+
+
+def test_inline_images_are_encoded_once_and_shared(asset_dir, monkeypatch):
+    encodes = []
+    original = notify_email._encode_image
+    monkeypatch.setattr(notify_email, "_encode_image", lambda path: encodes.append(path) or original(path))
+
+    first = notify_email._build_base_message("s", "a@example.com", "bot@example.com", "<p>x</p>")
+    second = notify_email._build_base_message("s", "b@example.com", "bot@example.com", "<p>y</p>")
+
+    first_images, second_images = first.get_payload()[1:], second.get_payload()[1:]
+    assert [part["Content-ID"] for part in first_images] == ["<wechat_qr>", "<code_img>"]
+    assert len(encodes) == 2
+    assert first_images[0] is not second_images[0]
+    assert first_images[0].get_payload() is second_images[0].get_payload()
+    assert first_images[1].get_payload(decode=True) == (asset_dir / "code.jpg").read_bytes()
@@ -0,0 +1,116 @@
+"""
+PYTHONPATH=. pytest tests/test_outbox.py
+"""
+
+from datetime import datetime
+
+from superc.outbox import DEAD, DONE, PENDING, Outbox
+
+
+def _recording_handlers(calls, failures=None):
+    failures = failures if failures is not None else {}
+
+    def make(kind):
+        def handler(payload):
+            calls.append((kind, payload.get("db_id")))
+            if failures.get(kind, 0) > 0:
+                failures[kind] -= 1
+                raise RuntimeError("smtp down")
+            return True
+        return handler
+
+    return {kind: make(kind) for kind in ("mark_booked", "booking_email", "mark_error", "update_notice_email")}
+
+
+def test_enqueue_is_idempotent_and_db_updates_go_first(tmp_path):
+    calls = []
+    outbox = Outbox(path=str(tmp_path / "outbox.sqlite3"), handlers=_recording_handlers(calls))
+
+    booked_at = datetime(2025, 3, 4, 9, 30)
+    outbox.enqueue_booking_success("a@example.com", "A B", 7, booked_at)
+    outbox.enqueue_booking_success("a@example.com", "A B", 7, booked_at)
+    outbox.enqueue_account_blocked("c@example.com", "C D", 8)
+    assert outbox.counts() == {PENDING: 4}
+
+    assert outbox.deliver_due() == 4
+    assert [kind for kind, _ in calls] == ["mark_booked", "mark_error", "booking_email", "update_notice_email"]
+    assert outbox.counts() == {DONE: 4}
+
+    # 已投递的条目不会因为重复 enqueue 再次投递
+    outbox.enqueue_booking_success("a@example.com", "A B", 7, booked_at)
+    assert outbox.deliver_due() == 0
+
+
+def test_failed_delivery_is_retried_with_backoff_and_survives_restart(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    calls = []
+    outbox = Outbox(path=path, handlers=_recording_handlers(calls, {"booking_email": 1}), retry_base_seconds=0)
+    outbox.enqueue_booking_success("a@example.com", "A B", 7, None)
+
+    outbox.deliver_due()
+    assert outbox.counts() == {DONE: 1, PENDING: 1}
+
+    # 进程重启后由新实例继续投递
+    restarted = Outbox(path=path, handlers=_recording_handlers(calls), retry_base_seconds=0)
+    assert restarted.deliver_due() == 1
+    assert restarted.counts() == {DONE: 2}
+    assert [kind for kind, _ in calls] == ["mark_booked", "booking_email", "booking_email"]
+
+
+def test_item_is_given_up_after_max_attempts(tmp_path):
+    calls = []
+    outbox = Outbox(
+        path=str(tmp_path / "outbox.sqlite3"),
+        handlers=_recording_handlers(calls, {"mark_error": 10}),
+        max_attempts=3,
+        retry_base_seconds=0,
+    )
+    outbox.enqueue("mark_error", {"db_id": 1, "full_name": "X"}, "error:1:mark")
+
+    for _ in range(5):
+        outbox.deliver_due()
+    assert len(calls) == 3
+    assert outbox.counts() == {DEAD: 1}
+
+
+def test_status_update_for_finished_profile_is_not_retried(tmp_path):
+    from superc.outbox import _status_update
+
+    calls = []
+
+    def mark_booked(payload):
+        calls.append(payload["db_id"])
+        return _status_update(False, payload)
+
+    outbox = Outbox(path=str(tmp_path / "outbox.sqlite3"), handlers={"mark_booked": mark_booked}, retry_base_seconds=0)
+    outbox.enqueue("mark_booked", {"db_id": 5}, "booked:5:mark")
+    for _ in range(3):
+        outbox.deliver_due()
+    assert calls == [5] and outbox.counts() == {DEAD: 1}
+
+    # None 表示数据库暂时出错，按退避重试
+    assert _status_update(None, {"db_id": 5}) is False
+    assert _status_update(True, {"db_id": 5}) is True
+
+
+def test_leases_are_kept_until_status_is_written(tmp_path):
+    renewed, failures = [], {"mark_booked": 2}
+    outbox = Outbox(
+        path=str(tmp_path / "outbox.sqlite3"),
+        handlers=_recording_handlers([], failures),
+        retry_base_seconds=0,
+        lease_keeper=lambda profile_id: renewed.append(profile_id) or True,
+    )
+    outbox.enqueue_booking_success("a@example.com", "A B", 7, None)
+    outbox.enqueue_account_blocked("c@example.com", "C D", 8)
+    outbox.enqueue_booking_success("local@example.com", "L M", None, None)
+    assert outbox.pending_profile_ids() == [7, 8]
+
+    outbox.deliver_due()
+    assert outbox.pending_profile_ids() == [7]
+    assert outbox.renew_leases() == 1 and renewed == [7]
+
+    outbox.deliver_due()
+    outbox.deliver_due()
+    assert outbox.pending_profile_ids() == []
+    assert outbox.renew_leases() == 0 and renewed == [7]
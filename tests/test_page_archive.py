@@ -0,0 +1,73 @@
+"""
+PYTHONPATH=. pytest tests/test_page_archive.py
+"""
+
+import os
+import time
+
+from superc.utils.page_archive import PageArchiver
+
+
+def test_duplicate_pages_are_stored_once(tmp_path):
+    archiver = PageArchiver(base_dir=str(tmp_path), max_bytes=10 * 1024 * 1024, max_age_days=30)
+
+    assert archiver.submit("<html>Schritt 4</html>", "4_term_available", "superc")
+    assert archiver.submit("<html>Schritt 4</html>", "4_term_available", "superc")
+    assert archiver.submit("<html>Schritt 5</html>", "5_term_selected", "superc")
+    assert archiver.flush(timeout=5)
+
+    index = archiver.read_index("superc")
+    assert [e["step"] for e in index] == ["4_term_available", "4_term_available", "5_term_selected"]
+    assert index[0]["sha256"] == index[1]["sha256"]
+    assert [e["new"] for e in index] == [True, False, True]
+    assert archiver.read_snapshot("superc", index[2]["sha256"]) == "<html>Schritt 5</html>"
+
+    objects = [f for _, _, files in os.walk(tmp_path / "superc" / "objects") for f in files]
+    assert len(objects) == 2
+
+
+def test_retention_drops_oldest_snapshots(tmp_path):
+    archiver = PageArchiver(base_dir=str(tmp_path), max_bytes=10 * 1024 * 1024, max_age_days=1)
+
+    archiver.submit("old page", "4_term_available", "superc")
+    archiver.submit("new page", "4_term_available", "superc")
+    archiver.flush(timeout=5)
+
+    old_entry, new_entry = archiver.read_index("superc")
+    old_path = archiver._object_path("superc", old_entry["sha256"])
+    two_days_ago = time.time() - 2 * 86400
+    os.utime(old_path, (two_days_ago, two_days_ago))
+
+    assert archiver.enforce_retention("superc") == 1
+    assert [e["sha256"] for e in archiver.read_index("superc")] == [new_entry["sha256"]]
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    archiver = PageArchiver(base_dir=str(tmp_path), queue_size=1)
+    archiver._ensure_started = lambda: None  # 不启动工作线程，模拟写盘跟不上
+
+    assert archiver.submit("a", "step", "superc")
+    assert not archiver.submit("b", "step", "superc")
+
+
+def test_expired_snapshots_are_pruned_at_start_and_periodically(tmp_path):
+    seeding = PageArchiver(base_dir=str(tmp_path), max_bytes=10 * 1024 * 1024, max_age_days=1)
+    seeding.submit("old page", "4_term_available", "superc")
+    seeding.flush(timeout=5)
+    old_path = seeding._object_path("superc", seeding.read_index("superc")[0]["sha256"])
+    two_days_ago = time.time() - 2 * 86400
+    os.utime(old_path, (two_days_ago, two_days_ago))
+
+    # 新进程的归档线程启动时清理，即使总大小远低于上限
+    archiver = PageArchiver(base_dir=str(tmp_path), max_bytes=10 * 1024 * 1024, max_age_days=1, retention_every=2)
+    archiver.submit("page 1", "4_term_available", "superc")
+    archiver.flush(timeout=5)
+    assert not os.path.exists(old_path)
+
+    path_1 = archiver._object_path("superc", archiver.read_index("superc")[0]["sha256"])
+    os.utime(path_1, (two_days_ago, two_days_ago))
+    archiver.submit("page 2", "4_term_available", "superc")
+    archiver.flush(timeout=5)
+    # 每 retention_every 次写入清理一次
+    assert not os.path.exists(path_1)
+    assert len(archiver.read_index("superc")) == 1
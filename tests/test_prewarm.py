@@ -0,0 +1,58 @@
+"""
+PYTHONPATH=. pytest tests/test_prewarm.py
+"""
+
+from datetime import datetime, timedelta
+
+from superc.prewarm import Prewarmer, learned_release_times, next_release_instant, parse_release_times
+
+
+def test_next_release_instant_wraps_to_next_day():
+    minutes = parse_release_times(["08:00", "07:00", "bad"])
+    assert minutes == [420, 480]
+    assert next_release_instant(datetime(2025, 3, 4, 7, 30), minutes) == datetime(2025, 3, 4, 8, 0)
+    assert next_release_instant(datetime(2025, 3, 4, 8, 0), minutes) == datetime(2025, 3, 5, 7, 0)
+    assert next_release_instant(datetime(2025, 3, 4, 8, 0), []) is None
+
+
+class _FakeClock:
+    def __init__(self, start):
+        self.now = start
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += timedelta(seconds=seconds)
+
+
+def _prewarmer(clock, warmed):
+    prewarmer = Prewarmer({"selection_text": "Super C"}, release_times=["07:00"], lead_seconds=45,
+                          now=lambda: clock.now, sleep=clock.sleep)
+    prewarmer.warm = lambda release_at: warmed.append((clock.now, release_at)) or "warm"
+    return prewarmer
+
+
+def test_sleeps_normally_when_release_is_far_away():
+    clock, warmed = _FakeClock(datetime(2025, 3, 4, 6, 0)), []
+    assert _prewarmer(clock, warmed).sleep_until_next_poll(60) is None
+    assert clock.sleeps == [60] and warmed == []
+
+
+def test_warms_at_lead_time_and_wakes_at_release():
+    clock, warmed = _FakeClock(datetime(2025, 3, 4, 6, 58, 30)), []
+    assert _prewarmer(clock, warmed).sleep_until_next_poll(60) == "warm"
+    assert warmed == [(datetime(2025, 3, 4, 6, 59, 15), datetime(2025, 3, 4, 7, 0))]
+    assert clock.now == datetime(2025, 3, 4, 7, 0)
+
+
+def test_learned_release_times_count_first_sighting_only(tmp_path):
+    lines = []
+    for day in range(1, 5):
+        for minute, message in ((58, "当前没有可用预约时间"), (0, "发现可用预约时间"), (1, "发现可用预约时间")):
+            hour = 6 if minute == 58 else 7
+            lines.append(f"2025-03-0{day} {hour:02d}:{minute:02d}:05,000 - INFO - Schritt 4 - {message}")
+    log_path = tmp_path / "superc.log"
+    log_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    assert learned_release_times(str(log_path), min_count=3) == [420]
+    assert learned_release_times(str(tmp_path / "missing.log")) == []
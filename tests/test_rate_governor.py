@@ -0,0 +1,87 @@
+"""
+PYTHONPATH=. pytest tests/test_rate_governor.py
+"""
+
+import httpx
+
+from superc import config
+from superc.utils.rate_governor import RateGovernor
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _governor(tmp_path, clock, **kwargs):
+    limits = {"per_minute": 60, "burst": 3, "booking_burst": 2}
+    limits.update(kwargs)
+    return RateGovernor(state_dir=str(tmp_path), clock=clock, sleep=clock.sleep, **limits)
+
+
+def test_polls_cannot_use_booking_reserve(tmp_path):
+    clock = _FakeClock()
+    governor = _governor(tmp_path, clock)
+
+    assert [governor.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # 查询额度用完，预约提交仍可立即使用预留的令牌
+    assert governor.acquire(booking=True) == 0.0
+    assert governor.acquire(booking=True) == 0.0
+    # 之后按 1 个/秒补充
+    assert governor.acquire(booking=True) == 1.0
+    assert governor.acquire() > 0
+
+
+def test_bucket_is_shared_between_workers(tmp_path):
+    clock = _FakeClock()
+    first, second = _governor(tmp_path, clock), _governor(tmp_path, clock)
+
+    for _ in range(3):
+        first.acquire()
+    assert second.acquire() == 1.0
+    assert second.stats() == {"acquired": 1, "waited_seconds": 1.0}
+
+
+def test_penalize_blocks_every_worker(tmp_path):
+    clock = _FakeClock()
+    first, second = _governor(tmp_path, clock), _governor(tmp_path, clock)
+
+    first.penalize(120)
+    assert second.acquire(booking=True) >= 120
+
+
+def test_hook_only_limits_termin_site(tmp_path):
+    clock = _FakeClock()
+    governor = _governor(tmp_path, clock, burst=1, booking_burst=0)
+
+    governor.on_request(httpx.Request("GET", "https://api.openai.com/v1/models"))
+    governor.on_request(httpx.Request("GET", config.BASE_URL + "select2?md=1"))
+    assert governor.acquired == 1
+
+
+def test_fanout_requests_count_as_booking_and_available_does_not_consume(tmp_path):
+    from superc.utils.rate_governor import booking_requests
+
+    clock = _FakeClock()
+    governor = _governor(tmp_path, clock)
+    request = httpx.Request("GET", config.BASE_URL + "select2?md=1")
+
+    for _ in range(3):
+        governor.on_request(request)
+    assert governor.available() == 0 and governor.available(booking=True) == 2
+
+    # 并行预约的 Schritt 2-4 请求可以使用预留的令牌
+    with booking_requests():
+        governor.on_request(request)
+    assert governor.waited_seconds == 0.0 and governor.available(booking=True) == 1
+
+    governor.penalize(60)
+    assert governor.available(booking=True) == 0
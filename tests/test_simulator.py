@@ -0,0 +1,89 @@
+"""
+PYTHONPATH=. pytest tests/test_simulator.py
+"""
+
+from superc.simulator import BotModel, RunnerModel, SiteModel, Simulation, VirtualClock
+
+
+def test_clock_runs_events_in_order_while_sleeping():
+    clock, seen = VirtualClock(), []
+    clock.schedule(5.0, seen.append, "b")
+    clock.schedule(2.0, seen.append, "a")
+    clock.schedule(2.0, lambda: clock.schedule(3.0, seen.append, "nested"))
+
+    clock.sleep(4.0)
+    assert seen == ["a", "nested"] and clock.now == 4.0
+    clock.sleep(1.0)
+    assert seen == ["a", "nested", "b"]
+
+
+def test_same_seed_is_reproducible_and_shares_the_release_process():
+    first = Simulation(seed=3).run(20)
+    assert first == Simulation(seed=3).run(20)
+    # 不同的 runner 参数面对相同的放号
+    slower = Simulation(RunnerModel(poll_interval=300), seed=3).run(20)
+    assert slower.released == first.released and slower.polls < first.polls
+
+
+def test_idle_polling_follows_poll_interval_and_auto_exit_hour():
+    quiet = SiteModel(release_probability=0, cancellations_per_day=0)
+    result = Simulation(site=quiet).run(10)
+    # 每天 23 小时在线（AUTO_EXIT_HOUR 这一小时退出），每轮 = 轮询间隔 + Schritt 2-4 用时
+    expected = 10 * 23 * 3600 / 62.2
+    assert abs(result.polls - expected) / expected < 0.01
+    assert result.requests == 4 * result.polls and result.booked == 0
+
+
+def test_without_competition_every_slot_is_booked():
+    site = SiteModel(human_take_seconds=1e9)
+    runner = RunnerModel(captcha_accuracy=1.0)
+    simulation = Simulation(runner, BotModel(count=0), site, seed=1)
+
+    result = simulation.run(30)
+    assert result.released > 0
+    assert result.booked == result.released - simulation.site.open_slots
+    assert result.captcha_errors == 0 and result.prewarmed == 60
+
+
+def test_competition_and_captcha_errors_lower_success_rate():
+    bots = BotModel(count=3, poll_interval_seconds=60)
+    alone = Simulation(bots=BotModel(count=0), seed=2).run(120)
+    crowded = Simulation(bots=bots, seed=2).run(120)
+    sloppy = Simulation(RunnerModel(captcha_accuracy=0.3), bots, seed=2).run(120)
+
+    assert alone.success_rate > crowded.success_rate > sloppy.success_rate
+    assert crowded.taken_by_bots > 0 and sloppy.captcha_errors > crowded.captcha_errors
+
+
+def test_governor_keeps_runner_under_site_rate_limit():
+    site = SiteModel(rate_limit_requests=15, slots_per_release=6, human_take_seconds=1e9)
+    bots = BotModel(count=0)
+
+    # 默认令牌桶容量 20，放号后连续预约多个用户时超过网站每分钟 15 次的限制
+    default = Simulation(bots=bots, site=site, seed=4).run(30)
+    assert default.rate_limited > 0
+
+    tight = RunnerModel(rate_limits={"per_minute": 5, "burst": 3, "booking_burst": 3})
+    governed = Simulation(tight, bots, site, seed=4).run(30)
+    assert governed.rate_limited == 0 and governed.booked > 0
+    assert governed.governor_wait_seconds > 0
+
+
+def test_runner_decisions_are_shared_with_the_real_runner():
+    from superc.runner import ACTION_ACCOUNT_BLOCKED, ACTION_RETRY, ACTION_WAIT, next_action
+
+    # Schritt 2-4 被限速时真实 runner 只是等待下一轮，不切换用户
+    blocked_queries = SiteModel(rate_limit_requests=2, release_probability=0, cancellations_per_day=0)
+    roomy = RunnerModel(profiles=1, rate_limits={"per_minute": 1000, "burst": 100, "booking_burst": 10})
+    result = Simulation(roomy, BotModel(count=0), blocked_queries).run(1)
+    assert result.rate_limited > 100 and result.polls == 0
+    assert next_action(False, "Schritt 4 失败: zu vieler Terminanfragen") == ACTION_WAIT
+    assert next_action(True, "预约失败: zu vieler Terminanfragen") == ACTION_ACCOUNT_BLOCKED
+    assert next_action(True, "填写表单失败: 验证码错误") == ACTION_RETRY
+
+
+def test_server_error_waits_one_poll_interval():
+    site = SiteModel(server_error_probability=1.0, human_take_seconds=1e9)
+    result = Simulation(RunnerModel(captcha_accuracy=1.0), BotModel(count=0), site, seed=1).run(5)
+    assert result.released > 0 and result.booked == 0
+    assert result.server_errors > 0 and result.unexpected == 0
@@ -0,0 +1,71 @@
+"""
+PYTHONPATH=. pytest tests/test_slot_history.py
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from superc.utils.slot_history import SlotHistory, Sighting
+
+
+MONDAY = datetime(2025, 12, 8, 6, 58)
+
+
+def _polls(outcomes, start=MONDAY):
+    """每分钟一次轮询，outcomes 中的数字为可用时间数，None 为出错"""
+    sightings = []
+    for minute, count in enumerate(outcomes):
+        at = start + timedelta(minutes=minute)
+        if count is None:
+            sightings.append(Sighting(at, "superc", "error", latency=30.0))
+        elif count:
+            sightings.append(Sighting(at, "superc", "slots", count, datetime(2025, 12, 11, 8, 30), 0.8))
+        else:
+            sightings.append(Sighting(at, "superc", "no_slot", latency=0.5))
+    return sightings
+
+
+def test_append_and_read_round_trip(tmp_path):
+    store = SlotHistory(str(tmp_path))
+    assert list(store.read("superc")) == []
+
+    store.append_many(_polls([0, 3]))
+    store.append(Sighting(MONDAY + timedelta(minutes=5), "infostelle", "rate_limited"))
+
+    polls = list(store.read("superc"))
+    assert [(p.timestamp, p.outcome, p.slot_count, p.earliest_slot) for p in polls] == [
+        (MONDAY, "no_slot", 0, None),
+        (MONDAY + timedelta(minutes=1), "slots", 3, datetime(2025, 12, 11, 8, 30)),
+    ]
+    assert abs(polls[1].latency - 0.8) < 1e-6
+    assert [p.outcome for p in store.read("superc", since=MONDAY + timedelta(seconds=30))] == ["slots"]
+    assert [p.outcome for p in store.read("infostelle")] == ["rate_limited"]
+
+
+def test_torn_write_is_repaired_on_next_append(tmp_path):
+    store = SlotHistory(str(tmp_path))
+    store.append_many(_polls([0, 0]))
+    # 模拟写到一半崩溃: timestamp 列多了半条记录
+    with open(os.path.join(str(tmp_path), "superc", "timestamp.col"), "ab") as f:
+        f.write(b"\x00\x01\x02")
+    assert len(list(store.read("superc"))) == 2
+
+    store.append_many(_polls([4], start=MONDAY + timedelta(minutes=2)))
+    assert [p.slot_count for p in store.read("superc")] == [0, 0, 4]
+
+
+def test_heatmap_counts_releases_by_weekday_and_hour(tmp_path):
+    store = SlotHistory(str(tmp_path))
+    # 周一 06:58 起: 两次没有 -> 07:00 放号 -> 出错 -> 仍有 -> 没有 -> 07:05 再次放号
+    store.append_many(_polls([0, 0, 2, None, 1, 0, 0, 3]))
+
+    heatmap = store.heatmap("superc")
+    assert heatmap.polls[0][6] == 2 and heatmap.polls[0][7] == 5  # 出错的轮询不计入
+    assert heatmap.slot_polls[0][7] == 3
+    assert heatmap.releases[0][7] == 2 and sum(map(sum, heatmap.releases)) == 2
+    assert heatmap.rate(0, 7) == 3 / 5
+    assert heatmap.format().splitlines()[1].startswith("Mo")
+
+    # 时间范围只影响统计的时段，放号判断仍然参考范围之前的轮询
+    since = store.heatmap("superc", since=MONDAY + timedelta(minutes=2))
+    assert since.releases[0][7] == 2 and since.polls[0][6] == 0
@@ -0,0 +1,78 @@
+"""
+PYTHONPATH=. pytest tests/test_slot_tracker.py
+"""
+
+import re
+from datetime import datetime
+from pathlib import Path
+
+from superc.utils.appointment_selector import parse_all_appointments
+from superc.utils.slot_tracker import SlotTracker, refresh_form_data, suggest_fingerprint
+
+
+PAGE = Path(__file__).resolve().parent.parent / "data/debugPage/step_4_term_available_20251003_152049.html"
+
+
+def _counting_tracker():
+    calls = []
+
+    def parse(text):
+        calls.append(1)
+        return parse_all_appointments(text)
+
+    return SlotTracker(parse=parse), calls
+
+
+def _without_first_slot(html):
+    """去掉 08:30 的表单，模拟这个时间被别人约走"""
+    start = html.index('<form method="post" class="suggestion_form"')
+    return html[:start] + html[html.index("</form>", start) + len("</form>"):]
+
+
+def test_fingerprint_ignores_per_request_checksums():
+    html = PAGE.read_text(encoding="utf-8")
+    reissued = re.sub(r'name="checksum" value="[0-9a-f]+"', 'name="checksum" value="0000"', html)
+
+    assert suggest_fingerprint(html) is not None
+    assert suggest_fingerprint(reissued) == suggest_fingerprint(html)
+    assert suggest_fingerprint(_without_first_slot(html)) != suggest_fingerprint(html)
+    assert suggest_fingerprint("<html>Kein freier Termin verfügbar</html>") is None
+
+
+def test_unchanged_page_is_not_reparsed_and_diff_tracks_changes():
+    html = PAGE.read_text(encoding="utf-8")
+    tracker, calls = _counting_tracker()
+    events = []
+    tracker.add_listener(lambda location, diff: events.append((location, diff.new, diff.vanished)))
+
+    first = tracker.observe("superc", html)
+    assert first.parsed and len(first.diff.new) == len(first.appointments) == 8
+
+    second = tracker.observe("superc", html)
+    assert not second.parsed and calls == [1]
+    assert not second.diff.changed and second.diff.unchanged == first.diff.new
+
+    third = tracker.observe("superc", _without_first_slot(html))
+    assert third.parsed and third.diff.vanished == [datetime(2025, 12, 11, 8, 30)] and len(third.diff.unchanged) == 7
+
+    tracker.observe_empty("superc")
+    again = tracker.observe("superc", html)
+    assert again.parsed and len(again.diff.new) == 8
+
+    assert [(len(new), len(vanished)) for _, new, vanished in events] == [(8, 0), (0, 1), (0, 7), (8, 0)]
+    # 不同地点分开记录
+    assert tracker.observe("infostelle", html).diff.new == first.diff.new
+
+
+def test_refresh_form_data_takes_new_checksum_of_the_same_slot():
+    html = PAGE.read_text(encoding="utf-8")
+    cached = parse_all_appointments(html)[1]["form_data"]
+    reissued = re.sub(r'name="checksum" value="[0-9a-f]+"', 'name="checksum" value="0000"', html, count=1)
+    reissued = re.sub(r'(name="checksum" value=")9e27d8e5[0-9a-f]+"', r'\1abcd"', reissued)
+
+    refreshed = refresh_form_data(reissued, cached)
+    assert refreshed == dict(cached, checksum="abcd")
+    assert refreshed == parse_all_appointments(reissued)[1]["form_data"]
+
+    # 这个时间的表单已不在页面中
+    assert refresh_form_data(html, dict(cached, start="9999")) is None